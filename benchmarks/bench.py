@@ -0,0 +1,281 @@
+'''
+Benchmarks
+==========
+
+Times the annotation hot paths on synthetic annotations at production scale: editing, nearest line
+queries, removal, writing and loading in SarcomereLines, the LineArray and analysis code, and the
+Picture drawing path.
+
+The drawing benchmarks run Kivy headless on its mock GL backend, so they measure the CPU cost of
+building and updating the drawing instructions, not the GPU.
+
+Each benchmark reports the best time per operation over a few repeats. The times are also taken relative
+to a calibration loop of plain python and numpy work run on the same machine (see calibrate), and it is
+these ratios that are stored as baselines, so baselines saved on one machine still hold on a faster or
+slower one. The ratios are compared with the stored baselines for the same scale and any that got
+slower by more than the tolerance are flagged, making the exit status 1. --save stores the results as
+the new baselines.
+
+    python benchmarks/bench.py                  # 10k lines, 1M points
+    python benchmarks/bench.py --scale small    # quick run
+    python benchmarks/bench.py --save
+'''
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+# kivy must be configured before it is first imported
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+os.environ.setdefault("KIVY_GL_BACKEND", "mock")
+os.environ.setdefault("KIVY_WINDOW", "sdl2")
+os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generators import Touch, random_lines, write_annotation  # noqa: E402
+from lineannotation.SarcomereLines import SarcomereLines  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SCALES = {
+    "full": {"n_lines": 10000, "points_per_line": 100},
+    "small": {"n_lines": 1000, "points_per_line": 20},
+}
+IMAGE_SIZE = (2048, 2048)
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """
+    register a benchmark. The function gets (lines, tmpdir) and returns (setup, run, n_ops): setup() makes
+    a fresh state for each repeat, run(state) is what is timed and n_ops the number of operations it does.
+    """
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return register
+
+
+def loaded(lines, tmpdir):
+    fname = os.path.join(tmpdir, "img.png.annot_txt")
+    if not os.path.exists(fname):
+        write_annotation(fname, lines, IMAGE_SIZE)
+    return fname
+
+
+def query_points(n, seed=1):
+    return [Touch(*p) for line in random_lines(n, 1, IMAGE_SIZE, seed=seed)[:-1] for p in line]
+
+
+@benchmark("SarcomereLines.add_point")
+def bench_add_point(lines, tmpdir):
+    def setup():
+        return SarcomereLines(os.path.join(tmpdir, "none.annot_txt"))
+
+    def run(sl):
+        for line in lines:
+            for p in line:
+                sl.add_point(Touch(*p))
+            sl.end_line()
+    return setup, run, sum(len(line) for line in lines)
+
+
+@benchmark("SarcomereLines.select_nearest_line")
+def bench_select_nearest(lines, tmpdir):
+    sl = SarcomereLines(loaded(lines, tmpdir))
+    queries = query_points(1000)
+
+    def run(state):
+        for q in queries:
+            sl.select_nearest_line(q)
+    return lambda: None, run, len(queries)
+
+
+@benchmark("SarcomereLines.remove_nearest")
+def bench_remove_nearest(lines, tmpdir):
+    fname = loaded(lines, tmpdir)
+    queries = query_points(100)
+
+    def run(sl):
+        for q in queries:
+            sl.remove_nearest(q, None)
+    return lambda: SarcomereLines(fname), run, len(queries)
+
+
+@benchmark("SarcomereLines.write_file")
+def bench_write_file(lines, tmpdir):
+    sl = SarcomereLines(loaded(lines, tmpdir))
+    out = os.path.join(tmpdir, "out.annot_txt")
+    return lambda: None, lambda state: sl.write_file(out, IMAGE_SIZE), 1
+
+
+@benchmark("SarcomereLines load")
+def bench_load(lines, tmpdir):
+    fname = loaded(lines, tmpdir)
+    return lambda: None, lambda state: SarcomereLines(fname), 1
+
+
+@benchmark("LineArray.nearest_line")
+def bench_array_nearest(lines, tmpdir):
+    from lineannotation.LineArray import LineArray
+    la = LineArray.from_lines(lines)
+    queries = query_points(20)
+
+    def run(state):
+        for q in queries:
+            la.nearest_line(q.pos)
+    return lambda: None, run, len(queries)
+
+
+@benchmark("SarcomereAnalysis.analyze")
+def bench_analyze(lines, tmpdir):
+    import numpy as np
+    from lineannotation.LineArray import LineArray
+    from lineannotation.SarcomereAnalysis import analyze
+    la = LineArray.from_lines(lines[:1000] + [[]])
+    image = np.random.default_rng(0).integers(0, 2 ** 16, IMAGE_SIZE[::-1]).astype(np.uint16)
+    return lambda: None, lambda state: analyze(image, la), 1
+
+
+def make_picture(lines, tmpdir):
+    import numpy as np
+    from PIL import Image
+    from kivy.core.window import Window  # noqa: F401, a window is needed for the graphics instructions
+    from lineannotation.Picture import Picture
+    image = os.path.join(tmpdir, "img.png")
+    if not os.path.exists(image):
+        Image.fromarray(np.zeros(IMAGE_SIZE[::-1], dtype=np.uint8)).save(image)
+    loaded(lines, tmpdir)
+    for ext in (".journal",):
+        if os.path.exists(image + ".annot_txt" + ext):
+            os.remove(image + ".annot_txt" + ext)
+    return Picture(source=image, size=IMAGE_SIZE, size_hint=(None, None), native_size=IMAGE_SIZE)
+
+
+@benchmark("Picture.draw")
+def bench_draw(lines, tmpdir):
+    picture = make_picture(lines, tmpdir)
+    picture.close()
+    return lambda: None, lambda state: picture.draw(), 1
+
+
+@benchmark("Picture.on_touch_down")
+def bench_touch(lines, tmpdir):
+    picture = make_picture(lines, tmpdir)
+    picture.writer.interval = 3600  # keep the writer thread out of the timing
+    queries = query_points(1000)
+
+    def run(state):
+        for q in queries:
+            picture.on_touch_down(q)
+        picture.end_line()
+    return lambda: None, run, len(queries)
+
+
+@benchmark("Picture.set_scale_factor")
+def bench_zoom(lines, tmpdir):
+    picture = make_picture(lines, tmpdir)
+    picture.close()
+    picture.update_view((0, 0, 512, 512))
+
+    def run(state):
+        for sf in (2.0, 4.0, 8.0, 1.0):
+            picture.set_scale_factor(sf)
+    return lambda: None, run, 4
+
+
+def calibrate(repeat):
+    """
+    time a fixed workload of dict updates, float arithmetic and a numpy sort, the unit the benchmarks are
+    measured in
+    :param repeat: repeats of the workload, the best is kept
+    :return: the time of the workload in seconds
+    """
+    import numpy as np
+    data = np.random.default_rng(0).random(2 ** 18)
+    best = float("inf")
+    for _ in range(max(repeat, 3)):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            sums = {}
+            for i in range(200000):
+                sums[i & 1023] = sums.get(i & 1023, 0.0) + i * 0.5
+            np.sort(data)
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best
+
+
+def run_benchmarks(scale, repeat, pattern):
+    """
+    :return: dict of the time of an operation of each benchmark run, in units of the calibration loop
+    """
+    unit = calibrate(repeat)
+    print("%-40s %12.3f ms" % ("calibration", 1e3 * unit))
+    lines = random_lines(size=IMAGE_SIZE, **SCALES[scale])
+    results = {}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name, func in BENCHMARKS:
+            if pattern and pattern not in name:
+                continue
+            setup, run, n_ops = func(lines, tmpdir)
+            best = float("inf")
+            for _ in range(repeat):
+                state = setup()
+                gc.collect()
+                gc.disable()  # like timeit, keep collections of earlier garbage out of the timing
+                try:
+                    start = time.perf_counter()
+                    run(state)
+                    best = min(best, time.perf_counter() - start)
+                finally:
+                    gc.enable()
+            results[name] = best / n_ops / unit
+            print("%-40s %12.3f us/op %12.3g x calibration" % (name, 1e6 * best / n_ops, results[name]))
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="time the annotation hot paths and compare with stored baselines")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="full", help="size of the synthetic annotation")
+    parser.add_argument("--repeat", type=int, default=3, help="repeats of each benchmark, the best is kept")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown factor flagged as a regression")
+    parser.add_argument("-k", "--filter", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baselines")
+    js_args = parser.parse_args()
+
+    results = run_benchmarks(js_args.scale, js_args.repeat, js_args.filter)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as fp:
+            baselines = json.load(fp)
+    if js_args.save:
+        baselines.setdefault(js_args.scale, {}).update(results)
+        with open(BASELINES, "w") as fp:
+            json.dump(baselines, fp, indent=2, sort_keys=True)
+        return 0
+
+    regressions = 0
+    for name, t in sorted(results.items()):
+        base = baselines.get(js_args.scale, {}).get(name)
+        if base and t > js_args.tolerance * base:
+            regressions += 1
+            print("REGRESSION %s: %.3g x calibration, baseline %.3g" % (name, t, base))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
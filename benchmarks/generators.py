@@ -0,0 +1,53 @@
+"""
+Synthetic annotations for the benchmarks.
+
+Lines are random walks across the image, the way myofibrils wander, so they have realistic
+local structure for the spatial index and the drawing code.
+"""
+import json
+import math
+from random import Random
+
+
+def random_lines(n_lines, points_per_line, size=(2048, 2048), step=20.0, seed=0):
+    """
+    make random walk polylines inside an image
+    :param n_lines: number of lines
+    :param points_per_line: number of points in each line
+    :param size: (width, height) of the image
+    :param step: distance between successive points of a line
+    :param seed: seed of the random generator so runs are repeatable
+    :return: list of lines of (x, y) tuples, ending with an empty line like SarcomereLines.lines
+    """
+    rng = Random(seed)
+    width, height = size
+    lines = []
+    for _ in range(n_lines):
+        x, y = rng.uniform(0, width), rng.uniform(0, height)
+        heading = rng.uniform(0, 2 * math.pi)
+        line = []
+        for _ in range(points_per_line):
+            line.append((x, y))
+            heading += rng.gauss(0, 0.3)
+            x = min(max(x + step * math.cos(heading), 0.0), width)
+            y = min(max(y + step * math.sin(heading), 0.0), height)
+        lines.append(line)
+    lines.append([])
+    return lines
+
+
+def write_annotation(fname, lines, size=(2048, 2048)):
+    """
+    write lines in the .annot_txt format
+    """
+    with open(fname, "w") as fp:
+        json.dump({"image_size": list(size), "lines": lines}, fp)
+
+
+class Touch(object):
+    """
+    stands in for a kivy touch, only pos is used
+    """
+
+    def __init__(self, x, y):
+        self.pos = (x, y)
@@ -0,0 +1,95 @@
+import os
+import struct
+
+import numpy as np
+
+from .AnnotationFile import parse_stack
+from .LineArray import LineArray
+
+CACHE_EXT = ".cache"
+MIN_CACHE_BYTES = 2 ** 20  # smaller annotation files parse quickly enough not to need a cache
+MAGIC = b"LANNOT01"
+HEADER = struct.Struct("<8s7q")  # magic, mtime_ns, size, journal_seq, width, height, n_lines, n_points
+
+
+def cache_name(fname):
+    """
+    :param fname: the .annot_txt file
+    :return: the name of its binary sidecar
+    """
+    return fname + CACHE_EXT
+
+
+def read_cache(fname):
+    """
+    map the sidecar of an annotation file if it is up to date with the file
+    :param fname: the .annot_txt file
+    :return: (LineArray, image_size, journal_seq) with the coordinates memory-mapped read only,
+    or None if there is no sidecar or the file changed since it was written
+    """
+    try:
+        st = os.stat(fname)
+        with open(cache_name(fname), 'rb') as fp:
+            header = fp.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) != HEADER.size:
+        return None
+    magic, mtime_ns, size, journal_seq, width, height, n_lines, n_points = HEADER.unpack(header)
+    if magic != MAGIC or mtime_ns != st.st_mtime_ns or size != st.st_size:
+        return None
+    try:
+        offsets = np.memmap(cache_name(fname), dtype=np.int64, mode='r', offset=HEADER.size, shape=(n_lines + 1,))
+        coords = np.memmap(cache_name(fname), dtype=np.float64, mode='r', offset=HEADER.size + 8 * (n_lines + 1),
+                           shape=(n_points, 2)) if n_points else np.empty((0, 2))
+    except (OSError, ValueError):  # truncated
+        return None
+    image_size = None if width < 0 else [width, height]
+    return LineArray.from_arrays(coords, offsets), image_size, journal_seq
+
+
+def write_cache(fname, la, image_size, journal_seq=0, st=None):
+    """
+    write the sidecar of an annotation file, it is keyed on the file's modification time and size.
+    :param fname: the .annot_txt file
+    :param la: LineArray holding the lines of the file
+    :param image_size: the image_size in the file header
+    :param journal_seq: the journal_seq in the file header
+    :param st: os.stat_result of the file the lines came from, by default the file is stat'ed now
+    """
+    st = os.stat(fname) if st is None else st
+    width, height = image_size if image_size is not None else (-1, -1)
+    tmp_name = cache_name(fname) + ".tmp"
+    with open(tmp_name, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, st.st_mtime_ns, st.st_size, journal_seq, int(width), int(height),
+                             la.n_lines, la.n_points))
+        fp.write(np.ascontiguousarray(la.offsets, dtype=np.int64).tobytes())
+        fp.write(np.ascontiguousarray(la.coords, dtype=np.float64).tobytes())
+    os.replace(tmp_name, cache_name(fname))
+
+
+def load_annotation(fname, min_cache_bytes=MIN_CACHE_BYTES, with_slices=False):
+    """
+    read an annotation file through its sidecar. When the sidecar is stale or missing the file is parsed
+    and, if it is large, the sidecar is regenerated for next time. The json file stays the reference,
+    the sidecar is only ever derived from it.
+    The sidecar only holds "lines", so none is made for the annotation of a stack with lines on other
+    slices and an up to date sidecar means the file has none.
+    :param fname: the .annot_txt file
+    :param min_cache_bytes: files smaller than this are parsed without making a sidecar
+    :param with_slices: also return the lines of the other slices of a stack
+    :return: (LineArray, image_size, journal_seq), followed by {z: lines} of the other slices if with_slices
+    """
+    cached = read_cache(fname)
+    if cached is not None:
+        return cached + ({},) if with_slices else cached
+    with open(fname, 'r') as fp:
+        st = os.fstat(fp.fileno())  # of the file actually parsed, even if it is replaced meanwhile
+        lines, image_size, journal_seq, slices = parse_stack(fp)
+    la = LineArray.from_lines(lines)
+    if st.st_size >= min_cache_bytes and not slices:
+        try:
+            write_cache(fname, la, image_size, journal_seq, st)
+        except OSError:  # a read only folder, carry on without the sidecar
+            pass
+    return (la, image_size, journal_seq, slices) if with_slices else (la, image_size, journal_seq)
@@ -0,0 +1,117 @@
+'''
+The .annot_txt annotation file format, a json object
+
+    {"image_size": [width, height], "lines": [[[x, y], ...], ...], "journal_seq": n}
+
+with the points of each line in native image coordinates, y up. journal_seq is only written by an editor
+keeping a journal (see SarcomereLines). The annotation of a z-stack (see ImageStack) holds the lines of
+slice 0 in "lines" and the lines of the other slices that have any in "slices": {"z": [line, ...], ...},
+so tools that only know "lines" read the first slice. The file sits next to its image, named after it with ANNOT_EXT
+appended.
+
+Like the rest of the core (SarcomereLines, LineArray, the analysis) this module doesn't use Kivy, so
+headless tools can read and write annotations without a display.
+'''
+import json
+import math
+import os
+
+ANNOT_EXT = ".annot_txt"
+LEGACY_FRAME = 2048  # the editor used to fit every image into a square widget this wide, times the zoom
+
+
+def annotation_name(image_fname):
+    """
+    :param image_fname: the image file
+    :return: the name of the image's annotation file
+    """
+    return image_fname + ANNOT_EXT
+
+
+def image_name(annotation):
+    """
+    :param annotation: an annotation file
+    :return: the image it annotates
+    """
+    return annotation[:-len(ANNOT_EXT)] if annotation.endswith(ANNOT_EXT) else annotation
+
+
+def read_annotation(fname):
+    """
+    read an annotation file
+    :param fname: the .annot_txt file
+    :return: (lines, image_size, journal_seq), image_size is None if the file has none
+    """
+    with open(fname, 'r') as fp:
+        return parse_annotation(fp)
+
+
+def parse_annotation(fp):
+    """
+    :param fp: an annotation file open for reading
+    :return: (lines, image_size, journal_seq) as read_annotation
+    """
+    return parse_stack(fp)[:3]
+
+
+def native_frame(image_size, native_size):
+    """
+    work out how the points of a file map onto the pixels of its image. The editor writes the size of the
+    image itself, so its points are native. Older files hold the size of the widget the image was fitted
+    into, keeping its aspect ratio and centred. That widget was LEGACY_FRAME wide and the size written was
+    its zoomed size, LEGACY_FRAME times a power of two, while the points were in the unzoomed widget.
+    :param image_size: the image_size in the file header, None if it has none
+    :param native_size: the (width, height) of the image in pixels
+    :return: (scale, (x, y)) so a point p of the file is (p - (x, y)) / scale in the image, None if the
+    points are native already
+    """
+    if not image_size or tuple(image_size) == tuple(native_size):
+        return None
+    frame_w, frame_h = image_size
+    if frame_w == frame_h and math.frexp(frame_w / LEGACY_FRAME)[0] == 0.5:
+        frame_w = frame_h = LEGACY_FRAME  # written at a zoom other than 1
+    width, height = native_size
+    scale = min(frame_w / width, frame_h / height)
+    return scale, ((frame_w - width * scale) / 2, (frame_h - height * scale) / 2)
+
+
+def parse_stack(fp):
+    """
+    :param fp: an annotation file open for reading
+    :return: (lines, image_size, journal_seq, slices), slices is {z: lines} of the slices after the first,
+    empty for the annotation of a single image
+    """
+    read_in = json.load(fp)
+    slices = {int(z): lines for z, lines in read_in.get("slices", {}).items()}
+    return read_in["lines"], read_in.get("image_size"), read_in.get("journal_seq", 0), slices
+
+
+def dumps_annotation(lines, image_size, journal_seq=None, slices=None):
+    """
+    :param lines: the lines, lists of (x, y) points
+    :param image_size: the (x,y) size of the local coordinate system used
+    :param journal_seq: the last journal record included, left out if None
+    :param slices: {z: lines} of the other slices of a stack, left out if empty
+    :return: the text of the annotation file
+    """
+    content = {"image_size": image_size, "lines": lines}
+    if journal_seq is not None:
+        content["journal_seq"] = journal_seq
+    if slices:
+        content["slices"] = {str(z): slices[z] for z in sorted(slices)}
+    return json.dumps(content)
+
+
+def write_atomic(fname, text):
+    """
+    write a file through a temporary file renamed over it, so a crash while writing never leaves a
+    truncated file behind.
+    :param fname: the file
+    :param text: the contents
+    """
+    tmp_name = fname + ".tmp"
+    with open(tmp_name, "w") as fp:
+        fp.write(text)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_name, fname)
@@ -0,0 +1,402 @@
+import math
+import os
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import chain
+
+from .AnnotationFile import ANNOT_EXT, annotation_name, dumps_annotation, image_name, parse_stack, write_atomic
+from .ImageReader import IMAGE_EXTS
+
+STORE_NAME = "annotations.sqlite"
+SCHEMA_VERSION = 2  # kept in PRAGMA user_version, 1 had no slices nor journal_seq
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,  -- the image, relative to the folder of the store
+    width INTEGER,
+    height INTEGER,
+    n_lines INTEGER NOT NULL,  -- lines with points, the editor keeps an empty line at the end
+    n_points INTEGER NOT NULL,
+    mtime_ns INTEGER,  -- of the annotation file the lines were read from or written to
+    journal_seq INTEGER  -- the last journal record included in the annotation file, NULL if it has none
+);
+CREATE TABLE IF NOT EXISTS lines (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    z INTEGER NOT NULL DEFAULT 0,  -- the slice of a z-stack, 0 for an image of a single plane
+    line INTEGER NOT NULL,  -- the index of the line in the slice in the annotation file
+    n_points INTEGER NOT NULL,
+    length REAL NOT NULL,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL,  -- the bounding box, NULL for an empty line
+    points BLOB NOT NULL,  -- x, y pairs of float64
+    PRIMARY KEY (image_id, z, line)
+);
+CREATE INDEX IF NOT EXISTS images_n_lines ON images(n_lines);
+CREATE INDEX IF NOT EXISTS lines_length ON lines(length);
+CREATE INDEX IF NOT EXISTS lines_box ON lines(x0, x1, y0, y1);
+"""
+
+# brings a store made before SCHEMA_VERSION 2 up to date, the primary key of lines can only change by
+# copying the table
+MIGRATE_1 = """
+ALTER TABLE images ADD COLUMN journal_seq INTEGER;
+ALTER TABLE lines RENAME TO lines_1;
+DROP INDEX IF EXISTS lines_length;
+DROP INDEX IF EXISTS lines_box;
+CREATE TABLE lines (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    z INTEGER NOT NULL DEFAULT 0,
+    line INTEGER NOT NULL,
+    n_points INTEGER NOT NULL,
+    length REAL NOT NULL,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL,
+    points BLOB NOT NULL,
+    PRIMARY KEY (image_id, z, line)
+);
+INSERT INTO lines SELECT image_id, 0, line, n_points, length, x0, y0, x1, y1, points FROM lines_1;
+DROP TABLE lines_1;
+"""
+
+
+class AnnotationStore(object):
+    """AnnotationStore
+
+    An SQLite database holding the annotations of a whole project folder, so questions across images,
+    like which images have fewer than 5 lines or which lines are longer than 50 px, are answered by an
+    indexed query instead of opening every annotation file.
+
+    There is a row per image in the images table and a row per line in the lines table, with the line's
+    length and bounding box as columns (see SCHEMA). Images are identified by their path relative to the
+    folder of the store, so the folder can be moved.
+
+    The .annot_txt files stay the reference, the store is filled from them by import_files and can write
+    them back with export. The modification time of each file is stored with its lines, so importing a
+    folder again only reads the files that changed, which makes the store a cache of the annotations of a
+    large folder as well (see line_store stats). The editor writes through to a store when given one (see
+    SarcomereLines.store).
+
+    The lines of every slice of a z-stack are stored, the z column tells them apart, and the journal_seq of
+    the file is kept so an exported file still tells the editor which journal records it holds.
+
+    Each change is a transaction of its own unless it is made inside a batch(), which makes the changes
+    within it a single transaction, much faster when many images are written. The store can be used from
+    several threads.
+    """
+
+    def __init__(self, fname):
+        """
+        Open the store, it is created if it doesn't exist
+        :param fname: the database file, or a folder to use its STORE_NAME
+        """
+        if os.path.isdir(fname):
+            fname = os.path.join(fname, STORE_NAME)
+        self.fname = fname
+        self.root = os.path.dirname(os.path.abspath(fname))
+        self.lock = threading.RLock()
+        self.depth = 0  # of the nested batches
+        self.db = sqlite3.connect(fname, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")  # readers aren't blocked by the editor writing
+        self.db.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, a crash can only lose the last commits
+        self.db.execute("PRAGMA foreign_keys=ON")
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        has_tables = self.db.execute("SELECT count(*) FROM sqlite_master WHERE name = 'images'").fetchone()[0]
+        if has_tables and version < 2:
+            self.db.execute("PRAGMA foreign_keys=OFF")  # the lines are copied over, not deleted with their image
+            self.db.executescript("BEGIN;" + MIGRATE_1 + "COMMIT;")
+            self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        self.db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def key(self, image):
+        """
+        :param image: the path of an image
+        :return: the path it is stored under
+        """
+        return os.path.relpath(os.path.abspath(image), self.root)
+
+    def path(self, key):
+        """
+        :param key: a path as stored
+        :return: the path of the image
+        """
+        return os.path.normpath(os.path.join(self.root, key))
+
+    @contextmanager
+    def batch(self):
+        """
+        make the changes within the with statement a single transaction, it is rolled back on an exception
+        """
+        with self.lock:
+            if self.depth == 0:
+                self.db.execute("BEGIN")
+            self.depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.db.execute("ROLLBACK")
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.db.execute("COMMIT")
+
+    def put(self, image, lines, image_size=None, mtime_ns=None, journal_seq=None, slices=None):
+        """
+        store the lines of an image, replacing any stored before
+        :param image: the path of the image
+        :param lines: the lines, lists of (x, y) points, of slice 0 for a z-stack
+        :param image_size: the (width, height) of the image
+        :param mtime_ns: the modification time of the annotation file the lines match
+        :param journal_seq: the journal_seq of the annotation file, None if it has none
+        :param slices: {z: lines} of the other slices of a z-stack
+        """
+        self.put_rows(image, stack_rows(lines, slices), image_size, mtime_ns, journal_seq)
+
+    def put_rows(self, image, rows, image_size=None, mtime_ns=None, journal_seq=None):
+        """
+        store the lines of an image as rows made by line_row, replacing any stored before
+        """
+        width, height = image_size if image_size else (None, None)
+        with self.batch():
+            db = self.db
+            db.execute("DELETE FROM images WHERE path = ?", (self.key(image),))
+            image_id = db.execute(
+                "INSERT INTO images (path, width, height, n_lines, n_points, mtime_ns, journal_seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.key(image), width, height, sum(1 for row in rows if row[2]), sum(row[2] for row in rows),
+                 mtime_ns, journal_seq)).lastrowid
+            db.executemany("INSERT INTO lines VALUES (%d, ?, ?, ?, ?, ?, ?, ?, ?, ?)" % image_id, rows)
+
+    def remove(self, image):
+        """
+        forget an image and its lines
+        :param image: the path of the image
+        """
+        with self.batch():
+            self.db.execute("DELETE FROM images WHERE path = ?", (self.key(image),))
+
+    def get(self, image):
+        """
+        :param image: the path of the image
+        :return: (lines, image_size, journal_seq, slices) like parse_stack, None if the image isn't stored.
+        journal_seq is None if the file had none.
+        """
+        with self.lock:
+            found = self.db.execute("SELECT id, width, height, journal_seq FROM images WHERE path = ?",
+                                    (self.key(image),)).fetchone()
+            if found is None:
+                return None
+            blobs = self.db.execute("SELECT z, points FROM lines WHERE image_id = ? ORDER BY z, line",
+                                    (found[0],)).fetchall()
+        image_size = None if found[1] is None else [found[1], found[2]]
+        slices = {}
+        for z, blob in blobs:
+            slices.setdefault(z, []).append(blob_points(blob))
+        return slices.pop(0, []), image_size, found[3], slices
+
+    def images(self):
+        """
+        :return: {image path: mtime_ns} of the images stored
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT path, mtime_ns FROM images").fetchall()
+        return {self.path(key): mtime_ns for key, mtime_ns in rows}
+
+    def query(self, sql, params=()):
+        """
+        run a query on the tables of SCHEMA, e.g.
+        "SELECT path FROM images WHERE n_lines < 5" or
+        "SELECT path, line FROM lines JOIN images ON images.id = image_id WHERE length > 50"
+        :param sql: the query
+        :param params: the values of its ? placeholders
+        :return: list of the rows found
+        """
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def images_with_fewer_lines(self, n):
+        """
+        :param n: the number of lines
+        :return: the paths of the stored images with fewer than n lines
+        """
+        return [self.path(key) for key, in self.query("SELECT path FROM images WHERE n_lines < ? ORDER BY path",
+                                                      (n,))]
+
+    def lines_longer_than(self, length):
+        """
+        :param length: the length in pixels
+        :return: list of (image path, line index, length) of the lines longer than length, the lines of
+        every slice of a z-stack are included, slice by slice
+        """
+        rows = self.query("SELECT path, line, length FROM lines JOIN images ON images.id = image_id "
+                          "WHERE length > ? ORDER BY path, z, line", (length,))
+        return [(self.path(key), line, line_length) for key, line, line_length in rows]
+
+    def import_files(self, annotations, batch_size=500, jobs=1):
+        """
+        store the lines of annotation files, files that haven't changed since they were stored are skipped
+        :param annotations: the .annot_txt files, or {file: mtime_ns} if their times are known
+        :param batch_size: the number of files written in a transaction
+        :param jobs: the number of processes reading the files
+        :return: the number of files stored
+        """
+        if not isinstance(annotations, dict):
+            annotations = {annotation: os.stat(annotation).st_mtime_ns for annotation in annotations}
+        stored = self.images()
+        changed = [annotation for annotation, mtime_ns in sorted(annotations.items())
+                   if stored.get(os.path.normpath(os.path.abspath(image_name(annotation)))) != mtime_ns]
+        pool = ProcessPoolExecutor(jobs) if jobs > 1 and len(changed) > batch_size else None
+        try:
+            # the workers read and measure the files while the rows of those done are written
+            parsed = iter(map(read_rows, changed) if pool is None else pool.map(read_rows, changed, chunksize=16))
+            for start in range(0, len(changed), batch_size):
+                with self.batch():
+                    for annotation in changed[start:start + batch_size]:
+                        rows, image_size, journal_seq = next(parsed)
+                        self.put_rows(image_name(annotation), rows, image_size, annotations[annotation], journal_seq)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return len(changed)
+
+    def import_folder(self, folder=None, batch_size=500, jobs=1, scanned=None):
+        """
+        bring the store up to date with the annotation files in a folder and the folders below it, the files
+        that changed are stored and the images whose annotation file is gone are forgotten
+        :param folder: the folder, by default the folder of the store
+        :param batch_size: the number of files written in a transaction
+        :param jobs: the number of processes reading the files
+        :param scanned: what scan_folder returned for the folder, if it was scanned already
+        :return: the number of files stored
+        """
+        folder = os.path.abspath(folder or self.root)
+        annotations, _ = scanned or scan_folder(folder)
+        found = {os.path.normpath(image_name(annotation)) for annotation in annotations}
+        below = os.path.join(folder, '')
+        with self.batch():
+            for image in self.images():
+                if image.startswith(below) and image not in found:
+                    self.remove(image)
+        return self.import_files(annotations, batch_size, jobs)
+
+    def image_totals(self):
+        """
+        :return: list of (image path, n_lines, n_points, length) of the images stored, length is the sum
+        of the lengths of its lines
+        """
+        rows = self.query("SELECT path, n_lines, n_points, "
+                          "(SELECT total(length) FROM lines WHERE image_id = images.id) FROM images")
+        return [(self.path(key), n_lines, n_points, length) for key, n_lines, n_points, length in rows]
+
+    def export(self, images=None):
+        """
+        write the stored lines of images to their annotation files
+        :param images: the paths of the images, by default every image stored
+        :return: the number of files written
+        """
+        images = sorted(self.images()) if images is None else images
+        for image in images:
+            found = self.get(image)
+            if found is None:
+                continue
+            lines, image_size, journal_seq, slices = found
+            annotation = annotation_name(image)
+            write_atomic(annotation, dumps_annotation(lines, image_size, journal_seq, slices))
+            with self.batch():
+                self.db.execute("UPDATE images SET mtime_ns = ? WHERE path = ?",
+                                (os.stat(annotation).st_mtime_ns, self.key(image)))
+        return len(images)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def line_row(i, line, z=0):
+    """
+    :param i: the index of the line
+    :param line: the points of the line
+    :param z: the slice of a z-stack the line is on
+    :return: the row of the line in the lines table, without the image_id
+    """
+    flat = array('d', chain.from_iterable(line))
+    if not line:
+        return z, i, 0, 0.0, None, None, None, None, flat.tobytes()
+    xs, ys = flat[0::2], flat[1::2]
+    length = sum(math.hypot(q[0] - p[0], q[1] - p[1]) for p, q in zip(line[:-1], line[1:]))
+    return z, i, len(line), length, min(xs), min(ys), max(xs), max(ys), flat.tobytes()
+
+
+def stack_rows(lines, slices=None):
+    """
+    :param lines: the lines of slice 0
+    :param slices: {z: lines} of the other slices of a z-stack
+    :return: the rows made by line_row of the lines of every slice
+    """
+    rows = [line_row(i, line) for i, line in enumerate(lines)]
+    for z in sorted(slices or {}):
+        rows.extend(line_row(i, line, z) for i, line in enumerate(slices[z]))
+    return rows
+
+
+def read_rows(annotation):
+    """
+    read an annotation file into rows of the lines table, runs in a worker process when importing
+    :param annotation: the .annot_txt file
+    :return: (list of the rows made by stack_rows, image_size, journal_seq)
+    """
+    with open(annotation, 'r') as fp:
+        lines, image_size, journal_seq, slices = parse_stack(fp)
+    return stack_rows(lines, slices), image_size, journal_seq
+
+
+def blob_points(blob):
+    """
+    :param blob: the points column of a line
+    :return: the points of the line as (x, y) tuples
+    """
+    flat = array('d')
+    flat.frombytes(blob)
+    return list(zip(flat[0::2], flat[1::2]))
+
+
+def scan_folder(folder, workers=16):
+    """
+    find the annotation files and images in a folder and the folders below it. The folders are listed by
+    a pool of threads, as on a network file system listing a folder mostly waits on the server.
+    :param folder: the folder searched
+    :param workers: the number of threads listing folders
+    :return: ({annotation file: mtime_ns}, sorted list of the image files)
+    """
+    annotations, images = {}, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(scan_dir, os.path.abspath(folder))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dirs, dir_annotations, dir_images = future.result()
+                annotations.update(dir_annotations)
+                images.extend(dir_images)
+                pending.update(pool.submit(scan_dir, path) for path in dirs)
+    return annotations, sorted(images)
+
+
+def scan_dir(path):
+    """
+    :param path: a folder
+    :return: (list of the folders in it, {annotation file: mtime_ns}, list of the image files)
+    """
+    dirs, annotations, images = [], {}, []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.path)
+            elif entry.name.endswith(ANNOT_EXT):
+                annotations[entry.path] = entry.stat().st_mtime_ns
+            elif entry.name.lower().endswith(IMAGE_EXTS):
+                images.append(entry.path)
+    return dirs, annotations, images
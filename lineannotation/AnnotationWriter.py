@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class AnnotationWriter(object):
+    """
+    AnnotationWriter writes a SarcomereLines object to its file from a background thread.
+
+    mark_dirty() only records that the lines changed, so it is cheap to call after every edit. The thread
+    coalesces all the changes made in between and writes the file at most once every interval seconds.
+    close() stops the thread and does a final synchronous write of anything still pending.
+    """
+
+    def __init__(self, sarcomere_lines, fname, interval=0.5):
+        """
+        Start the writer thread
+        :param sarcomere_lines: the SarcomereLines object to write
+        :param fname: the file to write to
+        :param interval: the minimum time in seconds between two writes
+        """
+        self.sarcomere_lines = sarcomere_lines
+        self.fname = fname
+        self.interval = interval
+        self.img_size = None
+        self.dirty = False
+        self.closed = False
+        self.last_write = 0.0
+        self.cond = threading.Condition()
+        self.io_lock = threading.Lock()  # keeps the writer thread and a synchronous flush from writing together
+        self.thread = threading.Thread(target=self.run, name="AnnotationWriter", daemon=True)
+        self.thread.start()
+
+    def mark_dirty(self, img_size):
+        """
+        schedule a write of the lines
+        :param img_size: the (x,y) size written as the header of the file
+        """
+        with self.cond:
+            self.img_size = img_size
+            self.dirty = True
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.dirty and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                delay = self.last_write + self.interval - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+            try:
+                self.flush()
+            except OSError:
+                log.exception('AnnotationWriter: unable to write <%s>' % self.fname)
+
+    def flush(self):
+        """
+        write the file now if there are changes that haven't been written yet.
+        """
+        with self.io_lock:
+            with self.cond:
+                if not self.dirty:
+                    return
+                self.dirty = False
+                img_size = self.img_size
+            try:
+                self.sarcomere_lines.write_file(self.fname, img_size)
+            except OSError:
+                with self.cond:
+                    self.dirty = True  # try again on the next flush
+                raise
+            finally:
+                self.last_write = time.monotonic()
+
+    def close(self):
+        """
+        stop the writer thread and write out any pending changes.
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.flush()
@@ -0,0 +1,219 @@
+'''
+A columnar dataset of the vertices of many annotation files, for pipelines that want all the points of a
+project in a few vectorized reads instead of parsing every .annot_txt file.
+
+A dataset is a folder holding a table of the vertices with a row per vertex and the columns
+
+    image_id    int32    the index of the image in the images table of the manifest
+    z           int32    the slice of a z-stack the line is on, 0 for a single image
+    line_id     int32    the index of the line in its slice of the image's annotation file
+    vertex      int32    the index of the vertex in the line
+    x, y        float64  the vertex in native image coordinates, y up
+
+and manifest.json listing the images ({"id", "path", "width", "height"}), the format and the chunks the
+table is split into. In the npz format each chunk is a part-NNNNN.npz file of the columns, in the parquet
+format (with pyarrow installed) the chunks are the row groups of vertices.parquet.
+
+The rows are written a chunk at a time as the files are read, so the memory used is bounded by the chunk
+size and not by the size of the dataset.
+'''
+import json
+import os
+
+import numpy as np
+
+from .AnnotationCache import load_annotation
+from .AnnotationFile import image_name, write_atomic
+from .LineArray import LineArray
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only the npz format is available
+    pyarrow = None
+
+MANIFEST = "manifest.json"
+COLUMNS = (("image_id", np.int32), ("z", np.int32), ("line_id", np.int32), ("vertex", np.int32),
+           ("x", np.float64), ("y", np.float64))
+FORMATS = ("npz", "parquet")
+
+
+class ColumnarWriter(object):
+    """ColumnarWriter
+
+    Writes the dataset, see the module. Lines are added an image at a time with add and the rows are
+    written out whenever chunk_size of them have piled up. close writes the last chunk and the manifest,
+    the dataset can't be read before that.
+    """
+
+    def __init__(self, folder, fmt="npz", chunk_size=2 ** 20, compress=False):
+        """
+        Start a dataset
+        :param folder: the folder of the dataset, it is created if it doesn't exist
+        :param fmt: "npz" or "parquet"
+        :param chunk_size: the number of rows in a chunk
+        :param compress: compress the chunks, smaller but slower to read
+        """
+        if fmt not in FORMATS:
+            raise ValueError("unknown format %r" % (fmt,))
+        if fmt == "parquet" and pyarrow is None:
+            raise ImportError("the parquet format needs pyarrow")
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.images = []
+        self.chunks = []  # {"file", "rows"} of each chunk written
+        self.pending = []  # dicts of column arrays not written yet
+        self.n_pending = 0
+        self.parquet = None
+
+    def add(self, path, lines, image_size=None, slices=None):
+        """
+        add the lines of an image
+        :param path: the path of the image, as listed in the manifest
+        :param lines: a LineArray of the lines, of slice 0 for a z-stack
+        :param image_size: the (width, height) of the image
+        :param slices: {z: LineArray or list of lines} of the other slices of a z-stack
+        :return: the image_id of the image
+        """
+        image_id = len(self.images)
+        width, height = image_size if image_size else (None, None)
+        self.images.append({"id": image_id, "path": path, "width": width, "height": height})
+        self.add_lines(image_id, 0, lines)
+        for z, slice_lines in sorted((slices or {}).items()):
+            if not isinstance(slice_lines, LineArray):
+                slice_lines = LineArray.from_lines(slice_lines)
+            self.add_lines(image_id, z, slice_lines)
+        return image_id
+
+    def add_lines(self, image_id, z, lines):
+        """
+        add the rows of the lines of a slice of an image
+        """
+        offsets = np.asarray(lines.offsets)
+        counts = np.diff(offsets)
+        n = int(offsets[-1] - offsets[0])
+        if n:
+            coords = np.asarray(lines.coords)
+            line_id = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+            self.pending.append({"image_id": np.full(n, image_id, dtype=np.int32),
+                                 "z": np.full(n, z, dtype=np.int32), "line_id": line_id,
+                                 "vertex": (np.arange(n) - (offsets[:-1] - offsets[0]).repeat(counts))
+                                 .astype(np.int32),
+                                 "x": coords[:, 0].astype(np.float64), "y": coords[:, 1].astype(np.float64)})
+            self.n_pending += n
+            if self.n_pending >= self.chunk_size:
+                self.flush()
+
+    def flush(self, last=False):
+        """
+        write the rows waiting as chunks of chunk_size, the rows left over wait for more
+        :param last: write the rows left over as well
+        """
+        columns = {name: np.concatenate([part[name] for part in self.pending]) for name, _ in COLUMNS}
+        start = 0
+        while self.n_pending - start >= self.chunk_size or (last and start < self.n_pending):
+            n = min(self.chunk_size, self.n_pending - start)
+            self.write_chunk({name: values[start:start + n] for name, values in columns.items()})
+            start += n
+        self.n_pending -= start
+        self.pending = [{name: values[start:] for name, values in columns.items()}] if self.n_pending else []
+
+    def write_chunk(self, chunk):
+        """
+        :param chunk: {name: array} of the rows of a chunk
+        """
+        n = len(chunk["x"])
+        if self.fmt == "npz":
+            fname = "part-%05d.npz" % len(self.chunks)
+            save = np.savez_compressed if self.compress else np.savez
+            save(os.path.join(self.folder, fname), **chunk)
+        else:
+            fname = "vertices.parquet"
+            table = pyarrow.table(chunk)
+            if self.parquet is None:
+                self.parquet = pyarrow.parquet.ParquetWriter(os.path.join(self.folder, fname), table.schema,
+                                                             compression="snappy" if self.compress else "none")
+            self.parquet.write_table(table, row_group_size=n)
+        self.chunks.append({"file": fname, "rows": n})
+
+    def close(self):
+        """
+        write the last chunk and the manifest
+        """
+        if self.n_pending:
+            self.flush(last=True)
+        if self.parquet is not None:
+            self.parquet.close()
+            self.parquet = None
+        manifest = {"format": self.fmt, "columns": [name for name, _ in COLUMNS], "chunks": self.chunks,
+                    "images": self.images}
+        write_atomic(os.path.join(self.folder, MANIFEST), json.dumps(manifest))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.close()
+        finally:  # a failed export leaves no manifest, but mustn't leave the parquet file open either
+            if self.parquet is not None:
+                self.parquet.close()
+                self.parquet = None
+
+
+def export_columns(annotations, folder, fmt="npz", chunk_size=2 ** 20, compress=False, root=None):
+    """
+    write the lines of annotation files as a dataset
+    :param annotations: the .annot_txt files
+    :param folder: the folder of the dataset
+    :param fmt: "npz" or "parquet"
+    :param chunk_size: the number of rows in a chunk
+    :param compress: compress the chunks
+    :param root: the images are listed relative to this folder, by default with the paths given
+    :return: the manifest of the dataset
+    """
+    with ColumnarWriter(folder, fmt, chunk_size, compress) as writer:
+        for annotation in annotations:
+            lines, image_size, _, slices = load_annotation(annotation, with_slices=True)
+            image = image_name(annotation)
+            writer.add(os.path.relpath(image, root) if root else image, lines, image_size, slices)
+    return read_manifest(folder)
+
+
+def read_manifest(folder):
+    """
+    :param folder: the folder of a dataset
+    :return: its manifest
+    """
+    with open(os.path.join(folder, MANIFEST)) as fp:
+        return json.load(fp)
+
+
+def read_columns(folder, columns=None):
+    """
+    read the vertex table of a dataset
+    :param folder: the folder of the dataset
+    :param columns: the names of the columns wanted, by default all of the columns of the dataset
+    :return: {name: array} of the columns, e.g. ready for pandas.DataFrame
+    """
+    manifest = read_manifest(folder)
+    columns = manifest["columns"] if columns is None else list(columns)
+    if manifest["format"] == "parquet":
+        if pyarrow is None:
+            raise ImportError("the parquet format needs pyarrow")
+        table = pyarrow.parquet.read_table(os.path.join(folder, "vertices.parquet"), columns=columns)
+        return {name: table.column(name).to_numpy() for name in columns}
+    dtypes = dict(COLUMNS)
+    n = sum(chunk["rows"] for chunk in manifest["chunks"])
+    result = {name: np.empty(n, dtype=dtypes[name]) for name in columns}
+    start = 0
+    for chunk in manifest["chunks"]:
+        with np.load(os.path.join(folder, chunk["file"])) as data:
+            for name in columns:
+                result[name][start:start + chunk["rows"]] = data[name]
+        start += chunk["rows"]
+    return result
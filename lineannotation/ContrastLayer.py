@@ -0,0 +1,77 @@
+from kivy.graphics import BindTexture, RenderContext
+from kivy.graphics.texture import Texture
+
+from .ContrastWindow import LUT_WIDTH
+
+# the pixel holds the bin of its value, the low byte in luminance and the high byte in alpha, and is shown
+# as the shade the lookup table gives the bin
+LOOKUP_FS = '''$HEADER$
+uniform sampler2D lut;
+uniform float lut_rows;
+
+void main(void) {
+    vec4 texel = texture2D(texture0, tex_coord0);
+    vec2 bin = floor(texel.ra * 255.0 + 0.5);
+    gl_FragColor = frag_color * texture2D(lut, (bin + 0.5) / vec2(%.1f, lut_rows));
+}
+''' % LUT_WIDTH
+
+
+class ContrastLayer(RenderContext):
+    """
+    ContrastLayer draws the textures added to it through a ContrastWindow on the GPU. The textures hold the
+    bins of the pixels (see bin_texture) and a fragment shader looks each one up in the lookup table of the
+    window, kept in a texture of its own. The pixels are only uploaded once, a change of the window only
+    uploads the table, at most 64 KB.
+
+    The bins are sampled without filtering, so a zoomed out image shows a pixel per screen pixel rather
+    than the mean of the pixels under it.
+    """
+
+    def __init__(self, contrast, **kwargs):
+        """
+        :param contrast: the ContrastWindow the textures are shown through
+        """
+        kwargs.setdefault("use_parent_projection", True)
+        kwargs.setdefault("use_parent_modelview", True)
+        kwargs.setdefault("use_parent_frag_modelview", True)
+        super(ContrastLayer, self).__init__(**kwargs)
+        self.shader.fs = LOOKUP_FS
+        self.lut = None  # the texture of the lookup table
+        self.bind_lut = BindTexture(index=1)
+        self.add(self.bind_lut)
+        self["lut"] = 1
+        self.set_contrast(contrast)
+
+    def set_contrast(self, contrast):
+        """
+        show the textures through a window, call it again once the window changed
+        :param contrast: the ContrastWindow, of an image with the same histogram bins as the textures
+        """
+        self.contrast = contrast
+        table = contrast.lut_rows()
+        if self.lut is None or self.lut.height != table.shape[0]:
+            self.lut = Texture.create(size=(LUT_WIDTH, table.shape[0]), colorfmt='luminance')
+            self.lut.mag_filter = self.lut.min_filter = 'nearest'
+            self.bind_lut.texture = self.lut
+            self["lut_rows"] = float(table.shape[0])
+        self.lut.blit_buffer(table.tobytes(), colorfmt='luminance', bufferfmt='ubyte')
+        self.ask_update()
+
+
+def bin_texture(contrast, data, texture=None):
+    """
+    upload the histogram bins of the pixels of an image, to be drawn by a ContrastLayer
+    :param contrast: the ContrastWindow the image is shown through
+    :param data: (height, width) array of the pixels, rows from the top
+    :param texture: a texture of the bins of an image of the same size to upload into, by default one is made
+    :return: the texture
+    """
+    size = (data.shape[1], data.shape[0])
+    if texture is None or tuple(texture.size) != size:
+        texture = Texture.create(size=size, colorfmt='luminance_alpha')
+        texture.mag_filter = texture.min_filter = 'nearest'  # the bins of neighbouring pixels mustn't blend
+        texture.flip_vertical()  # the rows run from the top, kivy's y runs up
+    bins = contrast.indices(data).astype('<u2')  # little endian puts the low byte first, in luminance
+    texture.blit_buffer(bins.tobytes(), colorfmt='luminance_alpha', bufferfmt='ubyte')
+    return texture
@@ -0,0 +1,177 @@
+"""
+Contrast windowing
+==================
+
+High bit depth images (12 and 16 bit microscopy, float images) are shown through a window: values at or
+below low are black, values at or above high are white and the values in between are mapped through a
+gamma curve, 255 * ((value - low) / (high - low)) ** gamma. The window is usually given by its level (the
+middle) and its width.
+
+A histogram of the image is taken once, when the image is opened. The window is applied through an 8 bit
+lookup table over the bins of the histogram, for 8 and 16 bit pixels a bin per value so a pixel indexes the
+table directly. The table only depends on the window, so moving a window slider only rebuilds a table of
+at most 65536 entries. The editor keeps the bins of the pixels on the GPU and looks them up in the table
+there (see ContrastLayer), apply maps pixels through the table on the CPU.
+"""
+import math
+
+import numpy as np
+
+DIRECT_DTYPES = (np.uint8, np.uint16)  # the pixel values are the bins of the histogram
+HIST_BINS = 4096  # the bins of the histogram of other pixel types, over the range of the values
+HIST_SAMPLES = 2 ** 22  # the histogram of a larger image is taken over a subsample of its pixels
+SATURATED = 0.0035  # the fraction of pixels auto leaves black or white, as ImageJ's auto contrast
+LUT_WIDTH = 256  # the lookup table is laid out in rows of this many bins, see lut_rows
+
+
+class ContrastWindow(object):
+    """ContrastWindow
+
+    The window, level and gamma of the display of an image and the lookup table applying them, see the
+    module. The table is cached until the window changes.
+    """
+
+    def __init__(self, counts, offset=0.0, width=1.0, direct=True):
+        """
+        Start with the window set by auto
+        :param counts: the histogram, counts[b] pixels have values from offset + b * width up to the next bin
+        :param offset: the value at the start of the first bin
+        :param width: the width of a bin
+        :param direct: the bins are the pixel values, so pixels index the lookup table directly
+        """
+        self.counts = np.asarray(counts)
+        self.offset = offset
+        self.width = width
+        self.direct = direct
+        n = len(self.counts)
+        self.values = offset + (np.arange(n) + (0.0 if direct else 0.5)) * width  # the value of each bin
+        present = np.nonzero(self.counts)[0]
+        self.range = (0.0, 1.0)  # the smallest and largest value in the image
+        if len(present):
+            self.range = (float(self.values[present[0]]), float(self.values[present[-1]]))
+        self.low, self.high = self.range
+        self.gamma = 1.0
+        self.lut_key = None
+        self.lut_table = None
+        self.auto()
+
+    @property
+    def level(self):
+        return 0.5 * (self.low + self.high)
+
+    @property
+    def window(self):
+        return self.high - self.low
+
+    def set_window(self, level, window, gamma=None):
+        """
+        :param level: the value shown mid grey
+        :param window: the width of the values shown as shades of grey
+        :param gamma: the exponent of the curve, below 1 brightens the dark values, by default unchanged
+        """
+        window = max(window, self.width)
+        self.low, self.high = level - 0.5 * window, level + 0.5 * window
+        if gamma is not None:
+            self.gamma = gamma
+
+    def set_relative(self, level, window, gamma=None):
+        """
+        set the window in fractions of the range of the values in the image, as shown by sliders
+        :param level: 0 puts the level at the smallest value, 1 at the largest
+        :param window: 1 spans the range
+        :param gamma: as set_window
+        """
+        span = self.range[1] - self.range[0] or 1.0
+        self.set_window(self.range[0] + level * span, window * span, gamma)
+
+    def relative(self):
+        """
+        :return: (level, window) in fractions of the range of the values, see set_relative
+        """
+        span = self.range[1] - self.range[0] or 1.0
+        return (self.level - self.range[0]) / span, self.window / span
+
+    def auto(self, saturated=SATURATED):
+        """
+        set the window to the values of all but the darkest and brightest pixels
+        :param saturated: the fraction of the pixels left black or white
+        """
+        total = self.counts.sum()
+        if not total:
+            return
+        cdf = np.cumsum(self.counts) / float(total)
+        self.low = float(self.values[min(int(np.searchsorted(cdf, 0.5 * saturated, side='right')), len(cdf) - 1)])
+        self.high = float(self.values[min(int(np.searchsorted(cdf, 1.0 - 0.5 * saturated)), len(cdf) - 1)])
+        if self.high <= self.low:
+            self.high = self.low + self.width
+
+    def lut(self):
+        """
+        :return: uint8 array of the shade of each bin of the histogram, cached until the window changes
+        """
+        key = (self.low, self.high, self.gamma)
+        if key != self.lut_key:
+            t = np.clip((self.values - self.low) / (self.high - self.low), 0.0, 1.0)
+            if self.gamma != 1.0:
+                t = t ** self.gamma
+            self.lut_table = (t * 255.0 + 0.5).astype(np.uint8)
+            self.lut_key = key
+        return self.lut_table
+
+    def lut_rows(self):
+        """
+        :return: the lookup table as a (rows, LUT_WIDTH) uint8 array, bin b at row b // LUT_WIDTH and column
+        b % LUT_WIDTH, padded with white
+        """
+        lut = self.lut()
+        rows = -(-len(lut) // LUT_WIDTH)
+        table = np.full(rows * LUT_WIDTH, 255, dtype=np.uint8)
+        table[:len(lut)] = lut
+        return table.reshape(rows, LUT_WIDTH)
+
+    def indices(self, data):
+        """
+        :param data: array of pixels of the image the histogram was taken of
+        :return: uint16 array of the bin of each pixel
+        """
+        if self.direct and data.dtype in DIRECT_DTYPES:
+            return np.asarray(data, dtype=np.uint16)
+        bins = (np.asarray(data, dtype=np.float32) - self.offset) * (1.0 / self.width)
+        return np.clip(np.nan_to_num(bins), 0, len(self.counts) - 1).astype(np.uint16)
+
+    def apply(self, data):
+        """
+        map pixels through the window
+        :param data: array of pixels of the image the histogram was taken of
+        :return: uint8 array of the same shape
+        """
+        if self.direct and data.dtype in DIRECT_DTYPES:
+            return np.take(self.lut(), data)
+        return np.take(self.lut(), self.indices(data))
+
+
+def histogram(data, max_samples=HIST_SAMPLES):
+    """
+    take the histogram of an image, over a strided subsample of its rows and columns if it is large, so a
+    memory-mapped image is only partly read
+    :param data: (height, width) or (height, width, samples) array of pixels
+    :param max_samples: the most pixels counted
+    :return: (counts, offset, width, direct) as the arguments of ContrastWindow
+    """
+    step = max(1, int(math.ceil(math.sqrt(data.shape[0] * data.shape[1] / float(max_samples)))))
+    sample = np.asarray(data[::step, ::step]).ravel()
+    if sample.dtype in DIRECT_DTYPES:
+        return np.bincount(sample, minlength=np.iinfo(sample.dtype).max + 1), 0.0, 1.0, True
+    sample = sample[np.isfinite(sample)] if sample.dtype.kind == 'f' else sample
+    low, high = (float(sample.min()), float(sample.max())) if len(sample) else (0.0, 1.0)
+    width = (high - low) / HIST_BINS or 1.0
+    counts = np.histogram(sample, bins=HIST_BINS, range=(low, low + width * HIST_BINS))[0]
+    return counts, low, width, False
+
+
+def contrast_window(data):
+    """
+    :param data: the pixels of an image
+    :return: a ContrastWindow for the image, set by auto
+    """
+    return ContrastWindow(*histogram(data))
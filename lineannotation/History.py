@@ -0,0 +1,79 @@
+from collections import deque
+
+HISTORY_BYTES = 8 * 2 ** 20
+
+
+class History(object):
+    """History
+
+    The undo and redo stacks of the edits made to a SarcomereLines. Each edit is kept as a delta, a tuple
+    naming the change and holding just what is needed to reverse and repeat it, e.g. ("add", x, y) for a
+    point added to the last line or ("remove", i, key, line, placeholder) for a removed line. Nothing is ever copied
+    from the rest of the lines, so the cost of an edit in memory and time doesn't grow with the annotation.
+
+    The deltas are counted against a memory cap, once it is exceeded the oldest edits are forgotten.
+    Making a new edit forgets the edits that were undone, as they can no longer be redone.
+    """
+
+    def __init__(self, max_bytes=HISTORY_BYTES):
+        """
+        Create an empty history
+        :param max_bytes: the cap on the estimated memory held by the deltas
+        """
+        self.max_bytes = max_bytes
+        self.undos = deque()
+        self.redos = []
+        self.size = 0
+
+    def __len__(self):
+        return len(self.undos)
+
+    def push(self, delta):
+        """
+        remember a new edit
+        :param delta: the tuple describing the edit
+        """
+        self.clear_redo()
+        self.undos.append(delta)
+        self.size += delta_size(delta)
+        while self.size > self.max_bytes and self.undos:
+            self.size -= delta_size(self.undos.popleft())
+
+    def undo(self):
+        """
+        :return: the latest edit, which moves to the redo stack, or None if there is none
+        """
+        if not self.undos:
+            return None
+        delta = self.undos.pop()
+        self.redos.append(delta)
+        return delta
+
+    def redo(self):
+        """
+        :return: the latest undone edit, which moves back to the undo stack, or None if there is none
+        """
+        if not self.redos:
+            return None
+        delta = self.redos.pop()
+        self.undos.append(delta)
+        return delta
+
+    def clear_redo(self):
+        """
+        forget the undone edits, for changes made outside of the history
+        """
+        for old in self.redos:
+            self.size -= delta_size(old)
+        self.redos = []
+
+
+def delta_size(delta):
+    """
+    a rough estimate of the memory held by a delta, points in a line held by the delta count 64 bytes each
+    """
+    size = 64 + 16 * len(delta)
+    for arg in delta:
+        if isinstance(arg, list):
+            size += 64 * len(arg)
+    return size
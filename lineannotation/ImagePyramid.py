@@ -0,0 +1,240 @@
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from .ImageReader import TiffTiles, image_shape, open_pixels, read_image, to_ubyte
+from .LRUCache import LRUCache
+
+
+class ImagePyramid(object):
+    """ImagePyramid
+
+    Serves an image as square tiles at a series of resolutions. Level 0 is the native resolution and each
+    level above it halves the resolution until the whole image fits in a single tile.
+
+    Tiles are made on demand by a small pool of background threads. The tiles of level 0 are cut from a
+    memory-mapped view of the image, or decoded from the tiles of a tiled tiff that they overlap (see
+    open_pixels). Other files (png, jpeg, compressed tiff in strips) are decoded whole by the first
+    background thread, their tiles wait for it. A tile of a higher level is the mean of each 2x2 block of
+    pixels of the four tiles below it, so zoomed out views aren't aliased. Those are taken from the cache,
+    so a level is built from the level below it rather than from level 0, and only the tiles missing from
+    the cache are made first. A tile being made by one thread is waited for by any other thread that
+    wants it instead of being made twice. With keep_depth the tiles keep the pixel type of the image, to be
+    shown through a ContrastWindow, otherwise they are converted to 8 bit. Tiles are kept in an LRU cache
+    capped by memory, so only the tiles around the current view and the ones the coarser tiles were last
+    built from are held.
+
+    Tile (level, tx, ty) covers the rows ty * tile_size * 2**level down from the top of the image and the
+    columns tx * tile_size * 2**level in from the left.
+    """
+
+    def __init__(self, fname, tile_size=512, cache_bytes=256 * 2 ** 20, workers=2, keep_depth=False):
+        """
+        Open the image, this reads the header or maps the file but decodes no pixels on the calling thread.
+        :param fname: the image file
+        :param tile_size: the edge length of a tile in pixels
+        :param cache_bytes: the cap on the memory held by decoded tiles
+        :param workers: the number of background decoding threads
+        :param keep_depth: don't convert the tiles to 8 bit
+        """
+        self.fname = fname
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.data = open_pixels(fname)
+        self.loading = None  # the future of the pixels of an image decoded whole
+        if self.data is None:
+            self.loading = self.executor.submit(read_image, fname)
+        shape = self.data.shape if self.data is not None else image_shape(fname)
+        self.size = (shape[1], shape[0])  # (width, height) like kivy
+        self.samples = shape[2] if len(shape) == 3 and shape[2] in (3, 4) else 1
+        self.tile_size = tile_size
+        self.keep_depth = keep_depth
+        self.n_levels = max(1, int(math.ceil(math.log2(max(self.size) / float(tile_size)))) + 1)
+        self.cache = LRUCache(cache_bytes)
+        self.pending = {}  # key -> future of the tiles being decoded
+        self.lock = threading.Lock()  # guards self.making
+        self.making = {}  # key -> Future of the tiles being made by some thread, see decode
+
+    def level_for_scale(self, scale):
+        """
+        the coarsest level that still has at least one pixel per screen pixel
+        :param scale: how many fold the image is zoomed from native
+        :return: the pyramid level
+        """
+        if scale >= 1.0:
+            return 0
+        return min(int(math.floor(math.log2(1.0 / scale))), self.n_levels - 1)
+
+    def tile_span(self, level):
+        """
+        :return: the number of native pixels covered by the edge of a tile at a level
+        """
+        return self.tile_size * 2 ** level
+
+    def tile_box(self, key):
+        """
+        :param key: (level, tx, ty) of the tile
+        :return: (x0, y0, x1, y1) native pixel box of the tile, y counted in rows from the top
+        """
+        level, tx, ty = key
+        span = self.tile_span(level)
+        return tx * span, ty * span, min((tx + 1) * span, self.size[0]), min((ty + 1) * span, self.size[1])
+
+    def tiles_in_view(self, level, rect):
+        """
+        the tiles of a level that overlap a rectangle
+        :param level: the pyramid level
+        :param rect: (x0, y0, x1, y1) in native coordinates with y up, as used by the annotations
+        :return: list of tile keys
+        """
+        span = self.tile_span(level)
+        width, height = self.size
+        x0, x1 = max(rect[0], 0), min(rect[2], width)
+        row0, row1 = max(height - rect[3], 0), min(height - rect[1], height)  # flip to rows from the top
+        if x0 >= x1 or row0 >= row1:
+            return []
+        return [(level, tx, ty)
+                for ty in range(int(row0 // span), int(math.ceil(row1 / span)))
+                for tx in range(int(x0 // span), int(math.ceil(x1 / span)))]
+
+    def pixels(self):
+        """
+        :return: the array of the image, waiting for it if the image is being decoded in the background
+        """
+        if self.data is None:
+            self.data = self.loading.result()
+        return self.data
+
+    def cut(self, box):
+        """
+        :param box: (x0, y0, x1, y1) native pixel box, y counted in rows from the top
+        :return: array of the pixels of the box in the pixel type of the image
+        """
+        x0, y0, x1, y1 = box
+        pixels = np.asarray(self.pixels()[y0:y1, x0:x1])
+        if pixels.ndim == 3 and self.samples == 1:
+            pixels = pixels[:, :, 0]  # only grey, rgb and rgba can be shown, use the first channel otherwise
+        return pixels
+
+    def decode(self, key):
+        """
+        get a tile from the cache, or wait for the thread already making it, or make it
+        :param key: (level, tx, ty) of the tile
+        :return: array of the tile, rows from the top, uint8 unless keep_depth
+        """
+        tile = self.cache.get(key)
+        if tile is not None:
+            return tile
+        with self.lock:
+            future = self.making.get(key)
+            owner = future is None
+            if owner:
+                future = self.making[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            future.set_result(self.make(key))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.making[key]
+        return future.result()
+
+    def make(self, key):
+        """
+        make a tile, at level 0 by cutting it out of the image, at a higher level by halving the resolution
+        of the tiles of the level below it, which are taken from the cache or made first
+        :param key: (level, tx, ty) of the tile
+        :return: array of the tile, rows from the top, uint8 unless keep_depth
+        """
+        level, tx, ty = key
+        if level == 0:
+            tile = self.cut(self.tile_box(key))
+            tile = tile if self.keep_depth else to_ubyte(tile)
+        else:
+            span = self.tile_span(level - 1)
+            rows = [[self.decode((level - 1, cx, cy)) for cx in (2 * tx, 2 * tx + 1) if cx * span < self.size[0]]
+                    for cy in (2 * ty, 2 * ty + 1) if cy * span < self.size[1]]
+            tile = block_mean(np.concatenate([np.concatenate(row, axis=1) for row in rows], axis=0))
+        tile = np.ascontiguousarray(tile)
+        self.cache.put(key, tile)
+        return tile
+
+    def sample(self, max_tiles=16):
+        """
+        the pixels of up to max_tiles tiles spread over the image, to take its histogram without reading
+        all of it
+        :param max_tiles: the most level 0 tiles read
+        :return: (1, n) or (1, n, samples) array of the pixels, in the pixel type of the image
+        """
+        per_axis = int(math.sqrt(max_tiles))
+        across = [np.unique(np.linspace(0, int(math.ceil(n / float(self.tile_size))) - 1, per_axis).round())
+                  for n in self.size]
+        pixels = [self.cut(self.tile_box((0, int(tx), int(ty)))) for ty in across[1] for tx in across[0]]
+        return np.concatenate([p.reshape((1, -1) + p.shape[2:]) for p in pixels], axis=1)
+
+    def tile(self, key):
+        """
+        :param key: (level, tx, ty) of the tile
+        :return: the decoded tile or None if it hasn't been decoded yet
+        """
+        return self.cache.get(key)
+
+    def request(self, key, callback):
+        """
+        decode a tile in the background
+        :param key: (level, tx, ty) of the tile
+        :param callback: called with (key, tile) from the decoding thread when the tile is ready
+        """
+        tile = self.cache.get(key)
+        if tile is not None:
+            callback(key, tile)
+            return
+        if key in self.pending:
+            return
+        future = self.executor.submit(self.decode, key)
+        self.pending[key] = future
+
+        def done(f):
+            self.pending.pop(key, None)
+            if not f.cancelled() and f.exception() is None:
+                callback(key, f.result())
+
+        future.add_done_callback(done)
+
+    def cancel_except(self, keys):
+        """
+        cancel the queued decodes of tiles that are no longer wanted
+        :param keys: the tiles still wanted
+        """
+        for key, future in list(self.pending.items()):
+            if key not in keys and future.cancel():
+                self.pending.pop(key, None)
+
+    def close(self):
+        if self.loading is not None:
+            self.loading.cancel()
+        self.executor.shutdown(wait=False)
+        if isinstance(self.data, TiffTiles):
+            self.data.close()
+        self.cache.clear()
+
+
+def block_mean(tile):
+    """
+    halve the resolution of a tile by taking the mean of each 2x2 block of its pixels, an odd last row or
+    column is averaged on its own
+    :param tile: (height, width) or (height, width, samples) array
+    :return: array of ceil(height / 2) by ceil(width / 2) pixels of the same type
+    """
+    acc = tile.astype(np.float64 if tile.dtype.itemsize > 2 else np.float32)
+    if acc.shape[0] % 2:
+        acc = np.concatenate([acc, acc[-1:]], axis=0)
+    if acc.shape[1] % 2:
+        acc = np.concatenate([acc, acc[:, -1:]], axis=1)
+    mean = 0.25 * (acc[0::2, 0::2] + acc[1::2, 0::2] + acc[0::2, 1::2] + acc[1::2, 1::2])
+    if np.issubdtype(tile.dtype, np.integer):
+        mean += 0.5  # round rather than truncate
+    return mean.astype(tile.dtype)
@@ -0,0 +1,190 @@
+import os
+import threading
+
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:  # tiff files are then decoded with Pillow
+    tifffile = None
+
+TIFF_EXTS = ('.tif', '.tiff')
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif') + TIFF_EXTS
+PIL_DTYPES = {'I;16': np.uint16, 'I;16L': np.uint16, 'I;16B': '>u2', 'I': np.int32, 'F': np.float32}  # not 8 bit
+
+
+def list_images(folder):
+    """
+    the images in a folder, in the order they are stepped through
+    :param folder: the folder
+    :return: sorted list of the paths of the image files
+    """
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(IMAGE_EXTS) and os.path.isfile(os.path.join(folder, name)))
+
+
+def image_size(fname):
+    """
+    read the (width, height) of an image from its header without decoding the pixels
+    :param fname: the image file
+    :return: (width, height) in pixels
+    """
+    if fname.endswith('.npy'):
+        shape = np.load(fname, mmap_mode='r').shape
+        return shape[1], shape[0]
+    if tifffile is not None and fname.lower().endswith(TIFF_EXTS):
+        with tifffile.TiffFile(fname) as tif:
+            shape = tif.series[0].shape
+            axes = tif.series[0].axes
+        return shape[axes.index('X')], shape[axes.index('Y')]
+    from PIL import Image
+    with Image.open(fname) as img:
+        return img.size
+
+
+def image_shape(fname):
+    """
+    read the shape of an image from its header without decoding the pixels
+    :param fname: the image file
+    :return: (height, width) or (height, width, samples) of a single plane image as read_image returns it
+    """
+    if fname.endswith('.npy'):
+        return np.load(fname, mmap_mode='r').shape
+    if tifffile is not None and fname.lower().endswith(TIFF_EXTS):
+        with tifffile.TiffFile(fname) as tif:
+            shape, axes = tif.series[0].shape, tif.series[0].axes
+        return tuple(shape[axes.index(a)] for a in 'YXS' if a in axes)
+    from PIL import Image
+    with Image.open(fname) as img:
+        bands = 3 if img.mode == 'P' else len(img.getbands())
+        return (img.size[1], img.size[0]) + ((bands,) if bands > 1 else ())
+
+
+def image_dtype(fname):
+    """
+    read the pixel type of an image from its header without decoding the pixels
+    :param fname: the image file
+    :return: the numpy dtype of the pixels as read_image returns them
+    """
+    if fname.endswith('.npy'):
+        return np.load(fname, mmap_mode='r').dtype
+    if tifffile is not None and fname.lower().endswith(TIFF_EXTS):
+        with tifffile.TiffFile(fname) as tif:
+            return tif.series[0].dtype
+    from PIL import Image
+    with Image.open(fname) as img:
+        return np.dtype(PIL_DTYPES.get(img.mode, np.uint8))
+
+
+def read_image(fname, mmap=True):
+    """
+    read an image as an array, uncompressed tiff and .npy files are memory-mapped so only the pixels that
+    are used are read from disk.
+    :param fname: the image file
+    :param mmap: memory-map the file where possible instead of reading it all
+    :return: (height, width) or (height, width, channels) array, row 0 is the top of the image
+    """
+    if fname.endswith('.npy'):
+        return np.load(fname, mmap_mode='r' if mmap else None)
+    if tifffile is not None and fname.lower().endswith(TIFF_EXTS):
+        if mmap:
+            try:
+                return tifffile.memmap(fname, mode='r')
+            except ValueError:
+                pass  # compressed or not contiguous, decode it instead
+        return tifffile.imread(fname)
+    from PIL import Image
+    with Image.open(fname) as img:
+        if img.mode == 'P':
+            img = img.convert('RGB')
+        return np.asarray(img)
+
+
+def open_pixels(fname):
+    """
+    open an image for reading parts of it without decoding it whole: .npy and uncompressed tiff files are
+    memory-mapped, a tiled tiff is read a tile at a time (see TiffTiles)
+    :param fname: the image file
+    :return: the array, or TiffTiles, None if the image can only be decoded whole (see read_image)
+    """
+    if fname.endswith('.npy'):
+        return np.load(fname, mmap_mode='r')
+    if tifffile is None or not fname.lower().endswith(TIFF_EXTS):
+        return None
+    try:
+        return tifffile.memmap(fname, mode='r')
+    except ValueError:
+        pass
+    tiles = TiffTiles(fname)
+    if tiles.page is None:
+        tiles.close()
+        return None
+    return tiles
+
+
+class TiffTiles(object):
+    """
+    TiffTiles reads a box of the pixels of a tiled tiff image by decoding only the tiles of the file that
+    overlap it. It is indexed by a slice of rows and a slice of columns like the array read_image returns,
+    data[y0:y1, x0:x1], rows from the top.
+    """
+
+    def __init__(self, fname):
+        """
+        Open a tiff file, this reads the header
+        :param fname: the tiff file
+        """
+        self.lock = threading.Lock()  # the file is read by one tile at a time
+        self.tif = tifffile.TiffFile(fname)
+        page = self.tif.pages[0]
+        # an image of a single tiled page, with the samples of a pixel stored together
+        usable = (len(self.tif.series[0].pages) == 1 and page.is_tiled and page.tiledepth == 1
+                  and (page.samplesperpixel == 1 or page.planarconfig == 1))
+        self.page = page if usable else None
+        self.shape = page.shape
+        self.dtype = page.dtype
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, index):
+        rows, cols = index
+        y0, y1, ystep = rows.indices(self.shape[0])
+        x0, x1, xstep = cols.indices(self.shape[1])
+        out = np.empty((max(y1 - y0, 0), max(x1 - x0, 0)) + self.shape[2:], dtype=self.dtype)
+        th, tw = self.page.tilelength, self.page.tilewidth
+        across = -(-self.shape[1] // tw)
+        for ty in range(y0 // th, -(-y1 // th)):
+            for tx in range(x0 // tw, -(-x1 // tw)):
+                tile = self.read_tile(ty * across + tx).reshape((th, tw) + self.shape[2:])
+                r0, c0 = max(y0, ty * th), max(x0, tx * tw)
+                r1, c1 = min(y1, (ty + 1) * th), min(x1, (tx + 1) * tw)
+                out[r0 - y0:r1 - y0, c0 - x0:c1 - x0] = tile[r0 - ty * th:r1 - ty * th,
+                                                             c0 - tx * tw:c1 - tx * tw]
+        return out[::ystep, ::xstep]
+
+    def read_tile(self, i):
+        """
+        :param i: the index of the tile in the page, row by row
+        :return: the decoded tile, padded to the full tile size at the edges of the image
+        """
+        page = self.page
+        with self.lock:
+            fh = self.tif.filehandle
+            fh.seek(page.dataoffsets[i])
+            data = fh.read(page.databytecounts[i]) if page.databytecounts[i] else None  # None for a missing tile
+        return page.decode(data, i, jpegtables=page.jpegtables)[0]
+
+    def close(self):
+        self.tif.close()
+
+
+def to_ubyte(data):
+    """
+    convert pixels to 8 bit for display, higher bit depths are scaled by the largest value of their type
+    :param data: array of pixels
+    :return: uint8 array of the same shape
+    """
+    if data.dtype == np.uint8:
+        return data
+    if np.issubdtype(data.dtype, np.integer):
+        return (data.astype(np.float32) * (255.0 / np.iinfo(data.dtype).max)).astype(np.uint8)
+    return (np.clip(data, 0.0, 1.0) * 255.0).astype(np.uint8)
@@ -0,0 +1,113 @@
+import threading
+
+import numpy as np
+
+from .ImageReader import TIFF_EXTS
+
+try:
+    import tifffile
+except ImportError:  # stacks can't be opened, tiff files are shown as single images
+    tifffile = None
+
+SLICE_AXES = 'ZIQ'  # the axes stepped through as slices, the first one a series has
+PLANE_AXES = 'YXS'  # the axes of a plane, S holds the samples of an rgb image
+
+
+class ImageStack(object):
+    """ImageStack
+
+    A multi-channel z-stack held in a tiff file (ImageJ hyperstacks and OME-TIFF included), shown a plane
+    at a time. Opening it only reads the header, the pixels of a plane are read when the plane is asked for.
+
+    Uncompressed files are memory-mapped so reading a plane only touches its pages of the file, compressed
+    files decode just the tiff page holding the plane. Either way a 60 slice stack costs the memory of
+    the planes shown, not of the stack.
+
+    The axes of the first series are used: Z (or I or Q for a plain sequence of pages) are the slices, C
+    the channels. Any other axis, such as time, is held at its first index.
+    """
+
+    def __init__(self, fname):
+        """
+        Open a stack, this reads the header and maps the file but decodes no pixels
+        :param fname: the tiff file
+        """
+        self.fname = fname
+        self.lock = threading.Lock()  # the pages of a compressed file are decoded one at a time
+        self.tif = tifffile.TiffFile(fname)
+        series = self.tif.series[0]
+        self.axes = series.axes
+        self.shape = series.shape
+        self.size = (self.shape[self.axes.index('X')], self.shape[self.axes.index('Y')])  # (width, height)
+        self.slice_axis = next((a for a in SLICE_AXES if a in self.axes), None)
+        self.n_slices = self.shape[self.axes.index(self.slice_axis)] if self.slice_axis else 1
+        self.n_channels = self.shape[self.axes.index('C')] if 'C' in self.axes else 1
+        try:
+            self.data = tifffile.memmap(fname, mode='r')
+        except ValueError:  # compressed or not contiguous, planes are decoded from their pages instead
+            self.data = None
+            self.pages = series.pages
+        if self.data is not None:
+            self.tif.close()
+            self.tif = None
+
+    def index(self, z, c):
+        """
+        :param z: the slice
+        :param c: the channel
+        :return: the index of each axis of the series, slice(None) for the axes of the plane
+        """
+        index = []
+        for a in self.axes:
+            if a in PLANE_AXES:
+                index.append(slice(None))
+            elif a == self.slice_axis:
+                index.append(z)
+            elif a == 'C':
+                index.append(c)
+            else:
+                index.append(0)
+        return tuple(index)
+
+    def plane(self, z, c=0):
+        """
+        read a plane
+        :param z: the slice
+        :param c: the channel
+        :return: (height, width) or (height, width, samples) array, row 0 is the top of the image
+        """
+        if not (0 <= z < self.n_slices and 0 <= c < self.n_channels):
+            raise IndexError("no plane z=%d c=%d in %s" % (z, c, self.fname))
+        index = self.index(z, c)
+        if self.data is not None:
+            return np.array(self.data[index])
+        outer = [(i, n) for i, n, a in zip(index, self.shape, self.axes) if a not in PLANE_AXES]
+        page = int(np.ravel_multi_index([i for i, _ in outer], [n for _, n in outer])) if outer else 0
+        with self.lock:
+            return self.pages[page].asarray().reshape([n for n, a in zip(self.shape, self.axes)
+                                                       if a in PLANE_AXES])
+
+    def close(self):
+        """
+        close the file, the planes already read stay valid
+        """
+        self.data = None
+        if self.tif is not None:
+            self.tif.close()
+            self.tif = None
+
+
+def open_stack(fname):
+    """
+    open an image as a stack if it has more than one plane
+    :param fname: the image file
+    :return: an ImageStack, or None for an image of a single plane, a file that isn't tiff or if tifffile
+    isn't installed
+    """
+    if tifffile is None or not fname.lower().endswith(TIFF_EXTS):
+        return None
+    stack = ImageStack(fname)
+    if stack.n_slices == 1 and stack.n_channels == 1:
+        stack.close()
+        return None
+    return stack
@@ -0,0 +1,82 @@
+import json
+import os
+
+
+class Journal(object):
+    """
+    Journal is an append-only log of the changes made to a set of lines.
+
+    Each record is a line of json, [seq, op, arg, ...], where seq increases by one with each record.
+    The annotation file stores the seq of the last record it includes, so after it is written the journal
+    can be emptied (compacted) and on load only the records after that seq need to be replayed.
+    """
+
+    def __init__(self, fname, seq=0):
+        """
+        Open the journal
+        :param fname: the journal file, it is created on the first append
+        :param seq: the seq of the last record already included in the annotation file
+        """
+        self.fname = fname
+        self.seq = seq
+        self.fp = None
+
+    def read(self):
+        """
+        read the records that aren't included in the annotation file yet. A record cut short by a crash
+        is dropped from the file so later records are appended after the last complete one.
+        :return: a list of (op, args) in the order they were recorded
+        """
+        records = []
+        good = 0
+        try:
+            with open(self.fname, 'rb') as fp:
+                for raw in fp:
+                    try:
+                        record = json.loads(raw.decode('utf-8'))
+                    except ValueError:
+                        break
+                    if not raw.endswith(b'\n'):
+                        break
+                    good += len(raw)
+                    seq, op, args = record[0], record[1], record[2:]
+                    if seq > self.seq:
+                        records.append((op, args))
+                        self.seq = seq
+            if good < os.path.getsize(self.fname):
+                with open(self.fname, 'r+b') as fp:
+                    fp.truncate(good)
+        except FileNotFoundError:
+            pass
+        return records
+
+    def append(self, op, *args):
+        """
+        add a record to the end of the journal
+        :param op: the name of the change
+        :param args: the arguments of the change
+        """
+        if self.fp is None:
+            self.fp = open(self.fname, 'a')
+        self.seq += 1
+        self.fp.write(json.dumps([self.seq, op] + list(args)) + '\n')
+        self.fp.flush()
+
+    def compact(self, seq):
+        """
+        empty the journal after the annotation file has been written
+        :param seq: the seq that was stored in the annotation file, if records were appended since the
+        journal is kept as it is, the next write will compact it.
+        """
+        if seq != self.seq:
+            return
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        if os.path.exists(self.fname):
+            os.remove(self.fname)
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
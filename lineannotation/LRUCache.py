@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    LRUCache is a thread safe least recently used cache with a cap on the total size of its values.
+    The size of a value is given by the sizeof function, by default its nbytes so arrays are counted
+    by the memory they hold. When the cap is exceeded the least recently used values are dropped, a value
+    larger than the cap on its own isn't cached at all.
+    """
+
+    def __init__(self, max_size, sizeof=lambda value: getattr(value, 'nbytes', 1), on_evict=None):
+        """
+        Create an empty cache
+        :param max_size: the cap on the summed sizes of the values
+        :param sizeof: function giving the size of a value
+        :param on_evict: optional function called with (key, value) for each value dropped by the cap
+        """
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.items
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def keys(self):
+        """
+        :return: list of the cached keys, least recently used first
+        """
+        with self.lock:
+            return list(self.items)
+
+    def get(self, key, default=None):
+        """
+        :param key: the key of the value
+        :param default: returned when the key isn't cached
+        :return: the cached value, which becomes the most recently used
+        """
+        with self.lock:
+            if key not in self.items:
+                return default
+            self.items.move_to_end(key)
+            return self.items[key][0]
+
+    def put(self, key, value):
+        """
+        add a value, dropping the least recently used values if the cache grows past its cap.
+        :param key: the key of the value
+        :param value: the value to cache
+        :return: False if the value is larger than the cap and wasn't cached, any old value of the key is
+        dropped either way
+        """
+        evicted = []
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+            if size > self.max_size:
+                return False
+            self.items[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size and len(self.items) > 1:
+                old_key, (old_value, old_size) = self.items.popitem(last=False)
+                self.size -= old_size
+                evicted.append((old_key, old_value))
+        if self.on_evict:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+        return True
+
+    def pop(self, key, default=None):
+        """
+        remove a value
+        :param key: the key of the value
+        :param default: returned when the key isn't cached
+        :return: the removed value
+        """
+        with self.lock:
+            if key not in self.items:
+                return default
+            value, size = self.items.pop(key)
+            self.size -= size
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
@@ -0,0 +1,391 @@
+from itertools import chain
+
+import numpy as np
+
+from .AnnotationFile import dumps_annotation, native_frame, write_atomic
+
+
+class LineArray(object):
+    """LineArray
+
+    A compact array backed store of lines. All the points are kept in one flat (n, 2) coordinate buffer
+    and the lines are given by an offsets array, line i is coords[offsets[i]:offsets[i + 1]]. Both buffers
+    grow by doubling so appending points is amortized O(1).
+
+    It holds the same lines as SarcomereLines.lines, in the same native image coordinates, and as_list()
+    gives them back in that form. Distances, lengths and scaling run vectorized over all the points.
+    """
+
+    def __init__(self, capacity=1024, dtype=np.float64):
+        """
+        Create an empty LineArray holding a single empty line, like a new SarcomereLines
+        :param capacity: the number of points to reserve space for
+        :param dtype: the coordinate type, float32 halves the memory of float64
+        """
+        self._coords = np.empty((max(capacity, 1), 2), dtype=dtype)
+        self._offsets = np.zeros(16, dtype=np.int64)
+        self.n_points = 0
+        self.n_lines = 1
+
+    @classmethod
+    def from_arrays(cls, coords, offsets):
+        """
+        wrap existing arrays without copying them, the buffers are copied on the first append
+        :param coords: (n, 2) array of point coordinates
+        :param offsets: (n_lines + 1,) array of line start indices ending with n
+        """
+        la = cls.__new__(cls)
+        la._coords = coords
+        la._offsets = offsets
+        la.n_points = len(coords)
+        la.n_lines = len(offsets) - 1
+        return la
+
+    @classmethod
+    def from_lines(cls, lines, dtype=np.float64):
+        """
+        build a LineArray from a list of lines of (x, y) points
+        :param lines: the lines, as in SarcomereLines.lines
+        :param dtype: the coordinate type
+        """
+        counts = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        coords = np.array(list(chain.from_iterable(lines)), dtype=dtype).reshape(-1, 2)
+        return cls.from_arrays(coords, offsets)
+
+    @classmethod
+    def read(cls, fname, dtype=np.float64):
+        """
+        read the lines of an annotation file, through its binary sidecar if it has one (see AnnotationCache)
+        :param fname: the .annot_txt file
+        :param dtype: the coordinate type, float64 maps the sidecar without copying it
+        :return: (LineArray, image_size)
+        """
+        from .AnnotationCache import load_annotation  # it builds on LineArray
+        la, image_size, journal_seq = load_annotation(fname)
+        if la.coords.dtype != dtype:
+            la = cls.from_arrays(la.coords.astype(dtype), la.offsets)
+        return la, image_size
+
+    def write_file(self, fname, img_size):
+        """
+        write out the lines in the annotation file format
+        :param fname: the file name / same as the image but with the extension .annot_txt
+        :param img_size: the (x,y) size of the local coordinate system used.
+        """
+        write_atomic(fname, dumps_annotation(self.as_list(), img_size))
+
+    @property
+    def coords(self):
+        """
+        :return: (n_points, 2) view of all the point coordinates
+        """
+        return self._coords[:self.n_points]
+
+    @property
+    def offsets(self):
+        """
+        :return: (n_lines + 1,) view of the line start indices
+        """
+        return self._offsets[:self.n_lines + 1]
+
+    def __len__(self):
+        return self.n_lines
+
+    def __getitem__(self, i):
+        """
+        :param i: the index of the line
+        :return: (n, 2) view of the points of line i
+        """
+        if i < 0:
+            i += self.n_lines
+        if not 0 <= i < self.n_lines:
+            raise IndexError(i)
+        return self._coords[self._offsets[i]:self._offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(self.n_lines):
+            yield self[i]
+
+    def as_list(self):
+        """
+        :return: the lines as a list of lists of (x, y) tuples, the form used by SarcomereLines.lines
+        """
+        points = [tuple(p) for p in self.coords.tolist()]
+        offsets = self.offsets.tolist()
+        return [points[offsets[i]:offsets[i + 1]] for i in range(self.n_lines)]
+
+    def _reserve(self, n_points, n_lines):
+        if n_points > len(self._coords) or not self._coords.flags.writeable:
+            coords = np.empty((max(n_points, 2 * len(self._coords)), 2), dtype=self._coords.dtype)
+            coords[:self.n_points] = self.coords
+            self._coords = coords
+        if n_lines + 1 > len(self._offsets) or not self._offsets.flags.writeable:
+            offsets = np.empty(max(n_lines + 1, 2 * len(self._offsets)), dtype=np.int64)
+            offsets[:self.n_lines + 1] = self.offsets
+            self._offsets = offsets
+
+    def append_point(self, p):
+        """
+        append a point to the last line
+        :param p: the (x, y) coordinates in the native resolution
+        """
+        self._reserve(self.n_points + 1, self.n_lines)
+        self._coords[self.n_points] = p
+        self.n_points += 1
+        self._offsets[self.n_lines] = self.n_points
+
+    def end_line(self):
+        """
+        end the current line, like SarcomereLines.end_line a new line is only started after a non empty one.
+        """
+        if self._offsets[self.n_lines - 1] == self.n_points:
+            return
+        self._reserve(self.n_points, self.n_lines + 1)
+        self.n_lines += 1
+        self._offsets[self.n_lines] = self.n_points
+
+    def pop_point(self):
+        """
+        remove the last point of the last line
+        """
+        if self._offsets[self.n_lines - 1] < self.n_points:
+            self.n_points -= 1
+            self._offsets[self.n_lines] = self.n_points
+
+    def append_line(self, points=()):
+        """
+        add a line at the end, unlike end_line it is added after an empty line too
+        :param points: the (x, y) points of the line
+        """
+        self.insert_line(self.n_lines, points)
+
+    def insert_line(self, i, points):
+        """
+        insert a line, moving the points of the lines after it
+        :param i: the index the line gets
+        :param points: the (x, y) points of the line
+        """
+        n = len(points)
+        self._reserve(self.n_points + n, self.n_lines + 1)
+        start = self._offsets[i]
+        self._coords[start + n:self.n_points + n] = self._coords[start:self.n_points]
+        if n:
+            self._coords[start:start + n] = points
+        self._offsets[i + 1:self.n_lines + 2] = self._offsets[i:self.n_lines + 1] + n
+        self.n_points += n
+        self.n_lines += 1
+
+    def delete_line(self, i):
+        """
+        delete a line, unlike remove_line it can leave no lines at all
+        :param i: the index of the line
+        """
+        self._reserve(self.n_points, self.n_lines)
+        start, stop = self._offsets[i], self._offsets[i + 1]
+        n = stop - start
+        self._coords[start:self.n_points - n] = self._coords[stop:self.n_points]
+        self._offsets[i:self.n_lines] = self._offsets[i + 1:self.n_lines + 1] - n
+        self.n_points -= n
+        self.n_lines -= 1
+
+    def remove_line(self, i):
+        """
+        remove a line, if it was the only line an empty line takes its place.
+        :param i: the index of the line
+        """
+        self.delete_line(i)
+        if self.n_lines == 0:
+            self.append_line()
+
+    def set_point(self, i, j, p):
+        """
+        move a point of a line
+        :param i: the index of the line
+        :param j: the index of the point in the line
+        :param p: the new (x, y) coordinates
+        """
+        self._reserve(self.n_points, self.n_lines)
+        self._coords[self._offsets[i] + j] = p
+
+    def line_list(self, i):
+        """
+        :param i: the index of the line
+        :return: the points of line i as a list of (x, y) tuples
+        """
+        return [tuple(p) for p in self[i].tolist()]
+
+    def copy(self):
+        """
+        :return: a LineArray holding a copy of the lines, it doesn't change with this one
+        """
+        return LineArray.from_arrays(self.coords.copy(), self.offsets.copy())
+
+    def line_ids(self):
+        """
+        :return: (n_points,) array with the index of the line each point belongs to
+        """
+        return np.repeat(np.arange(self.n_lines), np.diff(self.offsets))
+
+    def segments(self):
+        """
+        :return: (starts, ends, line ids) of every segment, each (n_segments, 2), (n_segments, 2), (n_segments,)
+        """
+        ids = self.line_ids()
+        same = ids[:-1] == ids[1:]
+        coords = self.coords
+        return coords[:-1][same], coords[1:][same], ids[:-1][same]
+
+    def lengths(self):
+        """
+        :return: (n_lines,) array with the length of each line along its points
+        """
+        starts, ends, ids = self.segments()
+        seg_len = np.hypot(*(ends - starts).T)
+        return np.bincount(ids, weights=seg_len, minlength=self.n_lines)
+
+    def scaled(self, sf):
+        """
+        :param sf: scale factor, if the image is 2x native size then sf = 2
+        :return: (n_points, 2) array of the coordinates in the scaled image
+        """
+        return self.coords * sf
+
+    def to_native(self, image_size, native_size):
+        """
+        map the lines of a file written in another frame onto the pixels of its image, see native_frame
+        :param image_size: the image_size in the file header
+        :param native_size: the (width, height) of the image in pixels
+        :return: a LineArray of the lines in native coordinates, self if they are already
+        """
+        frame = native_frame(image_size, native_size)
+        if frame is None:
+            return self
+        scale, offset = frame
+        return LineArray.from_arrays((self.coords - np.asarray(offset)) / scale, self.offsets.copy())
+
+    def nearest_line(self, p):
+        """
+        find the line nearest a point measuring the distance to the segments and single points of the lines
+        :param p: the (x, y) point in native coordinates
+        :return: (index, distance) of the nearest line, (0, inf) if there are no points
+        """
+        if self.n_points == 0:
+            return 0, np.inf
+        p = np.asarray(p, dtype=np.float64)
+        d_points = np.hypot(*(self.coords - p).T)
+        best = int(np.argmin(d_points))
+        best_line, best_d = int(self.line_ids()[best]), float(d_points[best])
+        starts, ends, ids = self.segments()
+        if len(ids):
+            d = ends - starts
+            len2 = np.einsum('ij,ij->i', d, d)
+            t = np.einsum('ij,ij->i', p - starts, d) / np.where(len2 > 0, len2, 1.0)
+            closest = starts + np.clip(t, 0.0, 1.0)[:, None] * d
+            d_segments = np.hypot(*(closest - p).T)
+            k = int(np.argmin(d_segments))
+            if d_segments[k] < best_d or (d_segments[k] == best_d and ids[k] < best_line):
+                best_line, best_d = int(ids[k]), float(d_segments[k])
+        return best_line, best_d
+
+
+class LineList(object):
+    """LineList
+
+    A view of a LineArray in the form of a list of lines, as SarcomereLines.lines has always been: indexing
+    gives a LineView of a line and the list methods SarcomereLines uses (append, pop, insert, del) edit the
+    array. A LineView holds the index of its line, it is only good until lines before it are inserted or
+    removed.
+    """
+
+    def __init__(self, array=None):
+        """
+        :param array: the LineArray, by default a new one holding a single empty line
+        """
+        self.array = LineArray() if array is None else array
+
+    def __len__(self):
+        return self.array.n_lines
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.array.n_lines
+        if not 0 <= i < self.array.n_lines:
+            raise IndexError(i)
+        return LineView(self.array, i)
+
+    def __delitem__(self, i):
+        self.array.delete_line(i if i >= 0 else i + self.array.n_lines)
+
+    def __iter__(self):
+        for i in range(self.array.n_lines):
+            yield LineView(self.array, i)
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return repr(self.array.as_list())
+
+    def append(self, line):
+        self.array.append_line(line)
+
+    def insert(self, i, line):
+        self.array.insert_line(i, line)
+
+    def pop(self):
+        """
+        :return: the points of the last line, which is removed
+        """
+        line = self.array.line_list(self.array.n_lines - 1)
+        self.array.delete_line(self.array.n_lines - 1)
+        return line
+
+
+class LineView(object):
+    """LineView
+
+    A line of a LineList, it reads like a list of (x, y) tuples. Points can be changed in any line but only
+    appended to or popped from the last one, as LineArray only grows and shrinks at the end.
+    """
+
+    def __init__(self, array, i):
+        self.array = array
+        self.i = i
+
+    def __len__(self):
+        return int(self.array.offsets[self.i + 1] - self.array.offsets[self.i])
+
+    def __getitem__(self, j):
+        if isinstance(j, slice):
+            return self.array.line_list(self.i)[j]
+        points = self.array[self.i]
+        return tuple(points[j].tolist())
+
+    def __setitem__(self, j, p):
+        self.array.set_point(self.i, j if j >= 0 else j + len(self), p)
+
+    def __iter__(self):
+        return iter(self.array.line_list(self.i))
+
+    def __eq__(self, other):
+        return self.array.line_list(self.i) == list(other)
+
+    def __repr__(self):
+        return repr(self.array.line_list(self.i))
+
+    def append(self, p):
+        if self.i != self.array.n_lines - 1:
+            raise IndexError("points are only appended to the last line")
+        self.array.append_point(p)
+
+    def pop(self):
+        """
+        :return: the last point, which is removed
+        """
+        if self.i != self.array.n_lines - 1:
+            raise IndexError("points are only popped from the last line")
+        p = self[-1]
+        self.array.pop_point()
+        return p
@@ -0,0 +1,82 @@
+from kivy.graphics import Color, Ellipse, InstructionGroup, Line
+
+
+class LineGroup(InstructionGroup):
+    """
+    LineGroup holds the drawing instructions of a single annotation line, the green Line joining the points
+    and a red Ellipse for each point. Keeping one group per line means a change to a line only touches that
+    line's instructions instead of rebuilding the whole canvas.
+
+    The points are in native image coordinates, zooming is done by a Scale on the Picture canvas. Only the
+    line width and point size are divided by the scale factor so they keep their size on screen.
+    """
+
+    def __init__(self, line, d, lw, scale_factor=1.0, **kwargs):
+        """
+        Build the instructions for a line.
+        :param line: the list of points (x, y) in native image coordinates
+        :param d: diameter of the drawn points in screen pixels
+        :param lw: width of the drawn line in screen pixels
+        :param scale_factor: how many fold the image is zoomed from native
+        """
+        super(LineGroup, self).__init__(**kwargs)
+        self.scale_factor = scale_factor
+        self.d = d
+        self.lw = lw
+        self.add(Color(0, 1, 0))
+        self.line = Line(points=[c for p in line for c in p], width=line_width(lw, scale_factor))
+        self.add(self.line)
+        self.add(Color(1, 0, 0))
+        self.ellipses = []
+        for p in line:
+            self.add_ellipse(p)
+
+    def add_ellipse(self, p):
+        r = self.d / self.scale_factor
+        ellipse = Ellipse(pos=(p[0] - r / 2, p[1] - r / 2), size=(r, r))
+        self.ellipses.append(ellipse)
+        self.add(ellipse)
+
+    def add_vertex(self, p):
+        """
+        append a point to the end of the line
+        :param p: the point (x, y) in native image coordinates
+        """
+        self.line.points = self.line.points + [p[0], p[1]]
+        self.add_ellipse(p)
+
+    def move_vertex(self, j, p):
+        """
+        move a point of the line
+        :param j: the index of the point
+        :param p: the point (x, y) in native image coordinates
+        """
+        points = self.line.points
+        points[2 * j:2 * j + 2] = [p[0], p[1]]
+        self.line.points = points
+        r = self.d / self.scale_factor
+        self.ellipses[j].pos = (p[0] - r / 2, p[1] - r / 2)
+
+    def set_scale_factor(self, sf):
+        """
+        resize the line width and the points so they keep their size on screen at a new zoom
+        :param sf: scale factor, if the image is 2x native size then sf = 2
+        """
+        if sf == self.scale_factor:
+            return
+        self.scale_factor = sf
+        self.line.width = line_width(self.lw, sf)
+        r = self.d / sf
+        points = self.line.points
+        for i, ellipse in enumerate(self.ellipses):
+            ellipse.pos = (points[2 * i] - r / 2, points[2 * i + 1] - r / 2)
+            ellipse.size = (r, r)
+
+
+def line_width(lw, sf):
+    """
+    the width to give a Line so it is lw wide on screen at scale factor sf
+    """
+    width = lw / sf
+    # kivy draws lines of width exactly 1.0 as 1 pixel GL lines that don't follow the Scale
+    return 1.001 if width == 1.0 else width
@@ -0,0 +1,147 @@
+"""
+Line masks
+==========
+
+Rasterization of annotated polylines into masks at the native resolution of their image, e.g. as targets
+for training a model to trace myofibrils.
+
+A pixel is covered by a line when its center is within width / 2 of one of the line's segments. With
+anti-aliasing the coverage ramps from 1 to 0 over the pixel straddling that distance, so a line drawn
+between pixels shows up as a soft edge instead of a staircase. A line of a single point is drawn as a dot.
+
+The binary mask holds the coverage of all the lines, the instance mask holds i + 1 on the pixels covered
+by line i (its index in the annotation file) and 0 elsewhere, a pixel covered by several lines goes to the
+nearest one.
+
+Everything runs vectorized over all the segments of an image. The segments are cut into pieces of at most
+PIECE pixels and every piece is expanded into the pixels of its bounding box grown by the width, so the
+number of pixels visited follows the length of the lines and not the area they span. Coordinates are the
+native annotation coordinates, x to the right and y up from the bottom of the image, unless y_up is False.
+"""
+import numpy as np
+
+from .LineArray import LineArray
+
+PIECE = 8.0  # the longest piece of a segment in pixels
+BATCH = 2 ** 22  # the most (piece, pixel) pairs evaluated at once, bounds the memory used
+
+
+def rasterize(lines, shape, width=3.0, antialias=True, y_up=True):
+    """
+    compute the coverage and instance labels of lines
+    :param lines: a LineArray or a list of lines of (x, y) points, as SarcomereLines.lines
+    :param shape: the (height, width) of the masks, the native size of the image
+    :param width: the width of the lines in pixels
+    :param antialias: ramp the coverage over the edge pixels, otherwise it is 0 or 1
+    :param y_up: y runs up from the bottom of the image, as in the annotation files
+    :return: (coverage, labels), (height, width) arrays of float32 in [0, 1] and of int32 line index + 1
+    """
+    height, n_cols = shape
+    coverage = np.zeros(height * n_cols, dtype=np.float32)
+    labels = np.zeros(height * n_cols, dtype=np.int32)
+    best = np.full(height * n_cols, np.inf, dtype=np.float32)  # distance to the nearest line within reach
+    a, b, line = segments(lines)
+    if len(a) == 0 or height == 0 or n_cols == 0:
+        return coverage.reshape(shape), labels.reshape(shape)
+    # to (column, row) pixel space, the center of pixel (r, c) is at (c, r)
+    flip = np.array([1.0, -1.0]) if y_up else np.array([1.0, 1.0])
+    offset = np.array([-0.5, height - 0.5]) if y_up else np.array([-0.5, -0.5])
+    a, b = a * flip + offset, b * flip + offset
+    a, b, line = split(a, b, line, PIECE)
+    half = 0.5 * width
+    reach = half + (0.5 if antialias else 0.0)
+    lo = np.floor(np.minimum(a, b) - reach).astype(np.int64) + 1
+    hi = np.ceil(np.maximum(a, b) + reach).astype(np.int64)
+    lo = np.maximum(lo, 0)
+    hi = np.minimum(hi, [n_cols, height])
+    box = hi - lo  # (columns, rows) of the pixels around each piece
+    keep = (box > 0).all(axis=1)
+    a, b, line, lo, box = a[keep], b[keep], line[keep], lo[keep], box[keep]
+    sizes = box[:, 0] * box[:, 1]
+    ends = np.cumsum(sizes)
+    first = 0
+    while first < len(sizes):  # in batches of pieces holding about BATCH pixels
+        last = max(int(np.searchsorted(ends, ends[first] - sizes[first] + BATCH, side='right')), first + 1)
+        sl = slice(first, last)
+        n = sizes[sl]
+        piece = np.repeat(np.arange(first, last), n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        col = lo[piece, 0] + k % box[piece, 0]
+        row = lo[piece, 1] + k // box[piece, 0]
+        d = point_segment_distances(col, row, a[piece], b[piece])
+        near = d <= reach
+        pixel, d, piece = row[near] * n_cols + col[near], d[near], piece[near]
+        cover = np.clip(half + 0.5 - d, 0.0, 1.0) if antialias else np.ones(len(d))
+        np.maximum.at(coverage, pixel, cover.astype(np.float32))
+        inside = d <= half
+        pixel, d, piece = pixel[inside], d[inside].astype(np.float32), piece[inside]
+        np.minimum.at(best, pixel, d)
+        won = d <= best[pixel]
+        labels[pixel[won]] = line[piece[won]] + 1
+        first = last
+    return coverage.reshape(shape), labels.reshape(shape)
+
+
+def binary_mask(lines, shape, width=3.0, antialias=True, y_up=True):
+    """
+    :return: the coverage of the lines as float32 if antialias, else as bool, see rasterize
+    """
+    coverage = rasterize(lines, shape, width, antialias, y_up)[0]
+    return coverage if antialias else coverage > 0
+
+
+def instance_mask(lines, shape, width=3.0, y_up=True):
+    """
+    :return: int32 array of line index + 1 on the pixels covered by each line, see rasterize
+    """
+    return rasterize(lines, shape, width, False, y_up)[1]
+
+
+def segments(lines):
+    """
+    :param lines: a LineArray or a list of lines of (x, y) points
+    :return: (a, b, line), (n, 2) arrays of the ends of the segments and the index of the line of each,
+    a line of a single point gives a segment from the point to itself
+    """
+    la = lines if isinstance(lines, LineArray) else LineArray.from_lines(lines)
+    coords = np.asarray(la.coords, dtype=np.float64)
+    offsets = np.asarray(la.offsets)
+    counts = np.diff(offsets)
+    point_line = np.repeat(np.arange(len(counts)), counts)
+    follows = np.nonzero(point_line[1:] == point_line[:-1])[0] + offsets[0]  # points followed by their line
+    dots = offsets[:-1][counts == 1]
+    start = np.concatenate([follows, dots]) - offsets[0]
+    end = np.concatenate([follows + 1, dots]) - offsets[0]
+    return coords[start], coords[end], point_line[start]
+
+
+def split(a, b, line, piece):
+    """
+    cut segments into pieces of at most piece long
+    :return: (a, b, line) of the pieces
+    """
+    length = np.sqrt(((b - a) ** 2).sum(axis=1))
+    n = np.maximum(np.ceil(length / piece).astype(np.int64), 1)
+    seg = np.repeat(np.arange(len(a)), n)
+    k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    t0 = (k / n[seg])[:, None]
+    t1 = ((k + 1) / n[seg])[:, None]
+    delta = b[seg] - a[seg]
+    return a[seg] + t0 * delta, a[seg] + t1 * delta, line[seg]
+
+
+def point_segment_distances(x, y, a, b):
+    """
+    vectorized distance from points to segments, see SegmentGrid.point_segment_dist
+    :param x: array of the x of the points
+    :param y: array of the y of the points
+    :param a: (n, 2) array of the first ends of the segments
+    :param b: (n, 2) array of the second ends
+    :return: array of the distances
+    """
+    dx, dy = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]
+    px, py = x - a[:, 0], y - a[:, 1]
+    len2 = dx * dx + dy * dy
+    t = np.clip((px * dx + py * dy) / np.where(len2 > 0, len2, 1.0), 0.0, 1.0)
+    ex, ey = px - t * dx, py - t * dy
+    return np.sqrt(ex * ex + ey * ey)
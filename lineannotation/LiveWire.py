@@ -0,0 +1,220 @@
+import heapq
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .ImageReader import read_image
+from .LRUCache import LRUCache
+from .PolylineSimplifier import PolylineSimplifier
+
+COST_FLOOR = 0.02  # the cost of the brightest pixels, keeps a detour along a ridge from being free
+COST_MAPS = LRUCache(512 * 2 ** 20)  # (fname, mtime_ns) -> cost map, shared by the pictures opened
+EXECUTOR = ThreadPoolExecutor(max_workers=1)  # computes the cost maps in the background
+ROUTER = ThreadPoolExecutor(max_workers=1)  # routes the clicked points, so a click doesn't wait on a cost map
+
+
+class LiveWire(object):
+    """LiveWire
+
+    Routes the path between two clicked points along the bright ridges of an image, so a line clicked
+    along a curved myofibril follows it instead of cutting across. The path is the cheapest one through
+    a cost map that is low on bright pixels (see cost_map), found by an A* search.
+
+    The cost map is computed once per image by a background thread and kept in COST_MAPS, so it is
+    computed while the image is being looked at and not again when the image is opened a second time.
+    Until it is ready route returns None and points are joined straight. The map covers the whole image,
+    4 bytes a pixel, so the editor doesn't snap on tiled images, and a map larger than COST_MAPS isn't
+    kept by it.
+
+    The search only visits the pixels within margin of the straight segment between the points, and
+    points further apart than max_length aren't routed at all, so routing a click takes about the same
+    time on a 4k image as on a small one. The editor routes through submit, on a thread of its own, so the
+    search doesn't hold up the touch handler either.
+    """
+
+    def __init__(self, fname, margin=16, max_length=512, executor=EXECUTOR, cache=COST_MAPS, router=ROUTER):
+        """
+        Start computing the cost map of an image, unless it is cached
+        :param fname: the image file
+        :param margin: how far in pixels a path may stray from the straight segment between its points
+        :param max_length: the longest distance in pixels between points that is routed
+        :param executor: runs the computation of the cost map
+        :param cache: the cache of cost maps
+        :param router: runs the routes given to submit
+        """
+        self.fname = fname
+        self.router = router
+        self.margin = margin
+        self.max_length = max_length
+        key = (os.path.abspath(fname), os.stat(fname).st_mtime_ns)
+        costs = cache.get(key)
+        if costs is not None:
+            self.future = None
+            self.costs = costs
+        else:
+            self.costs = None
+            self.future = executor.submit(cached_cost_map, fname, key, cache)
+
+    @property
+    def ready(self):
+        """
+        :return: True once the cost map is computed
+        """
+        return self.costs is not None or self.future.done()
+
+    def cost_map(self):
+        """
+        :return: the cost map, None while it is being computed
+        """
+        if self.costs is None and self.future.done():
+            self.costs = self.future.result()
+            self.future = None
+        return self.costs
+
+    def route(self, p0, p1):
+        """
+        find the path from p0 to p1 along the ridges of the image
+        :param p0: the point (x, y) the path starts from in native coordinates
+        :param p1: the point (x, y) the path ends at
+        :return: list of the points of the path after p0, ending with p1, or None if it can't be routed
+        """
+        costs = self.cost_map()
+        if costs is None or math.hypot(p1[0] - p0[0], p1[1] - p0[1]) > self.max_length:
+            return None
+        height = costs.shape[0]
+        pixels = shortest_path(costs, to_pixel(p0, height), to_pixel(p1, height), self.margin)
+        if pixels is None:
+            return None
+        simplifier = PolylineSimplifier(0.5)  # drops the staircase of the pixels, in bounded windows
+        kept = simplifier.add(tuple(p0))
+        for r, c in pixels[1:-1]:
+            kept.extend(simplifier.add((c + 0.5, height - r - 0.5)))
+        kept.extend(simplifier.add(tuple(p1)))
+        kept.extend(simplifier.finish())
+        return kept[1:]
+
+    def submit(self, p0, p1):
+        """
+        route the path from p0 to p1 in the background
+        :param p0: the point (x, y) the path starts from in native coordinates
+        :param p1: the point (x, y) the path ends at
+        :return: a future of what route returns
+        """
+        return self.router.submit(self.route, p0, p1)
+
+    def close(self):
+        """
+        stop waiting for the cost map, it is still cached if it was being computed
+        """
+        if self.future is not None:
+            self.future.cancel()
+
+
+def cost_map(image):
+    """
+    the cost of a path crossing each pixel, low on bright pixels. The image is smoothed a little so
+    the noise of single pixels doesn't steer the path, and its intensities are stretched between their
+    1st and 99th percentiles.
+    :param image: (height, width) or (height, width, channels) array, row 0 at the top
+    :return: (height, width) float32 array of costs between COST_FLOOR and 1 + COST_FLOOR
+    """
+    gray = np.asarray(image, dtype=np.float32)
+    if gray.ndim == 3:
+        gray = gray.mean(axis=2, dtype=np.float32)
+    for axis in (0, 1):  # a [1, 2, 1] / 4 blur along each axis
+        padded = np.concatenate([gray.take([0], axis), gray, gray.take([-1], axis)], axis)
+        n = gray.shape[axis]
+        gray = 0.25 * (padded.take(range(0, n), axis) + padded.take(range(2, n + 2), axis)) + 0.5 * gray
+    step = max(1, int(math.sqrt(gray.size / 1e6)))  # the percentiles of about a million pixels will do
+    lo, hi = np.percentile(gray[::step, ::step], (1, 99))
+    bright = np.clip((gray - lo) / max(hi - lo, 1e-6), 0.0, 1.0)
+    return (1.0 - bright) ** 2 + COST_FLOOR
+
+
+def cached_cost_map(fname, key, cache=COST_MAPS):
+    """
+    compute the cost map of an image file and cache it
+    :param fname: the image file
+    :param key: the key it is cached under
+    :param cache: the cache
+    :return: the cost map
+    """
+    costs = cost_map(read_image(fname))
+    cache.put(key, costs)
+    return costs
+
+
+def to_pixel(p, height):
+    """
+    :param p: a point (x, y) in native coordinates, y up
+    :param height: the height of the image
+    :return: (row, column) of the pixel holding the point, clipped to the image
+    """
+    return min(max(int(height - p[1]), 0), height - 1), max(int(p[0]), 0)
+
+
+def shortest_path(costs, start, goal, margin):
+    """
+    A* search for the cheapest 8-connected path between two pixels, stepping from one pixel to the next
+    costs the mean of their costs times the length of the step. Only pixels within margin of the straight
+    segment between start and goal are visited.
+    :param costs: (height, width) array of the costs of the pixels
+    :param start: (row, column) of the first pixel
+    :param goal: (row, column) of the last pixel
+    :param margin: the width in pixels of the corridor on either side of the segment
+    :return: list of the (row, column) of the pixels of the path, None if goal can't be reached
+    """
+    height, width = costs.shape
+    goal = (min(goal[0], height - 1), min(goal[1], width - 1))
+    start = (min(start[0], height - 1), min(start[1], width - 1))
+    r0 = max(min(start[0], goal[0]) - margin, 0)
+    c0 = max(min(start[1], goal[1]) - margin, 0)
+    r1 = min(max(start[0], goal[0]) + margin + 1, height)
+    c1 = min(max(start[1], goal[1]) + margin + 1, width)
+    sub = np.asarray(costs[r0:r1, c0:c1], dtype=np.float64)
+    w = c1 - c0
+    # the corridor, pixels further from the segment than margin are left out of the search
+    rows, cols = np.mgrid[r0:r1, c0:c1]
+    (ar, ac), (br, bc) = start, goal
+    dr, dc = br - ar, bc - ac
+    len2 = float(dr * dr + dc * dc)
+    t = np.clip(((rows - ar) * dr + (cols - ac) * dc) / len2, 0.0, 1.0) if len2 else 0.0
+    inside = (rows - ar - t * dr) ** 2 + (cols - ac - t * dc) ** 2 <= margin * margin
+    cost = np.where(inside, sub, np.inf).ravel().tolist()
+    floor = float(sub[inside].min())  # keeps the heuristic from overestimating
+    s = (start[0] - r0) * w + start[1] - c0
+    g = (goal[0] - r0) * w + goal[1] - c0
+    gr, gc = divmod(g, w)
+    steps = [(dr, dc, math.hypot(dr, dc)) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+    n_rows = r1 - r0
+    dist = {s: 0.0}
+    previous = {s: None}
+    heap = [(0.0, 0.0, s)]
+    while heap:
+        _, d, i = heapq.heappop(heap)
+        if i == g:
+            break
+        if d > dist[i]:
+            continue
+        r, c = divmod(i, w)
+        ci = cost[i]
+        for dr, dc, length in steps:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < n_rows and 0 <= nc < w:
+                j = nr * w + nc
+                nd = d + 0.5 * (ci + cost[j]) * length
+                if nd < dist.get(j, math.inf):
+                    dist[j] = nd
+                    previous[j] = i
+                    heapq.heappush(heap, (nd + floor * math.hypot(nr - gr, nc - gc), nd, j))
+    else:
+        return None
+    path = []
+    i = g
+    while i is not None:
+        r, c = divmod(i, w)
+        path.append((r + r0, c + c0))
+        i = previous[i]
+    return path[::-1]
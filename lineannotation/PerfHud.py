@@ -0,0 +1,43 @@
+from kivy.clock import Clock
+from kivy.uix.label import Label
+
+from .Timings import TIMINGS
+
+
+class PerfHud(Label):
+    """
+    PerfHud is an overlay listing the frame time and the p50 / p99 latency of each timed operation
+    (see Timings). It refreshes a couple of times a second while it is shown.
+    """
+
+    def __init__(self, timings=TIMINGS, interval=0.5, **kwargs):
+        """
+        :param timings: the Timings to show
+        :param interval: seconds between refreshes
+        """
+        kwargs.setdefault("font_name", "RobotoMono-Regular")
+        kwargs.setdefault("font_size", "12sp")
+        kwargs.setdefault("color", (1, 1, 0, 1))
+        kwargs.setdefault("halign", "left")
+        kwargs.setdefault("valign", "top")
+        super(PerfHud, self).__init__(**kwargs)
+        self.timings = timings
+        self.interval = interval
+        self.event = None
+        self.bind(size=self.setter("text_size"))
+
+    def start(self):
+        if self.event is None:
+            self.event = Clock.schedule_interval(self.refresh, self.interval)
+            self.refresh()
+
+    def stop(self):
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+
+    def refresh(self, *args):
+        rows = ["%-36s %6s %8s %8s" % ("ms", "n", "p50", "p99")]
+        for name, stats in sorted(self.timings.summary().items()):
+            rows.append("%-36s %6d %8.2f %8.2f" % (name, stats["count"], 1e3 * stats["p50"], 1e3 * stats["p99"]))
+        self.text = "\n".join(rows)
@@ -1,9 +1,28 @@
 from copy import deepcopy
-from kivy.graphics import Color, Ellipse, InstructionGroup, Line
+from kivy.clock import Clock
+from kivy.core.image import Image as CoreImage, ImageLoader
+from kivy.graphics import Color, InstructionGroup, Line, PopMatrix, PushMatrix, Rectangle, Scale
+from kivy.graphics.texture import Texture
 from kivy.properties import StringProperty
 from kivy.uix.image import Image
 
+from .AnnotationFile import annotation_name
+from .AnnotationWriter import AnnotationWriter
+from .ContrastLayer import ContrastLayer, bin_texture
+from .ContrastWindow import contrast_window
+from .ImagePyramid import ImagePyramid
+from .ImageReader import read_image
+from .LineGroup import LineGroup, line_width
+from .LiveWire import LiveWire
+from .PolylineSimplifier import PolylineSimplifier
+from .Prefetcher import Prefetcher
 from .SarcomereLines import SarcomereLines
+from .TileLayer import COLORFMTS, TileLayer
+from .Timings import timed
+
+FREEHAND_TOLERANCE = 1.5  # how far in screen pixels a freehand line may stray from the traced path
+VERTEX_PICK = 10  # how near in screen pixels a touch in modify mode has to be to a point to drag it
+PREFETCH_SLICES = 2  # how many slices of a stack either side of the one shown are decoded ahead
 
 
 class Picture(Image):
@@ -15,6 +34,41 @@ class Picture(Image):
     The source property will be the filename to show.
 
     The canvas is the object that takes drawing instructions, it's inherited from Image.
+    Each annotation line is drawn by its own LineGroup so edits only update the line they change.
+    Only the groups of lines that pass near the visible part of the picture are on the canvas, so the
+    cost of a frame follows what is on screen rather than the size of the annotation (see update_view).
+
+    Images too large for a single texture are shown tiled: instead of loading the source the Picture draws
+    a TileLayer under the lines that only decodes the tiles in view (see update_view).
+
+    The lines and tiles are drawn in native image coordinates under a Scale instruction, so zooming only
+    changes the Scale and the marker sizes of the lines on screen instead of recomputing every coordinate.
+
+    In freehand mode a line is traced by dragging instead of clicking point by point. The samples of the
+    drag are simplified as they arrive (see PolylineSimplifier) so only the points needed to follow the
+    path within FREEHAND_TOLERANCE are stored. Each move only extends the line being traced and moves the
+    segment from its last point to the latest sample.
+
+    With snapping on the path to a clicked point is routed by the LiveWire on a thread of its own. The
+    click is drawn straight at once and replaced by its path once it is routed (see place_routes), the
+    clicks are added in the order they were made and every other edit first waits for the clicks still
+    being routed.
+
+    In modify mode a touch near a point of a line drags that point. The point is found through the spatial
+    index of SarcomereLines and each move only changes that line's Line and the point's Ellipse, the move
+    is recorded and the file written once the touch is lifted.
+
+    A z-stack (see ImageStack) is shown a plane at a time, the slice and channel are stepped through with
+    step_slice and step_channel. The planes near the one shown are decoded ahead by a Prefetcher, so
+    stepping only uploads the plane into the texture, and the annotations switch to the lines of the slice
+    (see SarcomereLines.select_slice).
+
+    Stacks and high bit depth images are shown through a ContrastWindow, a window/level and gamma applied
+    by a lookup table, one per channel. Images of a single sample are drawn by a ContrastLayer, which keeps
+    their pixels on the GPU and looks them up in the table there, so a change of the window (see
+    set_contrast) only uploads the new table. The pixels of rgb images stay decoded in self.raw, or in the
+    pyramid of a tiled image, and are mapped through the table on the CPU instead. The changes of the
+    window are shown at most once a frame however fast the sliders send them.
     """
     do_rotation = False
     do_scale = True
@@ -24,45 +78,142 @@ class Picture(Image):
         """
         Construct Picture, and pass the working args to Image to load the image.
         Initialize things like the line annotations class that's associated with the image.
-        :param kwargs:
+        :param kwargs: tiled=True shows the source through an ImagePyramid instead of loading it,
+        native_size is the (width, height) of the image in pixels, preloaded is what preload() returned
+        for the source, if it was loaded ahead of time, stack is an ImageStack shown instead of the source,
+        deep=True shows a high bit depth source through a ContrastWindow.
         """
+        tiled = kwargs.pop("tiled", False)
+        deep = kwargs.pop("deep", False)
+        self.stack = kwargs.pop("stack", None)
+        self.native_size = kwargs.pop("native_size")
+        image, keep_points = kwargs.pop("preloaded", None) or (None, None)
+        self.image_path = kwargs["source"]
+        if tiled or image is not None or self.stack is not None or deep:
+            kwargs["source"] = ''
         super(Picture, self).__init__(**kwargs)
+        if image is not None and not deep:
+            self.texture = CoreImage(image).texture  # textures can only be made on the main thread
         self.allow_stretch = True
         self.keep_ratio = True
-        self.txt_name = kwargs["source"] + ".annot_txt"
-        self.keep_points = SarcomereLines(self.txt_name)
+        self.z = 0  # the slice and channel of the stack shown
+        self.channel = 0
+        self.z_step = 1  # the direction the slices were last stepped in, it is prefetched first
+        self.planes = None
+        self.raw = None  # the decoded pixels shown through the contrast
+        self.contrasts = {}  # channel -> the ContrastWindow it is shown through
+        self.layer = None  # draws the image when the Image widget doesn't, see show_layer
+        self.image_zoom = None  # the Scale the layer is drawn under
+        self.image_rect = None  # the Rectangle of the bins of the pixels in a ContrastLayer
+        self.render_trigger = Clock.create_trigger(lambda dt: self.render())
+        if self.stack is not None:
+            self.planes = Prefetcher(lambda key: self.stack.plane(*key), max_items=2 * PREFETCH_SLICES)
+        self.tiles = None
+        if tiled:
+            pyramid = ImagePyramid(self.image_path, keep_depth=deep)
+            shaded = deep and pyramid.samples == 1
+            if deep:
+                self.contrasts[0] = contrast_window(pyramid.sample())
+            self.tiles = TileLayer(pyramid, contrast=self.contrast, shaded=shaded)
+            self.show_layer(self.tiles, ContrastLayer(self.contrast) if shaded else InstructionGroup())
+        self.txt_name = annotation_name(self.image_path)
+        self.keep_points = keep_points or SarcomereLines(self.txt_name, journal=True, native_size=self.native_size)
+        self.keep_points.open_journal()  # preloaded lines are opened without one, see preload
+        if self.stack is not None:  # open at the slice the last session left off
+            self.z = min(self.keep_points.z, self.stack.n_slices - 1)
+            self.keep_points.select_slice(self.z)
+            self.show_plane()
+        elif deep and not tiled:
+            self.raw = image if image is not None else read_image(self.image_path)
+            self.contrasts[0] = contrast_window(self.raw)
+            self.upload()
+        # every edit is journaled straight away so the full file only needs writing now and then
+        self.writer = AnnotationWriter(self.keep_points, self.txt_name, interval=5.0)
         self._modify = False  # this toggles the edit state
+        self._freehand = False  # lines are traced by dragging
+        self.stroke = None  # (touch uid, PolylineSimplifier) of the freehand line being traced
+        self.drag = None  # (touch uid, line index, point index, where the point was) of the point dragged
+        self.routes = []  # (point, future of its path) of the clicked points being routed, in click order
         self.magic_point = None
-        self.instructions = None
-        self.highlight = None
+        self.zoom = Scale(1.0, 1.0, 1.0)  # maps native coordinates onto the zoomed picture
+        self.instructions = InstructionGroup()  # holds the groups of the lines that are shown
+        self.highlight = InstructionGroup()  # holds the highlighted line in modify mode
+        self.highlight_line = None
+        self.stroke_tail = Line(points=[])  # from the last point of the traced line to the latest sample
+        tail = InstructionGroup()
+        tail.add(Color(0, 1, 0))
+        tail.add(self.stroke_tail)
+        for instruction in (PushMatrix(), self.zoom, self.instructions, self.highlight, tail, PopMatrix()):
+            self.canvas.add(instruction)
+        self.groups = {}  # line key -> the LineGroup drawing the line, see SarcomereLines.keys
+        self.shown = set()  # keys of the lines whose groups are on the canvas
+        self.cull_rect = None  # native rect the shown lines were picked for, None shows all lines
         self.d = 5  # diameter of any point drawn
         self.lw = 2  # the width of drawn lines
         self.draw()
 
+    @timed("Picture.draw")
     def draw(self):
         """
            redraw all the lines and points
            :param canvas: the image canvas to draw on
            """
-        if self.instructions:
-            self.canvas.remove(self.instructions)
-        self.instructions = InstructionGroup()
-        for line in self.keep_points.lines:
-            if len(line) > 1:
-                self.instructions.add(Color(0, 1, 0))
-                self.instructions.add(
-                    Line(points=[c * self.keep_points.scale_factor for p in line for c in p],
-                         width=self.lw)
-                )
-            self.instructions.add(Color(1, 0, 0))
-            for p in line:
-                self.instructions.add(
-                    Ellipse(pos=(p[0] * self.keep_points.scale_factor - self.d / 2, p[1] *
-                                 self.keep_points.scale_factor - self.d / 2),
-                            size=(self.d, self.d))
-                )
-        self.canvas.add(self.instructions)
+        self.instructions.clear()
+        self.groups = {}
+        self.shown = set()
+        for key, line in zip(self.keep_points.keys, self.keep_points.lines):
+            self.groups[key] = LineGroup(line, self.d, self.lw, self.keep_points.scale_factor)
+        self.cull(self.cull_rect)
+
+    def add_group(self, key, line):
+        """
+        create the drawing instructions for a line and show them
+        :param key: the key of the line
+        :param line: the line to draw
+        """
+        self.groups[key] = LineGroup(line, self.d, self.lw, self.keep_points.scale_factor)
+        self.show_group(key)
+
+    def remove_group(self, key):
+        """
+        remove the drawing instructions of a line
+        :param key: the key of the line
+        """
+        group = self.groups.pop(key)
+        if key in self.shown:
+            self.shown.discard(key)
+            self.instructions.remove(group)
+
+    def show_group(self, key):
+        if key not in self.shown:
+            self.shown.add(key)
+            group = self.groups[key]
+            group.set_scale_factor(self.keep_points.scale_factor)  # hidden groups miss zoom changes
+            self.instructions.add(group)
+
+    def hide_group(self, key):
+        if key in self.shown:
+            self.shown.discard(key)
+            self.instructions.remove(self.groups[key])
 
+    def cull(self, rect):
+        """
+        put the groups of the lines near a rectangle on the canvas and take the others off
+        :param rect: (x0, y0, x1, y1) in native coordinates, None to show every line
+        """
+        self.cull_rect = rect
+        if rect is None:
+            wanted = set(self.groups)
+        else:
+            wanted = self.keep_points.keys_in_rect(*rect)
+            wanted.add(self.keep_points.keys[-1])  # the line being drawn is always shown
+        for key in self.shown - wanted:
+            self.hide_group(key)
+        for key in wanted - self.shown:
+            if key in self.groups:
+                self.show_group(key)
+
+    @timed("Picture.on_touch_down")
     def on_touch_down(self, touch):
         """
         This is a kivy hook. By defining this function on the Picture the picture
@@ -71,15 +222,358 @@ class Picture(Image):
         """
         if self._modify:
             self.magic_point = deepcopy(touch)
-            self.highlight_nearest(self.magic_point)
+            hit = self.keep_points.nearest_vertex(touch, VERTEX_PICK / self.keep_points.scale_factor)
+            if hit is not None:
+                i, j = hit
+                self.drag = (touch.uid, i, j, self.keep_points.lines[i][j])
+                self.draw_highlight(self.keep_points.lines[i])
+            else:
+                self.highlight_nearest(self.magic_point)
+        elif self._freehand:
+            self.start_stroke(touch)
         else:
-            self.keep_points.add_point(touch)
-            self.draw()
+            self.add_point(touch)
             self.write()
         return True
 
+    @timed("Picture.on_touch_move")
+    def on_touch_move(self, touch):
+        if self.stroke is not None and touch.uid == self.stroke[0]:
+            self.trace(touch)
+            return True
+        if self.drag is not None and touch.uid == self.drag[0]:
+            self.drag_point(touch)
+            return True
+        return super(Picture, self).on_touch_move(touch)
+
+    def on_touch_up(self, touch):
+        if self.stroke is not None and touch.uid == self.stroke[0]:
+            self.trace(touch)
+            self.finish_stroke()
+            return True
+        if self.drag is not None and touch.uid == self.drag[0]:
+            self.drag_point(touch)
+            self.finish_drag()
+            return True
+        return super(Picture, self).on_touch_up(touch)
+
+    def drag_point(self, touch):
+        """
+        move the point being dragged to the touch, only its line and marker are redrawn
+        :param touch: the touch, touch.pos are the picture coordinates
+        """
+        _, i, j, _ = self.drag
+        p = self.keep_points.map_point(touch)
+        self.keep_points.set_point(i, j, p)
+        self.groups[self.keep_points.keys[i]].move_vertex(j, p)
+        if self.highlight_line is not None:
+            points = self.highlight_line.points
+            points[2 * j:2 * j + 2] = [p[0], p[1]]
+            self.highlight_line.points = points
+
+    def finish_drag(self):
+        """
+        record where the dragged point ended up and write the file
+        """
+        _, i, j, start = self.drag
+        self.drag = None
+        end = self.keep_points.lines[i][j]
+        if end != start:
+            self.keep_points.move_point(i, j, end, old=start)
+            self.write()
+
+    def add_point(self, touch):
+        """
+        add a clicked point to the end of the last line and draw it, with the path routed to it if snapping
+        :param touch: the touch, touch.pos are the picture coordinates
+        """
+        snap = self.keep_points.snap
+        line = self.keep_points.lines[-1]
+        last = self.routes[-1][0] if self.routes else line[-1] if line else None
+        if snap is None or last is None:
+            n = len(line)
+            self.keep_points.add_point(touch)
+            key = self.keep_points.keys[-1]
+            for p in self.keep_points.lines[-1][n:]:
+                self.groups[key].add_vertex(p)
+            self.show_group(key)
+            return
+        p = self.keep_points.map_point(touch)
+        future = snap.submit(last, p)
+        self.routes.append((p, future))
+        future.add_done_callback(lambda f: Clock.schedule_once(lambda dt: self.place_routes()))
+        self.draw_routes()
+
+    def place_routes(self, wait=False):
+        """
+        add the clicked points whose paths are routed, in the order they were clicked
+        :param wait: wait for every click being routed, before another edit is made
+        """
+        placed = False
+        while self.routes and (wait or self.routes[0][1].done()):
+            p, future = self.routes.pop(0)
+            path = None if future.cancelled() or future.exception() is not None else future.result()
+            n = len(self.keep_points.lines[-1])
+            self.keep_points.add_routed(p, path)
+            key = self.keep_points.keys[-1]
+            for q in self.keep_points.lines[-1][n:]:
+                self.groups[key].add_vertex(q)
+            self.show_group(key)
+            placed = True
+        self.draw_routes()
+        if placed:
+            self.write()
+
+    def draw_routes(self):
+        """
+        draw the clicks being routed joined straight, from the end of the last line
+        """
+        line = self.keep_points.lines[-1]
+        points = [line[-1]] if line and self.routes else []
+        points.extend(p for p, _ in self.routes)
+        self.stroke_tail.width = line_width(self.lw, self.keep_points.scale_factor)
+        self.stroke_tail.points = [c for p in points for c in p] if len(points) > 1 else []
+
+    def add_vertex(self, p):
+        """
+        add a point to the end of the last line and draw it
+        :param p: the point (x, y) in native coordinates
+        """
+        self.keep_points.append_point(p)
+        key = self.keep_points.keys[-1]
+        self.groups[key].add_vertex(p)
+        self.show_group(key)
+
+    def start_stroke(self, touch):
+        """
+        start tracing a freehand line, every stroke makes a line of its own
+        :param touch: the touch down
+        """
+        if self.stroke is not None:
+            self.finish_stroke()  # its touch up was missed
+        self.end_line()
+        sf = self.keep_points.scale_factor
+        self.stroke = (touch.uid, PolylineSimplifier(FREEHAND_TOLERANCE / sf))
+        self.stroke_tail.width = line_width(self.lw, sf)
+        self.trace(touch)
+
+    def trace(self, touch):
+        """
+        extend the freehand line with a sample
+        :param touch: the touch, touch.pos are the picture coordinates
+        """
+        for p in self.stroke[1].add(self.keep_points.map_point(touch)):
+            self.add_vertex(p)
+        tail = self.stroke[1].tail
+        last = self.keep_points.lines[-1][-1]
+        self.stroke_tail.points = [last[0], last[1], tail[0], tail[1]] if tail else []
+
+    def finish_stroke(self):
+        """
+        end the freehand line being traced
+        """
+        for p in self.stroke[1].finish():
+            self.add_vertex(p)
+        self.stroke = None
+        self.stroke_tail.points = []
+        self.end_line()
+
+    @timed("Picture.show_plane")
+    def show_plane(self):
+        """
+        show the plane of the stack at self.z and self.channel and prefetch the planes near it, the contrast
+        of a channel is set from the histogram of the first plane of it shown
+        """
+        key = (self.z, self.channel)
+        plane = self.planes.take(key)
+        self.raw = plane if plane is not None else self.stack.plane(*key)
+        if self.channel not in self.contrasts:
+            self.contrasts[self.channel] = contrast_window(self.raw)
+        self.upload()
+        z, step = self.z, self.z_step
+        ahead = [z + d * step for k in range(1, PREFETCH_SLICES + 1) for d in (k, -k)]
+        self.planes.prefetch([(n, self.channel) for n in ahead if 0 <= n < self.stack.n_slices])
+
+    def show_layer(self, content, layer):
+        """
+        draw the image by instructions of its own, under the lines, instead of the Image widget's texture
+        :param content: the instructions drawing the image in native coordinates
+        :param layer: the ContrastLayer or InstructionGroup to draw them in
+        """
+        self.layer = layer
+        self.image_zoom = Scale(1.0, 1.0, 1.0)
+        for instruction in (Color(1, 1, 1), PushMatrix(), self.image_zoom, content, PopMatrix()):
+            layer.add(instruction)
+        self.canvas.add(layer)
+        self.color = (1, 1, 1, 0)  # the Image still draws a rectangle over the widget, hide it
+
+    def upload(self):
+        """
+        put the pixels of self.raw on the GPU and show them through the contrast. The bins of the pixels of a
+        single sample are uploaded for a ContrastLayer, rgb pixels are mapped through the contrast by render.
+        """
+        if self.raw.ndim == 2:
+            if self.layer is None:
+                self.image_rect = Rectangle(pos=(0, 0), size=self.native_size)
+                self.show_layer(self.image_rect, ContrastLayer(self.contrast))
+            self.image_rect.texture = bin_texture(self.contrast, self.raw, self.image_rect.texture)
+        self.render()
+
+    @timed("Picture.render")
+    def render(self):
+        """
+        show the pixels through the contrast. A ContrastLayer only needs the new lookup table, otherwise the
+        pixels are mapped through it into the texture, only the pixels are uploaded if the texture is
+        already there
+        """
+        if isinstance(self.layer, ContrastLayer):
+            self.layer.set_contrast(self.contrast)
+            return
+        if self.tiles is not None:
+            self.tiles.refresh()
+            return
+        pixels = self.contrast.apply(self.raw)
+        colorfmt = COLORFMTS[1 if pixels.ndim == 2 else pixels.shape[2]]
+        size = (pixels.shape[1], pixels.shape[0])
+        texture = self.texture
+        if texture is None or tuple(texture.size) != size or texture.colorfmt != colorfmt:
+            texture = Texture.create(size=size, colorfmt=colorfmt)
+            texture.flip_vertical()  # the rows run from the top, kivy's y runs up
+            self.texture = texture
+        texture.blit_buffer(pixels.tobytes(), colorfmt=colorfmt, bufferfmt='ubyte')
+        self.canvas.ask_update()
+
+    @property
+    def contrast(self):
+        """
+        :return: the ContrastWindow of the channel shown, None for an image shown as it is
+        """
+        return self.contrasts.get(self.channel)
+
+    def set_contrast(self, level, window, gamma):
+        """
+        set the window of the channel shown and show it
+        :param level: the level in fractions of the range of the values, see ContrastWindow.set_relative
+        :param window: the width of the window in fractions of the range of the values
+        :param gamma: the exponent of the curve
+        """
+        if self.contrast is None:
+            return
+        self.contrast.set_relative(level, window, gamma)
+        self.render_trigger()
+
+    def auto_contrast(self):
+        """
+        set the window of the channel shown from its histogram
+        """
+        if self.contrast is None:
+            return
+        self.contrast.auto()
+        self.render_trigger()
+
+    def set_slice(self, z):
+        """
+        show a slice of the stack and switch the annotations to its lines
+        :param z: the slice, clamped to the stack
+        """
+        z = min(max(z, 0), self.stack.n_slices - 1) if self.stack is not None else 0
+        if z == self.z:
+            return
+        if self.stroke is not None:
+            self.finish_stroke()
+        if self.drag is not None:
+            self.finish_drag()
+        self.place_routes(wait=True)
+        self.z_step = 1 if z > self.z else -1
+        self.z = z
+        self.show_plane()
+        self.keep_points.select_slice(z)
+        self.magic_point = None
+        self.draw_highlight(None)
+        self.draw()
+
+    def step_slice(self, step):
+        """
+        :param step: +1 for the next slice of the stack, -1 for the previous one
+        """
+        self.set_slice(self.z + step)
+
+    def step_channel(self):
+        """
+        show the next channel of the stack, the annotations are the same for every channel
+        """
+        if self.stack is None or self.stack.n_channels == 1:
+            return
+        self.channel = (self.channel + 1) % self.stack.n_channels
+        self.show_plane()
+
+    @property
+    def drags(self):
+        """
+        :return: True while dragging on the picture edits it, so the view mustn't scroll by dragging
+        """
+        return self._freehand or self._modify
+
+    def set_freehand(self, freehand):
+        """
+        switch between adding points by clicking and tracing lines by dragging
+        :param freehand: trace lines by dragging
+        """
+        if self.stroke is not None:
+            self.finish_stroke()
+        self.place_routes(wait=True)
+        self._freehand = freehand
+
+    def set_snap(self, snap):
+        """
+        switch routing the path between clicked points along the ridges of the image on or off, the cost
+        map of the image is computed in the background when it is switched on
+        :param snap: route the paths, stacks and tiled images aren't snapped, the cost map of the whole of an
+        image too large for a texture would take gigabytes
+        """
+        if snap and self.keep_points.snap is None and self.stack is None and self.tiles is None:
+            self.keep_points.snap = LiveWire(self.image_path)
+        elif not snap and self.keep_points.snap is not None:
+            self.place_routes(wait=True)
+            self.keep_points.snap.close()
+            self.keep_points.snap = None
+
+    @timed("Picture.write")
     def write(self):
-        self.keep_points.write_file(self.txt_name, self.size)
+        """
+        schedule the annotations to be written out by the background writer.
+        """
+        self.writer.mark_dirty(tuple(self.native_size))
+
+    def close(self):
+        """
+        write out any pending annotations, call this before the picture is discarded.
+        """
+        self.render_trigger.cancel()
+        self.set_snap(False)
+        self.writer.close()
+        self.keep_points.close()
+        if self.tiles:
+            self.tiles.close()
+        if self.stack is not None:
+            self.planes.close()
+            self.stack.close()
+
+    def update_view(self, rect):
+        """
+        called when the visible part of the picture changes, to show the tiles of a tiled image and the
+        lines that are in view. Lines are picked for the view grown by half its size on each side, so they
+        are only picked again once the view scrolls out of that margin.
+        :param rect: (x0, y0, x1, y1) of the visible part in the picture's (scaled) coordinates
+        """
+        sf = self.keep_points.scale_factor
+        x0, y0, x1, y1 = [c / sf for c in rect]
+        if self.tiles:
+            self.tiles.update((x0, y0, x1, y1), sf)
+        last = self.cull_rect
+        if last is None or x0 < last[0] or y0 < last[1] or x1 > last[2] or y1 > last[3]:
+            mx, my = (x1 - x0) / 2, (y1 - y0) / 2
+            self.cull((x0 - mx, y0 - my, x1 + mx, y1 + my))
 
     def highlight_nearest(self, point):
         """
@@ -96,31 +590,54 @@ class Picture(Image):
         draw the selected line in yellow to highlight it and allow the user to decide if they want to remove it.
         :param line: the line that was selected
         """
-        if self.highlight:
-            self.canvas.remove(self.highlight)
-            self.highlight = None
+        self.highlight.clear()
+        self.highlight_line = None
         if line:
-            self.highlight = InstructionGroup()
+            self.highlight_line = Line(points=[c for p in line for c in p],
+                                       width=line_width(self.lw, self.keep_points.scale_factor))
             self.highlight.add(Color(1, 1, 0))
-            self.highlight.add(
-                Line(points=[c * self.keep_points.scale_factor for p in line for c in p],
-                     width=self.lw)
-            )
-            self.canvas.add(self.highlight)
+            self.highlight.add(self.highlight_line)
 
     def undo_last(self):
         """
-        undo_last clears the last action be it ending the line or a point added to the last line.
+        undo_last reverses the last edit, be it a point added or moved, a line ended or a line removed.
         """
-        self.keep_points.undo_last()
-        self.draw()
+        if self.drag is not None:
+            self.finish_drag()
+        self.place_routes(wait=True)
+        self.update_groups(self.keep_points.undo_last())
+        self.write()
+
+    def redo(self):
+        """
+        redo the last edit undone by undo_last.
+        """
+        if self.drag is not None:
+            self.finish_drag()
+        self.place_routes(wait=True)
+        self.update_groups(self.keep_points.redo())
         self.write()
 
+    def update_groups(self, changed):
+        """
+        rebuild the drawing instructions of only the lines an undo or redo changed
+        :param changed: list of (key, line) of the changed lines, line is None for a line that was removed
+        """
+        for key, line in changed:
+            if key in self.groups:
+                self.remove_group(key)
+            if line is not None:
+                self.add_group(key, line)
+
     def end_line(self):
         """
         end the line by inserting an empty line at the end of the list.
         """
+        self.place_routes(wait=True)
         self.keep_points.end_line()
+        key = self.keep_points.keys[-1]
+        if key not in self.groups:
+            self.add_group(key, self.keep_points.lines[-1])
         self.write()
 
     def toggle_modify(self):
@@ -129,27 +646,65 @@ class Picture(Image):
         it will remove the line from the annotation list. If 'm' or the modify button are struck
         then it cancels out of the mode.
         """
+        if self.drag is not None:
+            self.finish_drag()
+        self.place_routes(wait=True)
         self._modify = not self._modify
         self.draw_highlight(None)
-        self.draw()
 
     def set_remove(self):
         """
-        Removes the line nearest the point selected, exits edit mode, and redraws the canvas.
+        Removes the line nearest the point selected, exits edit mode, and removes the line from the canvas.
         """
-        if self._modify:
-            self.keep_points.remove_nearest(self.magic_point, self.canvas)
-            self.canvas.remove(self.highlight)
-            self.highlight = None
+        if self.drag is not None:
+            self.finish_drag()
+        if self._modify and self.magic_point is not None:
+            keep_points = self.keep_points
+            if not (len(keep_points.lines) == 1 and len(keep_points.lines[0]) == 0):
+                i, r_line = keep_points.select_nearest_line(self.magic_point)
+                key = keep_points.keys[i]
+                keep_points.remove_line(i)
+                self.remove_group(key)
+                if keep_points.keys[-1] not in self.groups:
+                    self.add_group(keep_points.keys[-1], keep_points.lines[-1])
             self.toggle_modify()
-        self.draw()
-        self.write()
+            self.write()
 
+    @timed("Picture.set_scale_factor")
     def set_scale_factor(self, sf):
         """
-        pass the scale factor through to the line annotations class so that it can scale the lines appropriately to
-        the figure scaling.
+        pass the scale factor through to the line annotations class so that it can map touches to native
+        coordinates, and set the Scale the lines and tiles are drawn under. Only the lines on the canvas have
+        their marker sizes updated, the others are updated when they are shown.
         :param sf: scale factor, ie if the figure is 2x larger than the native image then sf=2
         """
         self.keep_points.set_scale_factor(sf)
-        self.draw()
+        for zoom in (self.zoom, self.image_zoom):
+            if zoom is not None:
+                zoom.x = zoom.y = sf
+        for key in self.shown:
+            self.groups[key].set_scale_factor(sf)
+        if self.highlight_line:
+            self.highlight_line.width = line_width(self.lw, sf)
+        self.stroke_tail.width = line_width(self.lw, sf)
+
+
+def preload(path, native_size, tiled=False, stack=False, deep=False):
+    """
+    do the slow part of opening a Picture, decoding the image and reading its annotations, so it can be done
+    ahead of time off the main thread.
+    :param path: the image path
+    :param native_size: the (width, height) of the image in pixels
+    :param tiled: the image will be shown tiled, tiles are decoded as they are shown so only the annotations
+    are read
+    :param stack: the image is a stack, its planes are decoded as they are shown
+    :param deep: the image has a high bit depth, it is read with read_image
+    :return: the preloaded argument of Picture
+    """
+    image = None
+    if deep and not (tiled or stack):
+        image = read_image(path)
+    elif not (tiled or stack):
+        image = ImageLoader.load(path, keep_data=True, nocache=True)
+    # the journal is opened once the Picture is shown, until then nothing is written for an image passed by
+    return image, SarcomereLines(annotation_name(path), journal=True, native_size=native_size, defer_journal=True)
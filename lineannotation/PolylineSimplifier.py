@@ -0,0 +1,64 @@
+from .SegmentGrid import point_segment_dist
+
+
+class PolylineSimplifier(object):
+    """PolylineSimplifier
+
+    Simplifies a stream of points, like the touch samples of a freehand stroke, as they arrive. It is the
+    sliding window form of Douglas-Peucker: the samples since the last kept point form a window, and a new
+    sample extends the window as long as every sample in it stays within tolerance of the straight segment
+    from the last kept point to the new sample. When it doesn't, the previous sample is kept as a vertex and
+    the window starts again from it. So the kept polyline never strays more than tolerance from the
+    samples, while a smooth stroke keeps only a few vertices.
+
+    The window is capped at max_window samples so the work per sample stays bounded however straight the
+    stroke is.
+    """
+
+    def __init__(self, tolerance=1.0, max_window=64):
+        """
+        :param tolerance: the largest distance allowed between a sample and the simplified polyline
+        :param max_window: the most samples waiting for a decision
+        """
+        self.tolerance = tolerance
+        self.max_window = max_window
+        self.anchor = None  # the last kept point
+        self.window = []  # the samples since the anchor
+
+    @property
+    def tail(self):
+        """
+        :return: the latest sample if it isn't kept yet, the provisional end of the polyline, else None
+        """
+        return self.window[-1] if self.window else None
+
+    def add(self, p):
+        """
+        take the next sample
+        :param p: the sample (x, y)
+        :return: list of the points kept because of it, usually empty
+        """
+        if self.anchor is None:
+            self.anchor = p
+            return [p]
+        if p == (self.window[-1] if self.window else self.anchor):
+            return []
+        if len(self.window) < self.max_window and all(
+                point_segment_dist(q, self.anchor, p) <= self.tolerance for q in self.window):
+            self.window.append(p)
+            return []
+        kept = self.window[-1]
+        self.anchor = kept
+        self.window = [p]
+        return [kept]
+
+    def finish(self):
+        """
+        end the stream, keeping the last sample
+        :return: list of the points kept
+        """
+        kept = self.window[-1:]
+        if kept:
+            self.anchor = kept[0]
+        self.window = []
+        return kept
@@ -0,0 +1,107 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .LRUCache import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+class Prefetcher(object):
+    """
+    Prefetcher loads items ahead of time on a background thread, so that by the time an item is asked for
+    it is usually ready. The editor uses it to load the images next to the open one in the folder.
+
+    prefetch() names the items that will likely be wanted next, anything else still queued is cancelled
+    and anything else already loaded is discarded. take() hands a loaded item over and forgets it. Loaded
+    items are held in an LRU cache capped at max_items, discarded items are passed to the discard function
+    so they can release what they hold.
+    """
+
+    def __init__(self, load, discard=None, max_items=2, workers=1):
+        """
+        Start the loading threads
+        :param load: function of a key returning the loaded item, it runs on a loading thread
+        :param discard: optional function called with each loaded item that is dropped without being taken
+        :param max_items: the number of loaded items kept
+        :param workers: the number of loading threads
+        """
+        self.load = load
+        self.discard = discard
+        self.cache = LRUCache(max_items, sizeof=lambda item: 1, on_evict=self._evicted)
+        self.pending = {}  # key -> future of the items being loaded
+        self.handed = set()  # futures taken while loading, their items belong to the caller
+        self.lock = threading.RLock()  # reentrant as a done callback runs at once if the load already finished
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def prefetch(self, keys):
+        """
+        load items in the background, in the order given
+        :param keys: the keys of the items wanted next
+        """
+        keys = list(keys)
+        with self.lock:
+            for key in [key for key in self.pending if key not in keys]:
+                self.pending.pop(key).cancel()  # one that can't be cancelled is dropped when it is loaded
+        for key in [key for key in self.cache.keys() if key not in keys]:
+            self._drop(self.cache.pop(key))
+        with self.lock:
+            for key in keys:
+                if key in self.pending or key in self.cache:
+                    continue
+                future = self.executor.submit(self.load, key)
+                self.pending[key] = future
+                future.add_done_callback(lambda f, key=key: self._loaded(key, f))
+
+    def take(self, key):
+        """
+        hand over a prefetched item, waiting for it if it is being loaded right now
+        :param key: the key of the item
+        :return: the item or None if it wasn't prefetched, or failed to load
+        """
+        with self.lock:
+            future = self.pending.pop(key, None)
+            if future is None:
+                return self.cache.pop(key)
+            if future.cancel():  # still queued, the caller is quicker loading it
+                return None
+            self.handed.add(future)
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def close(self):
+        """
+        stop loading and discard every loaded item
+        """
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+        self.executor.shutdown(wait=True)
+        for key in self.cache.keys():
+            self._drop(self.cache.pop(key))
+
+    def _loaded(self, key, future):
+        if future.cancelled():
+            return
+        with self.lock:
+            if future in self.handed:
+                self.handed.discard(future)
+                return
+            wanted = self.pending.get(key) is future
+            if wanted:
+                del self.pending[key]
+                if future.exception() is None:
+                    self.cache.put(key, future.result())
+        if future.exception() is not None:
+            log.warning("prefetching %s failed: %s", key, future.exception())
+        elif not wanted:
+            self._drop(future.result())
+
+    def _evicted(self, key, item):
+        self._drop(item)
+
+    def _drop(self, item):
+        if item is not None and self.discard:
+            self.discard(item)
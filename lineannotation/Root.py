@@ -1,35 +1,74 @@
-from kivy.core.window import Window
+from kivy.clock import Clock
 from kivy.logger import Logger
 from kivy.properties import ObjectProperty
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.popup import Popup
-from math import pow
+from math import log2, pow
 import os
 
+from .AnnotationStore import AnnotationStore
+from .ImageReader import image_dtype, image_size, list_images
+from .ImageStack import open_stack
 from .LoadDialog import LoadDialog
-from .Picture import Picture
+from .PerfHud import PerfHud
+from .Picture import Picture, preload
+from .Prefetcher import Prefetcher
+from .Timings import TIMINGS, timed
 from .XYScroll import XYScroll
 
+TILE_THRESHOLD = 4096  # images with a side longer than this are shown tiled
+
 
 class Root(FloatLayout):
     """
     Root is the object that get's created in the application window.
     It's the master object from which others get created.
     This object is tied to the editor.kv as well where view parameters get set.
+
+    The images of the open picture's folder can be stepped through with next_picture and previous_picture.
+    The images either side of the open one are loaded in the background meanwhile, so stepping to them
+    doesn't wait on decoding the image or reading its annotations.
+
+    The hot paths are timed once timing is started (see Timings), toggle_hud shows their latencies.
+
+    toggle_freehand switches to tracing lines by dragging. In freehand and modify mode, where dragging
+    edits the lines, scrolling by dragging is off, the scroll bars and zoom still work. toggle_snap routes the
+    path between clicked points along the ridges of the image (see LiveWire), except on stacks and tiled
+    images.
+
+    Multi-channel z-stacks are shown a plane at a time, next_slice, previous_slice and next_channel step
+    through them.
+
+    Stacks and high bit depth images are shown through a window/level and gamma (see ContrastWindow) set
+    with the contrast sliders, auto_contrast sets the window from the histogram of the image.
+
+    With JS_STORE set the annotations are also written through to that AnnotationStore.
     """
     picture = None
     loadfile = ObjectProperty(None)
     savefile = ObjectProperty(None)
     clearline = ObjectProperty(None)
-    Window.size = (1024, 1074)
+
+    syncing = False  # the contrast sliders are being set from the picture
 
     def __init__(self, **kwargs):
+        from kivy.core.window import Window  # importing it opens the window, so not before a Root is made
         super(Root, self).__init__(**kwargs)
+        Window.size = (1024, 1074)
         Window.bind(on_keyboard=self._on_keyboard_handler)  # this binds the keyboard input to the member function
         self.__popup = None
         self.js_x_size = 2048
         self.js_y_size = 2048
         self.scale_value = 1
+        self.images = []  # the images in the folder of the open picture
+        self.prefetcher = Prefetcher(self.preload, discard=lambda preloaded: preloaded[1].close())
+        self.hud = None  # the latency overlay when shown
+        self.frame_event = None
+        self.freehand = False  # lines are traced by dragging
+        self.snap = False  # paths between clicked points follow the ridges of the image
+        self.store = None  # the AnnotationStore the annotations are written through to
+        if os.environ.get('JS_STORE', None):
+            self.store = AnnotationStore(os.path.expanduser(os.environ.get('JS_STORE')))
         if os.environ.get('JS_FILEPATH', None):
             fname = os.environ.get('JS_FILEPATH')
             fname = os.path.expanduser(fname)
@@ -52,32 +91,174 @@ class Root(FloatLayout):
         pos = (self.scale_value*self.js_x_size, self.scale_value*self.js_y_size)
         return pos
 
+    @timed("Root.add_picture")
     def add_picture(self, path):
         """
         load the Image inside a scrollview and attach it to the root object ( this class)
         :param path: image path
         """
         filename = path
+        sv = l_picture = None
         try:
             if self.picture is not None:
+                self.picture.close()
                 self.remove_widget(self.picture.parent)
-            # load the image
+                self.picture = None
+            # load the image, it may have been loaded ahead of time
+            self.js_x_size, self.js_y_size = image_size(filename)
+            stack = open_stack(filename)
+            deep = stack is None and image_dtype(filename) != 'uint8'
+            preloaded = self.prefetcher.take(filename)
             sv = XYScroll(size_hint=(0.9, 0.9), pos_hint={'top': 0.975, 'right': 0.95}, bar_width='10dp')
-            sv.do_scroll_x = True
-            sv.do_scroll_y = True
-            l_picture = Picture(source=filename, size=(self.js_size()), size_hint=(None, None))
+            sv.do_scroll_x = not self.freehand
+            sv.do_scroll_y = not self.freehand
+            l_picture = Picture(source=filename, size=(self.js_size()), size_hint=(None, None),
+                                native_size=(self.js_x_size, self.js_y_size),
+                                tiled=stack is None and max(self.js_x_size, self.js_y_size) > TILE_THRESHOLD,
+                                preloaded=preloaded, stack=stack, deep=deep)
+            l_picture.set_scale_factor(self.scale_value)
+            l_picture.set_freehand(self.freehand)
+            l_picture.set_snap(self.snap)
+            l_picture.keep_points.store = self.store
             # add to the main field
             sv.add_widget(l_picture)  # add the picture to the scrollview
             self.add_widget(sv)      # add the scrollview to the Root Canvas
+            if self.hud is not None:  # keep the overlay above the new picture
+                self.remove_widget(self.hud)
+                self.add_widget(self.hud)
             self.picture = l_picture  # hold on to picture object to pass messages
+            sv.zoom_callback = self.zoom_at
+            sv.bind(scroll_x=self.update_view, scroll_y=self.update_view, size=self.update_view)
+            l_picture.bind(size=self.update_view)
+            self.update_view()
+            if 'level' in self.ids:
+                self.sync_contrast()
+            else:  # opened from __init__, before the kv rule made the sliders
+                Clock.schedule_once(lambda dt: self.sync_contrast())
+            self.prefetch_neighbours(filename)
 
         except Exception as e:
             Logger.exception('Pictures: Unable to load <%s>' % filename)
+            if l_picture is not None:  # don't leave its writer running or the half made view attached
+                l_picture.close()
+            if sv is not None and sv.parent is self:
+                self.remove_widget(sv)
             self.picture = None
 
+    def preload(self, path):
+        """
+        load a picture ahead of time, runs on the prefetcher's thread
+        :param path: image path
+        :return: the preloaded argument of Picture
+        """
+        width, height = image_size(path)
+        stack = open_stack(path)
+        if stack is not None:
+            stack.close()
+        return preload(path, (width, height), tiled=stack is None and max(width, height) > TILE_THRESHOLD,
+                       stack=stack is not None, deep=stack is None and image_dtype(path) != 'uint8')
+
+    def neighbour(self, path, step):
+        """
+        :param path: image path
+        :param step: +1 for the next image in the folder, -1 for the previous one
+        :return: the path of the neighbouring image or None at the ends of the folder
+        """
+        path = os.path.abspath(path)
+        if path not in self.images:
+            self.images = list_images(os.path.dirname(path))
+            if path not in self.images:
+                return None
+        i = self.images.index(path) + step
+        return self.images[i] if 0 <= i < len(self.images) else None
+
+    def prefetch_neighbours(self, path):
+        """
+        start loading the images either side of path in the background
+        :param path: image path
+        """
+        neighbours = [self.neighbour(path, step) for step in (1, -1)]
+        self.prefetcher.prefetch([p for p in neighbours if p is not None])
+
+    def step_picture(self, step):
+        if self.picture is None: return
+        path = self.neighbour(self.picture.image_path, step)
+        if path is not None:
+            self.add_picture(path)
+
+    def next_picture(self):
+        self.step_picture(1)
+
+    def previous_picture(self):
+        self.step_picture(-1)
+
+    def next_slice(self):
+        if self.picture is None: return
+        self.picture.step_slice(1)
+
+    def previous_slice(self):
+        if self.picture is None: return
+        self.picture.step_slice(-1)
+
+    def next_channel(self):
+        if self.picture is None: return
+        self.picture.step_channel()
+        self.sync_contrast()
+
+    def update_contrast(self):
+        """
+        show the picture through the window set by the contrast sliders, bound to the sliders moving
+        """
+        if self.picture is None or self.syncing: return
+        self.picture.set_contrast(self.ids.level.value, self.ids.window.value, pow(2.0, self.ids.gamma.value))
+
+    def auto_contrast(self):
+        """
+        set the window of the picture from its histogram
+        """
+        if self.picture is None: return
+        self.picture.auto_contrast()
+        self.sync_contrast()
+
+    def sync_contrast(self):
+        """
+        move the contrast sliders to the window of the picture, without setting it again
+        """
+        contrast = self.picture.contrast if self.picture is not None else None
+        if contrast is None or 'level' not in self.ids:  # no sliders (yet)
+            return
+        level, window = contrast.relative()
+        self.syncing = True
+        try:
+            self.ids.level.value = min(max(level, self.ids.level.min), self.ids.level.max)
+            self.ids.window.value = min(max(window, self.ids.window.min), self.ids.window.max)
+            self.ids.gamma.value = log2(contrast.gamma)
+        finally:
+            self.syncing = False
+
+    def update_view(self, *args):
+        """
+        tell the picture which part of it is visible, bound to the scrolling and size of the view
+        """
+        if self.picture is None or self.picture.parent is None:
+            return
+        rect = self.picture.parent.visible_rect()
+        if rect:
+            self.picture.update_view(rect)
+
     def on_pause(self):
         return True
 
+    def close(self):
+        """
+        flush the annotations of the open picture, called when the application stops.
+        """
+        if self.picture is not None:
+            self.picture.close()
+        self.prefetcher.close()
+        if self.store is not None:
+            self.store.close()
+
     def dismiss_popup(self):
         self._popup.dismiss()
 
@@ -99,13 +280,71 @@ class Root(FloatLayout):
         if self.picture is None: return
         self.picture.undo_last()
 
+    def redo(self):
+        if self.picture is None: return
+        self.picture.redo()
+
     def toggle_modify(self):
         if self.picture is None: return
         self.picture.toggle_modify()
+        self.update_scrolling()
+
+    def toggle_freehand(self):
+        """
+        switch between adding points by clicking and tracing lines by dragging
+        """
+        self.freehand = not self.freehand
+        if self.picture is None: return
+        self.picture.set_freehand(self.freehand)
+        self.update_scrolling()
+
+    def update_scrolling(self):
+        """
+        scroll by dragging only while dragging doesn't edit the picture, the scroll bars always work
+        """
+        sv = self.picture.parent
+        sv.do_scroll_x = not self.picture.drags
+        sv.do_scroll_y = not self.picture.drags
+
+    def toggle_snap(self):
+        """
+        switch snapping the paths between clicked points to the ridges of the image on or off
+        """
+        self.snap = not self.snap
+        if self.picture is None: return
+        self.picture.set_snap(self.snap)
 
     def set_remove(self):
+        if self.picture is None: return
         self.picture.set_remove()
+        self.update_scrolling()
 
+    def start_timing(self):
+        """
+        time the hot paths and every frame from now on
+        """
+        TIMINGS.enabled = True
+        if self.frame_event is None:
+            self.frame_event = Clock.schedule_interval(self.record_frame, 0)
+
+    def record_frame(self, dt):
+        TIMINGS.add("frame", dt)
+
+    def toggle_hud(self):
+        """
+        show or hide the latency overlay, showing it starts the timing
+        """
+        if self.hud is None:
+            self.start_timing()
+            self.hud = PerfHud(size_hint=(0.6, 0.4), pos_hint={'x': 0.06, 'top': 0.97})
+            self.add_widget(self.hud)
+            self.hud.start()
+        else:
+            self.hud.stop()
+            self.remove_widget(self.hud)
+            self.hud = None
+
+    @timed("Root.update_zoom")
     def update_zoom(self):
         cval = self.ids.zoomer.value
         fval = pow(2.0, float(cval))
@@ -114,6 +353,27 @@ class Root(FloatLayout):
             self.picture.set_scale_factor(fval)
         return True
 
+    def zoom_at(self, factor, anchor):
+        """
+        zoom by a factor keeping the point under the cursor in place, used by the scroll wheel and pinch.
+        :param factor: the change in zoom, more than 1 zooms in
+        :param anchor: the (x, y) of the cursor in the picture's (scaled) coordinates
+        """
+        if self.picture is None:
+            return
+        zoomer = self.ids.zoomer
+        sv = self.picture.parent
+        view = sv.visible_rect()
+        old = self.scale_value
+        zoomer.value = min(max(zoomer.value + log2(factor), zoomer.min), zoomer.max)
+        self.update_zoom()
+        new = self.scale_value
+        for axis, scroll in ((0, 'scroll_x'), (1, 'scroll_y')):
+            extent = self.picture.size[axis] - sv.size[axis]
+            if extent > 0:
+                start = anchor[axis] * new / old - (anchor[axis] - view[axis])
+                setattr(sv, scroll, min(max(start / extent, 0.0), 1.0))
+
     def zoom_up(self):
         if self.picture:
             self.ids.zoomer.value += 1
@@ -132,10 +392,20 @@ class Root(FloatLayout):
         ktofunc = {
             'e': self.end_line,
             'z': self.undo_last,
+            'y': self.redo,
             'm': self.toggle_modify,
+            'f': self.toggle_freehand,
+            's': self.toggle_snap,
             'r': self.set_remove,
             '=': self.zoom_up,
-            '-': self.zoom_down
+            '-': self.zoom_down,
+            'n': self.next_picture,
+            'p': self.previous_picture,
+            '.': self.next_slice,
+            ',': self.previous_slice,
+            'c': self.next_channel,
+            'a': self.auto_contrast,
+            'h': self.toggle_hud
         }
         func = ktofunc.get(modifier, None)
         if func:
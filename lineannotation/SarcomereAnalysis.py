@@ -0,0 +1,276 @@
+"""
+Sarcomere length analysis
+=========================
+
+Headless estimation of sarcomere spacing along annotated myofibrils. The annotated polylines of an image are
+resampled at a fixed step along their length, the image intensity is sampled across a strip perpendicular
+to each polyline by bilinear interpolation and averaged into an intensity profile per line. The spacing of
+the periodic banding is then estimated from the autocorrelation of each profile (computed with an FFT) and
+from the distances between successive intensity peaks.
+
+Everything runs vectorized over all the lines of an image at once, there are no loops over points.
+Coordinates are the native annotation coordinates, x to the right and y up from the bottom of the image.
+"""
+import numpy as np
+
+from .AnnotationFile import annotation_name
+from .ImageReader import read_image
+from .LineArray import LineArray
+
+CHUNK = 16384  # samples interpolated at a time
+
+
+def resample(lines, step=1.0):
+    """
+    place samples at a fixed arc length step along every line
+    :param lines: a LineArray
+    :param step: the distance between samples in pixels
+    :return: (positions (n, 2), unit tangents (n, 2), line id of each sample (n,))
+    """
+    starts, ends, ids = lines.segments()
+    if len(ids) == 0:
+        return np.empty((0, 2)), np.empty((0, 2)), np.empty(0, dtype=np.int64)
+    delta = ends - starts
+    seg_len = np.hypot(delta[:, 0], delta[:, 1])
+    seg_end = np.cumsum(seg_len)  # arc length at the end of each segment, running over all the lines
+    first = np.searchsorted(ids, np.arange(lines.n_lines), side='left')
+    last = np.searchsorted(ids, np.arange(lines.n_lines), side='right') - 1
+    has_segments = last >= first
+    line_idx = np.nonzero(has_segments)[0]
+    base = seg_end[first[line_idx]] - seg_len[first[line_idx]]  # arc length where each line starts
+    length = seg_end[last[line_idx]] - base
+    counts = np.floor(length / step).astype(np.int64) + 1
+    sample_line = np.repeat(line_idx, counts)
+    block_start = np.repeat(np.cumsum(counts) - counts, counts)
+    s = (np.arange(counts.sum()) - block_start) * step + np.repeat(base, counts)
+    seg = np.searchsorted(seg_end, s, side='right')
+    seg = np.clip(seg, first[sample_line], last[sample_line])
+    safe_len = np.where(seg_len > 0, seg_len, 1.0)
+    t = np.clip((s - (seg_end[seg] - seg_len[seg])) / safe_len[seg], 0.0, 1.0)
+    positions = starts[seg] + t[:, None] * delta[seg]
+    tangents = delta[seg] / safe_len[seg][:, None]
+    return positions, tangents, sample_line
+
+
+def bilinear(image, x, y):
+    """
+    interpolate an image at annotation coordinates, points outside are clamped to the edge
+    :param image: (height, width) array, row 0 at the top
+    :param x: array of x coordinates
+    :param y: array of y coordinates, y up from the bottom of the image
+    :return: array of interpolated intensities shaped like x
+    """
+    height, width = image.shape[:2]
+    col = np.clip(np.asarray(x, dtype=np.float32) - 0.5, 0.0, width - 1.0)  # pixel centers are at half pixels
+    row = np.clip(height - np.asarray(y, dtype=np.float32) - 0.5, 0.0, height - 1.0)
+    c0 = np.minimum(col.astype(np.int64), max(width - 2, 0))
+    r0 = np.minimum(row.astype(np.int64), max(height - 2, 0))
+    fc = col - c0
+    fr = row - r0
+    # gather the four neighbours by indexing rows and columns, only the pixels around the points are read so
+    # neither a memory-mapped image nor a strided view of one channel is copied whole
+    c1 = c0 + (1 if width > 1 else 0)
+    r1 = r0 + (1 if height > 1 else 0)
+    top = image[r0, c0] * (1.0 - fc) + image[r0, c1] * fc
+    bottom = image[r1, c0] * (1.0 - fc) + image[r1, c1] * fc
+    return top * (1.0 - fr) + bottom * fr
+
+
+def strip_profile(image, positions, tangents, width=5):
+    """
+    average the intensity across a strip perpendicular to the lines at each sample
+    :param image: (height, width) array
+    :param positions: (n, 2) sample positions
+    :param tangents: (n, 2) unit tangents of the lines at the samples
+    :param width: the width of the strip in pixels, sampled every pixel
+    :return: (n,) mean intensity across the strip at each sample
+    """
+    n_across = max(int(round(width)), 1)
+    across = (np.arange(n_across) - (n_across - 1) / 2.0).astype(np.float32)
+    normals = np.stack([-tangents[:, 1], tangents[:, 0]], axis=1).astype(np.float32)
+    positions = positions.astype(np.float32)
+    profile = np.empty(len(positions))
+    # work through the samples in chunks so the temporaries stay in cache
+    for start in range(0, len(positions), CHUNK):
+        stop = start + CHUNK
+        pts = positions[start:stop, None, :] + across[None, :, None] * normals[start:stop, None, :]
+        profile[start:stop] = bilinear(image, pts[..., 0], pts[..., 1]).mean(axis=1)
+    return profile
+
+
+def pad_profiles(profile, sample_line, n_lines, rows=None):
+    """
+    arrange the concatenated profiles of the lines as rows of a zero padded matrix
+    :param rows: the ids of the lines given a row, in order, by default all of them
+    :return: (matrix (len(rows), the longest of them), length of each row (len(rows),))
+    """
+    counts = np.bincount(sample_line, minlength=n_lines)
+    rows = np.arange(n_lines) if rows is None else np.asarray(rows)
+    row_of = np.full(n_lines, -1)
+    row_of[rows] = np.arange(len(rows))
+    matrix = np.zeros((len(rows), max(counts[rows].max(initial=0), 1)))
+    column = np.arange(len(sample_line)) - np.repeat(np.cumsum(counts) - counts, counts)
+    kept = row_of[sample_line] >= 0
+    matrix[row_of[sample_line[kept]], column[kept]] = profile[kept]
+    return matrix, counts[rows]
+
+
+def autocorrelation_spacing(profile, sample_line, n_lines, step=1.0, min_period=4.0, max_period=40.0):
+    """
+    estimate the dominant period of each line's profile from the first strong autocorrelation peak between
+    min_period and max_period, refined to sub-sample precision with a parabola through the peak.
+    :param profile: (n,) concatenated profiles of all the lines
+    :param sample_line: (n,) line id of each sample
+    :param n_lines: number of lines
+    :param step: the distance between samples in pixels
+    :param min_period: the shortest period looked for, in pixels
+    :param max_period: the longest period looked for, in pixels
+    :return: (n_lines,) period in pixels, nan where no peak was found
+    """
+    # padding every line to the longest one would take n_lines times its length, so the lines are padded
+    # in groups of about the same length, the ones that share an FFT size
+    counts = np.bincount(sample_line, minlength=n_lines)
+    n_fft = 1 << np.ceil(np.log2(2 * np.maximum(counts, 1))).astype(np.int64)
+    spacing = np.full(n_lines, np.nan)
+    for size in np.unique(n_fft):
+        rows = np.flatnonzero(n_fft == size)
+        matrix, row_counts = pad_profiles(profile, sample_line, n_lines, rows)
+        spacing[rows] = padded_spacing(matrix, row_counts, step, min_period, max_period)
+    return spacing
+
+
+def padded_spacing(matrix, counts, step, min_period, max_period):
+    """
+    autocorrelation_spacing of the profiles padded into the rows of a matrix
+    :param matrix: (n_rows, longest) profiles, see pad_profiles
+    :param counts: (n_rows,) length of each profile
+    :return: (n_rows,) period in pixels, nan where no peak was found
+    """
+    n_lines = len(counts)
+    valid = np.arange(matrix.shape[1])[None, :] < counts[:, None]
+    means = matrix.sum(axis=1) / np.maximum(counts, 1)
+    matrix = np.where(valid, matrix - means[:, None], 0.0)
+    n_fft = 1 << int(np.ceil(np.log2(2 * matrix.shape[1])))
+    spectrum = np.fft.rfft(matrix, n=n_fft, axis=1)
+    ac = np.fft.irfft(spectrum * spectrum.conj(), n=n_fft, axis=1)[:, :matrix.shape[1]]
+    lags = np.arange(matrix.shape[1])
+    overlap = counts[:, None] - lags[None, :]
+    ac = np.where(overlap > 0, ac / np.maximum(overlap, 1), 0.0)  # unbiased estimate
+    ac = ac / np.where(ac[:, :1] > 0, ac[:, :1], 1.0)
+
+    lo = max(int(np.floor(min_period / step)), 1)
+    hi = int(np.ceil(max_period / step))
+    # only lags with at least half the profile overlapping are trusted
+    usable = (lags[None, :] >= lo) & (lags[None, :] <= hi) & (2 * lags[None, :] <= counts[:, None])
+    left = np.roll(ac, 1, axis=1)
+    right = np.roll(ac, -1, axis=1)
+    peaks = usable & (ac > left) & (ac >= right) & (ac > 0) & (lags[None, :] + 1 < matrix.shape[1])
+    found = peaks.any(axis=1)
+    # harmonics of the period peak about as high as the period itself, take the first strong peak
+    strongest = np.max(np.where(peaks, ac, 0.0), axis=1)
+    lag = np.argmax(peaks & (ac >= 0.5 * strongest[:, None]), axis=1)
+    rows = np.arange(n_lines)
+    y0, y1, y2 = left[rows, lag], ac[rows, lag], right[rows, lag]
+    denom = y0 - 2 * y1 + y2
+    shift = np.where(denom != 0, 0.5 * (y0 - y2) / np.where(denom != 0, denom, 1.0), 0.0)
+    return np.where(found, (lag + np.clip(shift, -0.5, 0.5)) * step, np.nan)
+
+
+def peak_spacings(profile, sample_line, step=1.0, min_period=4.0):
+    """
+    find the intensity peaks along each line and the distances between successive peaks of the same line
+    :param profile: (n,) concatenated profiles of all the lines
+    :param sample_line: (n,) line id of each sample
+    :param step: the distance between samples in pixels
+    :param min_period: peaks closer than this are merged by smoothing the profile over half of it
+    :return: (spacings in pixels, line id of each spacing)
+    """
+    if len(profile) < 3:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+    k = max(int(round(min_period / step / 2.0)), 1)
+    # a moving average of k samples within each line, from the running sum. The window is cut short at the
+    # ends of a line rather than reaching into the next one
+    index = np.arange(len(profile))
+    run_start = np.flatnonzero(np.r_[True, sample_line[1:] != sample_line[:-1]])
+    run_end = np.r_[run_start[1:], len(profile)]
+    run = np.repeat(np.arange(len(run_start)), run_end - run_start)
+    lo = np.maximum(index - k // 2, run_start[run])
+    hi = np.minimum(index + (k - 1) // 2 + 1, run_end[run])
+    running = np.r_[0.0, np.cumsum(profile)]
+    smooth = (running[hi] - running[lo]) / (hi - lo)
+    same_prev = np.r_[False, sample_line[1:] == sample_line[:-1]]
+    same_next = np.r_[sample_line[:-1] == sample_line[1:], False]
+    prev = np.r_[smooth[0], smooth[:-1]]
+    nxt = np.r_[smooth[1:], smooth[-1]]
+    is_peak = same_prev & same_next & (smooth > prev) & (smooth >= nxt)
+    idx = np.nonzero(is_peak)[0]
+    if len(idx) < 2:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+    same_line = sample_line[idx[1:]] == sample_line[idx[:-1]]
+    spacing = (idx[1:] - idx[:-1])[same_line] * step
+    return spacing, sample_line[idx[1:]][same_line]
+
+
+def analyze(image, lines, step=1.0, width=5, min_period=4.0, max_period=40.0, pixel_size=1.0):
+    """
+    estimate the sarcomere spacing along the annotated lines of an image
+    :param image: (height, width) array, a multichannel image must be reduced to one channel first
+    :param lines: a LineArray or a list of lines as in SarcomereLines.lines
+    :param step: the distance between samples along the lines in pixels
+    :param width: the width in pixels of the strip averaged across the lines
+    :param min_period: the shortest spacing looked for, in pixels
+    :param max_period: the longest spacing looked for, in pixels
+    :param pixel_size: the size of a pixel, e.g. in microns, the spacings are reported in these units
+    :return: dict with per line arrays 'length', 'spacing' (autocorrelation estimate, nan when not found),
+    'n_peaks' and 'mean_peak_spacing', and per image arrays 'peak_spacing' (every peak to peak distance)
+    and 'peak_line' (the line of each), all distances multiplied by pixel_size
+    """
+    if not isinstance(lines, LineArray):
+        lines = LineArray.from_lines(lines)
+    positions, tangents, sample_line = resample(lines, step)
+    profile = strip_profile(image, positions, tangents, width)
+    n_lines = lines.n_lines
+    spacing = autocorrelation_spacing(profile, sample_line, n_lines, step, min_period, max_period)
+    peaks, peak_line = peak_spacings(profile, sample_line, step, min_period)
+    n_peaks = np.bincount(peak_line, minlength=n_lines)
+    sums = np.bincount(peak_line, weights=peaks, minlength=n_lines)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_peak = np.where(n_peaks > 0, sums / n_peaks, np.nan)
+    return {
+        'length': lines.lengths() * pixel_size,
+        'spacing': spacing * pixel_size,
+        'n_peaks': n_peaks,
+        'mean_peak_spacing': mean_peak * pixel_size,
+        'peak_spacing': peaks * pixel_size,
+        'peak_line': peak_line,
+    }
+
+
+def summarize(result):
+    """
+    summarize the per image distribution of spacings
+    :param result: the dict returned by analyze
+    :return: dict of the number of spacings and their mean, median, standard deviation and quartiles
+    """
+    spacing = result['peak_spacing']
+    if len(spacing) == 0:
+        return {'n': 0, 'mean': np.nan, 'median': np.nan, 'std': np.nan, 'q25': np.nan, 'q75': np.nan}
+    q25, median, q75 = np.percentile(spacing, [25, 50, 75])
+    return {'n': len(spacing), 'mean': float(spacing.mean()), 'median': float(median),
+            'std': float(spacing.std()), 'q25': float(q25), 'q75': float(q75)}
+
+
+def analyze_file(image_fname, annot_fname=None, channel=0, **kwargs):
+    """
+    analyze an image and its annotation file
+    :param image_fname: the image file
+    :param annot_fname: the annotation file, by default the image file name with .annot_txt appended
+    :param channel: the channel analyzed in a multichannel image
+    :param kwargs: passed to analyze
+    :return: the dict returned by analyze
+    """
+    lines, img_size = LineArray.read(annot_fname or annotation_name(image_fname))
+    image = read_image(image_fname)
+    if image.ndim == 3:
+        image = image[:, :, channel]
+    return analyze(image, lines, **kwargs)
@@ -1,5 +1,19 @@
-import json
+import gc
 import math
+import os
+import threading
+
+import numpy as np
+
+from .AnnotationCache import MIN_CACHE_BYTES, load_annotation, write_cache
+from .AnnotationFile import dumps_annotation, image_name, write_atomic
+from .History import HISTORY_BYTES, History
+from .Journal import Journal
+from .LineArray import LineArray, LineList
+from .SegmentGrid import SegmentGrid, column_index
+from .Timings import timed
+
+JOURNAL_EXT = ".journal"
 
 
 class SarcomereLines(object):
@@ -9,21 +23,89 @@ class SarcomereLines(object):
     It also constructs the drawn lines that get added to the Picture Canvas and handles
     the logic of when to clear the lines from the canvas etc.
 
+    The segments of all lines are kept in a SegmentGrid so selecting the line nearest a point
+    doesn't have to visit every point of every line.
+
+    The points are held in a LineArray, self.lines is a LineList view of it which reads like the list of
+    lines of (x, y) tuples it used to be. It takes 16 bytes a point and is copied in one go for writing.
+
+    Changes to the lines are made while holding self.lock so the lines can be written out from a
+    background thread (see AnnotationWriter).
+
+    Large annotation files are loaded through a binary sidecar (see AnnotationCache) which is kept up to
+    date by write_file, so they are not parsed again every time the image is opened.
+
+    With journaling on every change is also appended to a small journal file next to the annotation file.
+    Writing the whole file (see write_file) compacts the journal and on load any changes in the journal that
+    didn't make it into the file are replayed, so an interrupted session is recovered.
+
+    The edits made since loading are kept in a History as small deltas so they can be undone and redone
+    (see undo_last and redo). Undoing and redoing are made of the same primitive changes as editing, so the
+    journal records them like any other change.
+
+    With snap set to a LiveWire the segment between a clicked point and the one before it is routed along
+    the bright ridges of the image, adding the points of the path. The path is undone as one edit.
+
+    A point being dragged is moved with set_point, which only updates the line and its segments in the
+    index, and move_point records where it ends up as a single edit.
+
+    With store set to an AnnotationStore every write_file also writes the lines through to the store.
+
+    The annotation of a z-stack holds lines for each slice. Only the slice being edited (see select_slice) is
+    in self.lines, self.keys, self.positions and self.grid, the others are set aside with their own undo
+    history, so every edit and lookup only deals with the lines of one slice. A slice is indexed when it is
+    first selected. The journal records a switch of slice before the first change made on it.
+
     """
 
-    def __init__(self, fname):
+    def __init__(self, fname, journal=False, history_bytes=HISTORY_BYTES, native_size=None, defer_journal=False):
         """
         Initialize SarcomereLines with a file name
         :param fname: name of file with lines, if file doesn't exist it is created.
+        :param journal: record every change in the journal fname + JOURNAL_EXT and recover from it on load
+        :param history_bytes: the cap on the memory held by the undo history
+        :param native_size: the (width, height) of the image, the lines of a file written for another size
+        (see native_frame) are mapped onto it. By default the lines are taken as they are.
+        :param defer_journal: with journal, leave the journal closed until open_journal is called, for lines
+        loaded ahead of time that may never be shown. Until then the lines are as in the file.
         """
+        self.lock = threading.RLock()  # guards self.lines against a writer thread serializing them
+        self.grid = SegmentGrid()  # spatial index over the segments of every line
+        self.keys = []  # stable id of each line in self.lines, used to identify its segments in the grid
+        self.positions = {}  # key -> index of the line in self.lines, kept in step with self.keys
+        self.next_key = 0
+        self.journal = None
+        self.history = None  # edits are remembered once loading is done
+        self.snap = None  # a LiveWire routing the path to each clicked point, None joins them straight
+        self.store = None  # an AnnotationStore the lines are written through to
+        self.z = 0  # the slice of a stack being edited
+        self.slices = {}  # z -> (lines, keys, positions, grid, history) of the other slices, keys None until indexed
+        self.journal_slice = 0  # the slice a replay of the journal would be on
+        self.history_bytes = history_bytes
+        self.fname = fname
+        journal_seq = 0
         try:
-            with open(fname, 'r') as fp:
-                read_in = json.load(fp)
-                self.lines = read_in["lines"]  # don't do anything with the image size
-            fp.closed
-            self.end_line()  # append a newline onto the list of lines so as not to extend defined lines
+            # journal_seq is the last journal record included in the file
+            read_in, image_size, journal_seq, slices = load_annotation(fname, with_slices=True)
+            if native_size is not None:  # the journal records are native, they are replayed as they are
+                read_in = read_in.to_native(image_size, native_size)
+            self.lines = LineList(read_in)
+            self.index_lines()
+            for z, lines in slices.items():
+                lines = LineArray.from_lines(lines)
+                if native_size is not None:
+                    lines = lines.to_native(image_size, native_size)
+                self.slices[z] = (LineList(lines), None, None, None, None)
         except FileNotFoundError:
-            self.lines = [[]]
+            self.lines = LineList()
+            self.keys = [self.new_key()]
+            self.renumber(0)
+        self.file_seq = journal_seq  # the last journal record included in the file
+        if not journal:
+            self.end_lines()
+        elif not defer_journal:
+            self.open_journal()
+        self.history = History(history_bytes)
 
         self.d = 5  # diameter of any point drawn
         self.lw = 2  # the width of drawn lines
@@ -31,6 +113,39 @@ class SarcomereLines(object):
         self.highlight = None  # container to hold the highlight lines object
         self.scale_factor = 1.0  # how many fold the image is zoomed from native.
 
+    def open_journal(self):
+        """
+        start journaling, recovering the changes in the journal that didn't make it into the file first.
+        The journal continues from the lines as they were when the file was written, so the lines are only
+        ended (see end_lines) after replaying it, and that is journaled. It does nothing if the journal is
+        open already.
+        """
+        with self.lock:
+            if self.journal is not None:
+                return
+            history, self.history = self.history, None  # the changes recovered can't be undone
+            try:
+                recovered = Journal(self.fname + JOURNAL_EXT, self.file_seq)
+                for op, args in recovered.read():
+                    self.replay(op, args)
+                self.journal = recovered
+                self.journal_slice = self.z
+                self.end_lines()
+            finally:
+                self.history = history
+
+    def end_lines(self):
+        """
+        end the line in progress on every slice, so new points don't extend the lines that were loaded
+        """
+        with self.lock:
+            self.end_line()  # append a newline onto the list of lines so as not to extend defined lines
+            z = self.z
+            for other in [other for other, entry in self.slices.items() if entry[0][-1]]:
+                self.select_slice(other)
+                self.end_line()
+            self.select_slice(z)
+
     def set_scale_factor(self, sf):
         """
         set the scale factor so the coordinates can be scaled to the scaled image size.
@@ -51,12 +166,48 @@ class SarcomereLines(object):
         pos = (pos_x, pos_y)
         return pos
 
+    def select_slice(self, z):
+        """
+        switch to editing the lines of another slice of a stack, the lines of the slice left are set aside
+        with their undo history.
+        :param z: the slice
+        """
+        with self.lock:
+            if z == self.z:
+                return
+            self.slices[self.z] = (self.lines, self.keys, self.positions, self.grid, self.history)
+            lines, keys, positions, grid, history = self.slices.pop(z, (LineList(), None, None, None, None))
+            self.z = z
+            self.lines = lines
+            if history is None and self.history is not None:  # edits made while loading aren't remembered
+                history = History(self.history_bytes)
+            if keys is None:  # not selected since loading
+                self.grid = SegmentGrid()
+                self.index_lines()
+            else:
+                self.keys, self.positions, self.grid = keys, positions, grid
+            self.history = history
+
+    def slice_lines(self):
+        """
+        :return: {z: LineList} of the slices of a stack that have any points, the current one included
+        """
+        with self.lock:
+            lines = dict((z, entry[0]) for z, entry in self.slices.items())
+            lines[self.z] = self.lines
+            return dict((z, lines[z]) for z in sorted(lines) if lines[z].array.n_points)
+
     def end_line(self):
         """
         end the current line.
         """
-        if len(self.lines[-1]) > 0:
-            self.lines.append([])
+        with self.lock:
+            if len(self.lines[-1]) > 0:
+                self.lines.append([])
+                self.keys.append(self.new_key())
+                self.positions[self.keys[-1]] = len(self.keys) - 1
+                self.record("end")
+                self.remember("end")
 
     def add_point(self, point):
         """
@@ -65,59 +216,439 @@ class SarcomereLines(object):
         global coordinates in the image frame
         """
         spos = self.map_point(point)
-        self.lines[-1].append(spos)
+        with self.lock:
+            line = self.lines[-1]
+            last = line[-1] if line else None
+        path = self.snap.route(last, spos) if self.snap is not None and last is not None else None
+        self.add_routed(spos, path)
+
+    def add_routed(self, spos, path):
+        """
+        add a clicked point to the end of the last line, through the path routed to it
+        :param spos: the (x, y) coordinates of the point in the native resolution
+        :param path: the points of the path to it ending with spos (see LiveWire.route), None adds spos alone
+        """
+        if not path:
+            self.append_point(spos)
+            return
+        with self.lock:
+            self.append_path(path)
+            self.remember("path", path)
+
+    def append_path(self, path):
+        """
+        append the points of a path to the last line, as a single edit in the history
+        :param path: list of (x, y) points in the native resolution
+        """
+        with self.lock:
+            history, self.history = self.history, None
+            try:
+                for p in path:
+                    self.append_point(p)
+            finally:
+                self.history = history
+
+    def append_point(self, spos):
+        """
+        append a point in native coordinates to the last line.
+        :param spos: the (x, y) coordinates of the point in the native resolution
+        """
+        with self.lock:
+            line = self.lines[-1]
+            line.append(spos)
+            n = len(line)
+            if n == 1:
+                self.grid.insert((self.keys[-1], 0), spos, spos)
+            else:
+                self.grid.insert((self.keys[-1], n - 2), line[-2], spos)
+            self.record("add", spos[0], spos[1])
+            self.remember("add", spos[0], spos[1])
 
     def undo_last(self):
         """
-        undo the last operation, specifically remove an empty list or remove the last point added.
-        it can be performed repeatably until there are no points in the structure.
+        undo the last edit. Once the history is used up (or was capped) it falls back to removing the empty
+        line at the end or the last point added, so it can be performed repeatably until there are no points
+        in the structure.
+        :return: list of (key, line) of the lines changed, line is None for a line that no longer exists
         """
-        if len(self.lines[-1]) == 0 and len(self.lines) > 1:
-            self.lines.pop()  # undo the end of list
-        else:
-            if len(self.lines[-1]) > 0:
-                self.lines[-1].pop()
+        with self.lock:
+            delta = self.history.undo() if self.history is not None else None
+            if delta is not None:
+                return self.unapply(delta)
+            if self.history is not None:
+                self.history.clear_redo()  # this edit isn't in the history, what was undone can't follow it
+            key = self.keys[-1]
+            if len(self.lines[-1]) == 0 and len(self.lines) > 1:
+                self.pop_line()  # undo the end of list
+                return [(key, None)]
+            self.pop_point()
+            return [(key, self.lines[-1])]
+
+    def redo(self):
+        """
+        redo the last edit undone by undo_last.
+        :return: list of (key, line) of the lines changed, line is None for a line that no longer exists
+        """
+        with self.lock:
+            delta = self.history.redo() if self.history is not None else None
+            if delta is None:
+                return []
+            history, self.history = self.history, None  # repeating an edit mustn't record it again
+            try:
+                op = delta[0]
+                if op == "add":
+                    self.append_point(delta[1:])
+                    return [(self.keys[-1], self.lines[-1])]
+                if op == "path":
+                    self.append_path(delta[1])
+                    return [(self.keys[-1], self.lines[-1])]
+                if op == "end":
+                    self.end_line()
+                    return [(self.keys[-1], self.lines[-1])]
+                if op == "move":
+                    i, j, old, new = delta[1:]
+                    self.move_point(i, j, new, old)
+                    return [(self.keys[i], self.lines[i])]
+                if op == "remove":
+                    i, key, line, placeholder = delta[1:]
+                    self.remove_line(i, placeholder)
+                    changed = [(key, None)]
+                    if placeholder is not None:  # the line in progress was removed and an empty one took its place
+                        changed.append((placeholder, self.lines[-1]))
+                    return changed
+                raise ValueError("can't redo %r" % (op,))
+            finally:
+                self.history = history
+
+    def unapply(self, delta):
+        """
+        reverse an edit taken from the history
+        :param delta: the edit, see History
+        :return: list of (key, line) of the lines changed, line is None for a line that no longer exists
+        """
+        op = delta[0]
+        key = self.keys[-1]
+        if op == "add":
+            self.pop_point()
+            return [(key, self.lines[-1])]
+        if op == "path":
+            for _ in delta[1]:
+                self.pop_point()
+            return [(key, self.lines[-1])]
+        if op == "end":
+            self.pop_line()
+            return [(key, None)]
+        if op == "move":
+            i, j, old, new = delta[1:]
+            self.set_point(i, j, old)
+            self.record("move", i, j, old[0], old[1])
+            return [(self.keys[i], self.lines[i])]
+        if op == "remove":
+            i, key, line, placeholder = delta[1:]
+            self.insert_line(i, line, key)
+            changed = [(key, self.lines[i])]
+            if placeholder is not None:  # the empty line that took its place goes again
+                self.pop_line()
+                changed.append((placeholder, None))
+            return changed
+        raise ValueError("can't undo %r" % (op,))
+
+    def pop_line(self):
+        """
+        remove the empty line at the end of the list.
+        """
+        with self.lock:
+            if len(self.lines[-1]) == 0 and len(self.lines) > 1:
+                self.lines.pop()
+                del self.positions[self.keys.pop()]
+                self.record("unend")
+
+    def pop_point(self):
+        """
+        remove the last point of the last line.
+        """
+        with self.lock:
+            line = self.lines[-1]
+            n = len(line)
+            if n > 0:
+                line.pop()
+                if n == 1:
+                    self.grid.remove((self.keys[-1], 0))
+                elif n == 2:
+                    self.grid.insert((self.keys[-1], 0), line[0], line[0])
+                else:
+                    self.grid.remove((self.keys[-1], n - 2))
+                self.record("pop")
+
+    def set_point(self, i, j, p):
+        """
+        move a point of a line, without recording the change. It is used while a point is being dragged,
+        move_point records where it ends up.
+        :param i: the index of the line in the list of lines
+        :param j: the index of the point in the line
+        :param p: the new (x, y) of the point in native coordinates
+        """
+        with self.lock:
+            key, line = self.keys[i], self.lines[i]
+            line[j] = p
+            if len(line) == 1:
+                self.grid.insert((key, 0), p, p)
+            if j > 0:
+                self.grid.insert((key, j - 1), line[j - 1], p)
+            if j < len(line) - 1:
+                self.grid.insert((key, j), p, line[j + 1])
 
+    def move_point(self, i, j, p, old=None):
+        """
+        move a point of a line.
+        :param i: the index of the line in the list of lines
+        :param j: the index of the point in the line
+        :param p: the new (x, y) of the point in native coordinates
+        :param old: where the point was, if it has already been moved by set_point
+        """
+        with self.lock:
+            old = self.lines[i][j] if old is None else old
+            self.set_point(i, j, p)
+            self.record("move", i, j, p[0], p[1])
+            self.remember("move", i, j, old, p)
+
+    def insert_line(self, i, line, key=None):
+        """
+        insert a line into the list of lines, the reverse of remove_line.
+        :param i: the index the line gets in the list of lines
+        :param line: the points of the line
+        :param key: the id of the line, by default a new one
+        """
+        with self.lock:
+            key = self.new_key() if key is None else key
+            line = list(line)
+            self.lines.insert(i, line)
+            self.keys.insert(i, key)
+            self.renumber(i)
+            self.index_line(key, line)
+            self.record("insert", i, line)
+
+    @timed("SarcomereLines.write_file")
     def write_file(self, fname, img_size):
         """
-        write out all the points to the file and include the image_size as a header
+        write out all the points to the file and include the image_size as a header.
+        The file is written to a temporary file first and then renamed over fname so a crash while
+        writing never leaves a truncated file behind.
         :param fname: the file name / same as the image but with the extension .annot_txt
         :param img_size: the (x,y) size of the local coordinate system used.
         """
-        with open(fname, "w") as fp:
-            json.dump({"image_size": img_size, "lines": self.lines}, fp)
-
-        fp.closed
+        with self.lock:
+            compacts = self.journal is not None and self.journal.fname == fname + JOURNAL_EXT
+            journal_seq = self.journal.seq if compacts else None
+            if compacts:
+                self.journal_slice = 0  # the journal records after journal_seq are replayed from slice 0
+            # copying the arrays is all that is done holding the lock, the text is made from the copies
+            slices = dict((z, lines.array.copy()) for z, lines in self.slice_lines().items())
+            snapshot = slices.pop(0, self.lines.array.copy() if self.z == 0 else LineArray())
+            store = self.store
+        lines = snapshot.as_list()
+        slice_lists = dict((z, la.as_list()) for z, la in slices.items())
+        text = dumps_annotation(lines, img_size, journal_seq, slice_lists)
+        write_atomic(fname, text)
+        if len(text) >= MIN_CACHE_BYTES and not slices:
+            write_cache(fname, snapshot, img_size, journal_seq or 0)
+        if store is not None:
+            store.put(image_name(fname), lines, img_size, os.stat(fname).st_mtime_ns, journal_seq, slice_lists)
+        if compacts:
+            with self.lock:
+                self.journal.compact(journal_seq)
 
-    def remove_nearest(self, point, canvas):
+    def remove_nearest(self, point, canvas=None):
         """
         remove the line nearest to the selected point
         :param point: the point nearest the line to remove
-        :param canvas: the drawing canvas that displays the image
+        :param canvas: ignored, kept so existing callers still work. The Picture redraws the lines itself.
+        :return: the index the removed line had in the list of lines, None if nothing was removed
         """
         if len(self.lines) == 1 and len(self.lines[0]) == 0: return
-        i, r_line = self.select_nearest_line(point)
-        self.lines.remove(r_line)
-        #canvas.remove(self.highlight) if canvas else None
-        #self.highlight = None
+        with self.lock:
+            i, r_line = self.select_nearest_line(point)
+            self.remove_line(i)
+        return i
+
+    def remove_line(self, i, placeholder=None):
+        """
+        remove a line, if it was the line in progress (the last one) an empty line takes its place so new
+        points don't extend a finished line.
+        :param i: the index of the line in the list of lines
+        :param placeholder: the key of the empty line, by default a new one
+        """
+        with self.lock:
+            key, line = self.keys[i], self.lines.array.line_list(i)
+            self.unindex_line(key, line)
+            del self.lines[i]
+            del self.keys[i]
+            del self.positions[key]
+            if i == len(self.lines) and (len(self.lines) == 0 or len(self.lines[-1]) > 0):
+                placeholder = self.new_key() if placeholder is None else placeholder
+                self.lines.append([])
+                self.keys.append(placeholder)
+            else:
+                placeholder = None
+            self.renumber(i)
+            self.record("remove", i)
+            self.remember("remove", i, key, line, placeholder)
+
+    def record(self, op, *args):
+        """
+        append a change to the journal if journaling is on
+        :param op: the name of the change, one of the keys of REPLAY
+        :param args: the arguments of the change
+        """
+        if self.journal:
+            if self.journal_slice != self.z:
+                self.journal_slice = self.z
+                self.journal.append("slice", self.z)
+            self.journal.append(op, *args)
 
+    def remember(self, *delta):
+        """
+        add an edit to the undo history, if it is being kept
+        :param delta: the edit, see History
+        """
+        if self.history is not None:
+            self.history.push(delta)
+
+    def replay(self, op, args):
+        """
+        apply a change read back from the journal
+        :param op: the name of the change
+        :param args: the arguments of the change
+        """
+        getattr(self, REPLAY[op])(*args)
+
+    def to_array(self):
+        """
+        copy the lines into a LineArray for vectorized processing
+        :return: a LineArray holding the same lines
+        """
+        with self.lock:
+            return self.lines.array.copy()
+
+    def close(self):
+        """
+        close the journal, call this after the final write_file.
+        """
+        if self.journal:
+            self.journal.close()
+
+    @timed("SarcomereLines.select_nearest_line")
     def select_nearest_line(self, point):
         """
-        Select the line nearest the point submitted
+        Select the line nearest the point submitted, distances are measured to the segments of the lines
+        so a point beside the middle of a long segment selects that segment's line.
         :param point: the selected point NOT in native coordinates
         :return: the (index, line) of the selected line in the list of lines
         """
         p = self.map_point(point)
-        line_idx = 0
-        p_dist = 100000.0
-        for idx, line in enumerate(self.lines):
-            for pxy in line:
-                d = self.dist(p, pxy)
-                if d < p_dist:
-                    line_idx = idx
-                    p_dist = d
+        sid, p_dist = self.grid.nearest(p)
+        line_idx = 0 if sid is None else self.positions[sid[0]]
         return line_idx, self.lines[line_idx]
 
+    def nearest_vertex(self, point, radius):
+        """
+        find the point of a line nearest a point, looking only at the segments the spatial index has
+        around it
+        :param point: the point NOT in native coordinates
+        :param radius: how far from the point, in native coordinates, points are looked for
+        :return: (line index, point index) of the nearest point within radius, None if there is none
+        """
+        x, y = self.map_point(point)
+        best, found = radius, None
+        with self.lock:
+            segments = self.grid.segments  # the ends of segment (key, i) are points i and i + 1 of the line
+            for sid in self.grid.query_rect(x - radius, y - radius, x + radius, y + radius):
+                ends = segments[sid]
+                if ends[0] == ends[1]:  # a line of a single point is the segment from the point to itself
+                    ends = ends[:1]
+                for end, p in enumerate(ends):
+                    d = math.hypot(p[0] - x, p[1] - y)
+                    if d <= best:
+                        best, found = d, (sid[0], sid[1] + end)
+            return None if found is None else (self.positions[found[0]], found[1])
+
+    def keys_in_rect(self, x0, y0, x1, y1):
+        """
+        find the lines that pass through a rectangle, using the spatial index
+        :param x0, y0: lower left corner of the rectangle in native coordinates
+        :param x1, y1: upper right corner of the rectangle in native coordinates
+        :return: set of the keys of the lines, it may include lines passing just outside the rectangle
+        """
+        return {sid[0] for sid in self.grid.query_rect(x0, y0, x1, y1)}
+
+    def new_key(self):
+        """
+        :return: a line id that has not been used before
+        """
+        self.next_key += 1
+        return self.next_key
+
+    def renumber(self, start):
+        """
+        bring self.positions up to date with the keys from an index on, after lines were inserted or removed
+        there. Appending or popping the last line only touches its own entry.
+        :param start: the first index in self.keys that may have moved
+        """
+        for i in range(start, len(self.keys)):
+            self.positions[self.keys[i]] = i
+
+    def index_lines(self):
+        """
+        give every line in self.lines a new key and add all their segments to the spatial index, in bulk
+        straight from the arrays of the lines so loading a large annotation doesn't visit every point in python
+        """
+        la = self.lines.array
+        self.keys = [self.new_key() for _ in range(la.n_lines)]
+        self.positions = {}
+        self.renumber(0)
+        coords, offsets = np.asarray(la.coords), np.asarray(la.offsets)
+        counts = np.diff(offsets)
+        # a segment from each point to the next one in its line, and from the point to itself in a line of one
+        first = np.flatnonzero(counts > 1)
+        n_segments = counts[first] - 1
+        line_ids = np.repeat(first, n_segments)
+        index = column_index(n_segments)
+        starts = offsets[line_ids] + index
+        single = np.flatnonzero(counts == 1)
+        line_ids = np.concatenate((line_ids, single))
+        index = np.concatenate((index, np.zeros(len(single), dtype=np.int64)))
+        starts = np.concatenate((starts, offsets[single]))
+        ends = np.concatenate((starts[:len(starts) - len(single)] + 1, offsets[single]))
+        keys = self.keys
+        collecting = gc.isenabled()
+        gc.disable()  # the million tuples made here hold no cycles, collections while making them are wasted
+        try:
+            sids = [(keys[i], j) for i, j in zip(line_ids.tolist(), index.tolist())]
+            self.grid.insert_many(sids, coords[starts], coords[ends])
+        finally:
+            if collecting:
+                gc.enable()
+
+    def index_line(self, key, line):
+        """
+        add all the segments of a line to the spatial index
+        :param key: the id of the line
+        :param line: the list of points in the line
+        """
+        if len(line) == 1:
+            self.grid.insert((key, 0), line[0], line[0])
+        for i in range(len(line) - 1):
+            self.grid.insert((key, i), line[i], line[i + 1])
+
+    def unindex_line(self, key, line):
+        """
+        remove all the segments of a line from the spatial index
+        :param key: the id of the line
+        :param line: the list of points in the line
+        """
+        for i in range(max(len(line) - 1, 1)):
+            self.grid.remove((key, i))
+
     def dist(self, p1, p2):
         """
         compute the distance between the points.
@@ -128,3 +659,25 @@ class SarcomereLines(object):
         dx = float(p1[0]) - float(p2[0])
         dy = float(p1[1]) - float(p2[1])
         return math.sqrt(dx * dx + dy * dy)
+
+    def replay_add(self, x, y):
+        self.append_point((x, y))
+
+    def replay_move(self, i, j, x, y):
+        self.set_point(i, j, (x, y))
+
+    def replay_insert(self, i, line):
+        self.insert_line(i, [tuple(p) for p in line])
+
+
+# the methods that apply each kind of journal record
+REPLAY = {
+    "add": "replay_add",
+    "end": "end_line",
+    "unend": "pop_line",
+    "pop": "pop_point",
+    "remove": "remove_line",
+    "insert": "replay_insert",
+    "move": "replay_move",
+    "slice": "select_slice",
+}
@@ -0,0 +1,246 @@
+import math
+
+import numpy as np
+
+
+class SegmentGrid(object):
+    """SegmentGrid
+
+    A uniform grid spatial index over line segments. Every segment is registered in each grid cell it
+    passes through so that nearest segment queries only have to look at the cells around the query point,
+    expanding ring by ring until no closer segment can exist.
+
+    Segments are identified by a (key, index) pair, where key is a stable identifier of the line the
+    segment belongs to and index is the position of the segment within that line.
+    """
+
+    def __init__(self, cell_size=32.0):
+        """
+        Initialize an empty grid
+        :param cell_size: the edge length of a grid cell in native image coordinates
+        """
+        self.cell_size = float(cell_size)
+        self.cells = {}  # (cx, cy) -> set of segment ids
+        self.segments = {}  # segment id -> (p1, p2)
+        self.bounds = None  # (cx_min, cy_min, cx_max, cy_max) of all cells ever used
+
+    def __len__(self):
+        return len(self.segments)
+
+    def clear(self):
+        """
+        remove all segments from the grid.
+        """
+        self.cells = {}
+        self.segments = {}
+        self.bounds = None
+
+    def insert(self, sid, p1, p2):
+        """
+        add a segment to the grid, a single point can be added by passing it as both end points.
+        :param sid: the segment id, a (key, index) tuple
+        :param p1: first end point (x1, y1)
+        :param p2: second end point (x2, y2)
+        """
+        if sid in self.segments:
+            self.remove(sid)
+        self.segments[sid] = (p1, p2)
+        for cell in self._cells(p1, p2):
+            self.cells.setdefault(cell, set()).add(sid)
+            self._grow_bounds(cell)
+
+    def insert_many(self, sids, starts, ends):
+        """
+        add many segments at once, the cells of all of them are worked out together with numpy. It gives the
+        same grid as inserting them one by one.
+        :param sids: list of the segment ids, none of them in the grid yet
+        :param starts: (n, 2) array of the first end points
+        :param ends: (n, 2) array of the second end points
+        """
+        if not len(sids):
+            return
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        p1s = zip(starts[:, 0].tolist(), starts[:, 1].tolist())
+        p2s = zip(ends[:, 0].tolist(), ends[:, 1].tolist())
+        self.segments.update(zip(sids, zip(p1s, p2s)))
+        seg, cx, cy = self._cells_many(starts, ends)
+        order = np.lexsort((cy, cx))
+        seg, cx, cy = seg[order], cx[order], cy[order]
+        bounds = np.flatnonzero((cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])) + 1
+        firsts = np.concatenate(([0], bounds)).tolist()
+        lasts = np.concatenate((bounds, [len(seg)])).tolist()
+        seg = seg.tolist()
+        for a, b, x, y in zip(firsts, lasts, cx[firsts].tolist(), cy[firsts].tolist()):
+            self.cells.setdefault((x, y), set()).update([sids[k] for k in seg[a:b]])
+        self._grow_bounds((int(cx.min()), int(cy.min())))
+        self._grow_bounds((int(cx.max()), int(cy.max())))
+
+    def remove(self, sid):
+        """
+        remove a segment from the grid, unknown ids are ignored.
+        :param sid: the segment id passed to insert
+        """
+        seg = self.segments.pop(sid, None)
+        if seg is None:
+            return
+        for cell in self._cells(*seg):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard(sid)
+                if not bucket:
+                    del self.cells[cell]
+
+    def nearest(self, p):
+        """
+        find the segment nearest the point
+        :param p: the query point (x, y)
+        :return: (segment id, distance) of the nearest segment or (None, inf) if the grid is empty
+        """
+        if not self.segments:
+            return None, math.inf
+        cx, cy = self._cell(p)
+        x_min, y_min, x_max, y_max = self.bounds
+        max_ring = max(cx - x_min, x_max - cx, cy - y_min, y_max - cy, 0)
+        best, best_d = None, math.inf
+        seen = set()
+        ring = 0
+        while ring <= max_ring:
+            if (2 * ring + 1) ** 2 > len(self.segments):
+                # the search area outgrew the number of segments, finish with a plain scan
+                for sid, seg in self.segments.items():
+                    if sid not in seen:
+                        d = point_segment_dist(p, *seg)
+                        if d < best_d or (d == best_d and sid < best):
+                            best, best_d = sid, d
+                break
+            for cell in self._ring(cx, cy, ring):
+                for sid in self.cells.get(cell, ()):
+                    if sid in seen:
+                        continue
+                    seen.add(sid)
+                    d = point_segment_dist(p, *self.segments[sid])
+                    if d < best_d or (d == best_d and sid < best):
+                        best, best_d = sid, d
+            # any segment not yet seen lies in a cell at least ring * cell_size away from p
+            if best_d <= ring * self.cell_size:
+                break
+            ring += 1
+        return best, best_d
+
+    def query_rect(self, x0, y0, x1, y1):
+        """
+        collect the segments registered in the cells overlapping a rectangle
+        :param x0, y0: lower left corner of the rectangle
+        :param x1, y1: upper right corner of the rectangle
+        :return: a set of segment ids, it may contain segments just outside the rectangle
+        """
+        cx0, cy0 = self._cell((x0, y0))
+        cx1, cy1 = self._cell((x1, y1))
+        found = set()
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            for (cx, cy), bucket in self.cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found.update(bucket)
+            return found
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                found.update(self.cells.get((cx, cy), ()))
+        return found
+
+    def _cell(self, p):
+        return int(math.floor(p[0] / self.cell_size)), int(math.floor(p[1] / self.cell_size))
+
+    def _grow_bounds(self, cell):
+        if self.bounds is None:
+            self.bounds = (cell[0], cell[1], cell[0], cell[1])
+        else:
+            x_min, y_min, x_max, y_max = self.bounds
+            self.bounds = (min(x_min, cell[0]), min(y_min, cell[1]), max(x_max, cell[0]), max(y_max, cell[1]))
+
+    @staticmethod
+    def _ring(cx, cy, r):
+        """
+        the cells whose chebyshev distance from (cx, cy) is exactly r
+        """
+        if r == 0:
+            yield cx, cy
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield x, cy - r
+            yield x, cy + r
+        for y in range(cy - r + 1, cy + r):
+            yield cx - r, y
+            yield cx + r, y
+
+    def _cells(self, p1, p2):
+        """
+        the cells a segment passes through, found column by column from the segment's y range in each column.
+        """
+        s = self.cell_size
+        (x1, y1), (x2, y2) = (p1, p2) if p1[0] <= p2[0] else (p2, p1)
+        cx1, cx2 = int(math.floor(x1 / s)), int(math.floor(x2 / s))
+        for cx in range(cx1, cx2 + 1):
+            xa = max(x1, cx * s)
+            xb = min(x2, (cx + 1) * s)
+            if x2 == x1:
+                ya, yb = y1, y2
+            else:
+                ya = y1 + (y2 - y1) * (xa - x1) / (x2 - x1)
+                yb = y1 + (y2 - y1) * (xb - x1) / (x2 - x1)
+            cya, cyb = sorted((int(math.floor(ya / s)), int(math.floor(yb / s))))
+            for cy in range(cya, cyb + 1):
+                yield cx, cy
+
+    def _cells_many(self, starts, ends):
+        """
+        _cells of many segments at once
+        :return: (segment, cx, cy) arrays with a row for each cell of each segment
+        """
+        s = self.cell_size
+        swap = starts[:, 0] > ends[:, 0]
+        left = np.where(swap[:, None], ends, starts)
+        right = np.where(swap[:, None], starts, ends)
+        x1, y1, x2, y2 = left[:, 0], left[:, 1], right[:, 0], right[:, 1]
+        cx1, cx2 = np.floor(x1 / s).astype(np.int64), np.floor(x2 / s).astype(np.int64)
+        # a row for each column of each segment
+        seg = np.repeat(np.arange(len(x1)), cx2 - cx1 + 1)
+        cx = cx1[seg] + column_index(cx2 - cx1 + 1)
+        x1, y1, x2, y2 = x1[seg], y1[seg], x2[seg], y2[seg]
+        xa = np.maximum(x1, cx * s)
+        xb = np.minimum(x2, (cx + 1) * s)
+        vertical = x2 == x1
+        dx = np.where(vertical, 1.0, x2 - x1)
+        ya = np.where(vertical, y1, y1 + (y2 - y1) * (xa - x1) / dx)
+        yb = np.where(vertical, y2, y1 + (y2 - y1) * (xb - x1) / dx)
+        cya, cyb = np.floor(ya / s).astype(np.int64), np.floor(yb / s).astype(np.int64)
+        cya, cyb = np.minimum(cya, cyb), np.maximum(cya, cyb)
+        # and a row for each cell of each column
+        rows = np.repeat(np.arange(len(seg)), cyb - cya + 1)
+        return seg[rows], cx[rows], cya[rows] + column_index(cyb - cya + 1)
+
+
+def column_index(counts):
+    """
+    :param counts: (n,) array of counts
+    :return: 0, 1, ... counts[0] - 1, 0, 1, ... counts[1] - 1, ... the position of each item within its run
+    """
+    starts = np.cumsum(counts) - counts
+    return np.arange(int(counts.sum())) - np.repeat(starts, counts)
+
+
+def point_segment_dist(p, a, b):
+    """
+    compute the distance between a point and a line segment.
+    :param p: the point (x, y)
+    :param a: first end point of the segment (x1, y1)
+    :param b: second end point of the segment (x2, y2)
+    :return: the shortest distance from p to any point on the segment
+    """
+    ax, ay = float(a[0]), float(a[1])
+    dx, dy = float(b[0]) - ax, float(b[1]) - ay
+    px, py = float(p[0]) - ax, float(p[1]) - ay
+    len2 = dx * dx + dy * dy
+    t = 0.0 if len2 == 0.0 else max(0.0, min(1.0, (px * dx + py * dy) / len2))
+    ex, ey = px - t * dx, py - t * dy
+    return math.sqrt(ex * ex + ey * ey)
@@ -0,0 +1,121 @@
+from kivy.clock import Clock
+from kivy.graphics import Color, InstructionGroup, Rectangle
+from kivy.graphics.texture import Texture
+
+from .ContrastLayer import bin_texture
+from .LRUCache import LRUCache
+
+COLORFMTS = {1: 'luminance', 3: 'rgb', 4: 'rgba'}
+
+
+class TileLayer(InstructionGroup):
+    """
+    TileLayer draws an ImagePyramid, showing only the tiles of the current view at the resolution of the
+    current zoom. Tiles that aren't decoded yet are requested from the pyramid's background threads and
+    drawn when they arrive. Textures of tiles that scroll out of view are kept in an LRU cache capped by
+    texture memory so scrolling back doesn't upload them again. Tiles are placed in native image
+    coordinates, the Picture scales them with the annotations.
+
+    With a contrast set the tiles of a high bit depth pyramid are shown through it. Shaded tiles hold the
+    bins of their pixels, for the ContrastLayer the TileLayer is drawn in to look up. Otherwise the tiles
+    are mapped through the window as they are put in textures and refresh puts the tiles in view through it
+    again once the window changes.
+    """
+
+    def __init__(self, pyramid, texture_bytes=256 * 2 ** 20, contrast=None, shaded=False, **kwargs):
+        """
+        :param pyramid: the ImagePyramid to draw
+        :param texture_bytes: the cap on the memory of cached textures that are out of view
+        :param contrast: the ContrastWindow the tiles are shown through, for a pyramid that keeps the depth
+        :param shaded: the tiles are drawn in a ContrastLayer, for a contrast and tiles of a single sample
+        """
+        super(TileLayer, self).__init__(**kwargs)
+        self.pyramid = pyramid
+        self.contrast = contrast
+        self.shaded = shaded
+        self.textures = LRUCache(texture_bytes, sizeof=lambda tex: tex.width * tex.height * 4)
+        self.rects = {}  # key -> Rectangle of the tiles on the canvas
+        self.wanted = set()
+        self.add(Color(1, 1, 1))
+
+    def update(self, rect, scale):
+        """
+        show the tiles covering a view
+        :param rect: (x0, y0, x1, y1) of the view in native coordinates
+        :param scale: how many fold the image is zoomed from native
+        """
+        wanted = self.pyramid.tiles_in_view(self.pyramid.level_for_scale(scale), rect)
+        self.wanted = set(wanted)
+        self.pyramid.cancel_except(self.wanted)
+        for key in [key for key in self.rects if key not in self.wanted]:
+            self.remove(self.rects.pop(key))
+        for key in wanted:
+            if key in self.rects:
+                continue
+            texture = self.textures.get(key)
+            if texture is None:
+                tile = self.pyramid.tile(key)
+                if tile is None:
+                    self.pyramid.request(key, self.tile_decoded)
+                    continue
+                texture = self.make_texture(key, tile)
+            self.show(key, texture)
+
+    def tile_decoded(self, key, tile):
+        """
+        called from a decoding thread, textures can only be made on the main thread
+        """
+        Clock.schedule_once(lambda dt: self.tile_ready(key, tile))
+
+    def tile_ready(self, key, tile):
+        if key in self.wanted and key not in self.rects:
+            self.show(key, self.make_texture(key, tile))
+
+    def make_texture(self, key, tile):
+        if self.shaded:
+            texture = bin_texture(self.contrast, tile)
+            self.textures.put(key, texture)
+            return texture
+        colorfmt = COLORFMTS[1 if tile.ndim == 2 else tile.shape[2]]
+        texture = Texture.create(size=(tile.shape[1], tile.shape[0]), colorfmt=colorfmt)
+        self.blit(texture, tile)
+        texture.flip_vertical()  # the tile rows run from the top, kivy's y runs up
+        self.textures.put(key, texture)
+        return texture
+
+    def blit(self, texture, tile):
+        pixels = tile if self.contrast is None else self.contrast.apply(tile)
+        texture.blit_buffer(pixels.tobytes(), colorfmt=texture.colorfmt, bufferfmt='ubyte')
+
+    def refresh(self):
+        """
+        show the tiles in view through the contrast again, the textures out of view are dropped
+        """
+        for key in self.textures.keys():
+            if key not in self.rects:
+                self.textures.pop(key)
+        for key, rect in list(self.rects.items()):
+            tile = self.pyramid.tile(key)
+            if tile is not None:
+                self.blit(rect.texture, tile)
+            else:  # evicted from the pyramid's cache, decode it again
+                self.remove(self.rects.pop(key))
+                self.textures.pop(key)
+                self.pyramid.request(key, self.tile_decoded)
+
+    def placement(self, key):
+        """
+        :return: (pos, size) of a tile in native coordinates with y up
+        """
+        x0, y0, x1, y1 = self.pyramid.tile_box(key)
+        return (x0, self.pyramid.size[1] - y1), (x1 - x0, y1 - y0)
+
+    def show(self, key, texture):
+        pos, size = self.placement(key)
+        rect = Rectangle(texture=texture, pos=pos, size=size)
+        self.rects[key] = rect
+        self.add(rect)
+
+    def close(self):
+        self.pyramid.close()
+        self.textures.clear()
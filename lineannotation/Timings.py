@@ -0,0 +1,114 @@
+import csv
+import functools
+import json
+import threading
+from collections import deque
+from time import perf_counter
+
+
+class Timings(object):
+    """Timings
+
+    Collects how long the editor's hot paths take. Each operation keeps its latest durations in a bounded
+    buffer from which percentiles are computed on demand, and every measurement is also appended to a
+    bounded trace of (name, start, duration) events that can be exported for a closer look.
+
+    Timing is off until enabled is set, then a timed function only costs a check of the flag, so the
+    decorators can stay on the hot paths.
+    """
+
+    def __init__(self, max_samples=4096, max_events=200000):
+        """
+        :param max_samples: the number of latest durations kept per operation for the percentiles
+        :param max_events: the number of latest events kept in the trace
+        """
+        self.enabled = False
+        self.max_samples = max_samples
+        self.samples = {}  # name -> deque of the latest durations in seconds
+        self.counts = {}  # name -> number of measurements ever made
+        self.events = deque(maxlen=max_events)
+        self.lock = threading.Lock()  # the annotation writer thread is timed too
+        self.origin = perf_counter()
+
+    def add(self, name, seconds, start=None):
+        """
+        record a measurement
+        :param name: the name of the operation
+        :param seconds: how long it took
+        :param start: perf_counter() when it started, by default seconds before now
+        """
+        if start is None:
+            start = perf_counter() - seconds
+        with self.lock:
+            buf = self.samples.get(name)
+            if buf is None:
+                buf = self.samples[name] = deque(maxlen=self.max_samples)
+                self.counts[name] = 0
+            buf.append(seconds)
+            self.counts[name] += 1
+            self.events.append((name, start - self.origin, seconds))
+
+    def timed(self, name):
+        """
+        decorator timing every call of a function
+        :param name: the name of the operation
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add(name, perf_counter() - start, start)
+            return wrapper
+        return decorate
+
+    def summary(self):
+        """
+        :return: {name: {"count", "p50", "p99", "max"}} over the latest durations of each operation, in seconds
+        """
+        with self.lock:
+            samples = {name: sorted(buf) for name, buf in self.samples.items()}
+            counts = dict(self.counts)
+        return {name: {"count": counts[name], "p50": percentile(values, 50), "p99": percentile(values, 99),
+                       "max": values[-1]}
+                for name, values in samples.items() if values}
+
+    def export(self, fname):
+        """
+        write the trace, a .csv file gets a row per event, anything else gets json with the summary as well
+        :param fname: the file to write
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(fname, "w", newline='') as fp:
+            if fname.lower().endswith(".csv"):
+                writer = csv.writer(fp)
+                writer.writerow(["name", "start", "duration"])
+                writer.writerows(events)
+            else:
+                json.dump({"summary": self.summary(),
+                           "events": [{"name": n, "start": s, "duration": d} for n, s, d in events]}, fp)
+
+    def clear(self):
+        with self.lock:
+            self.samples = {}
+            self.counts = {}
+            self.events.clear()
+
+
+def percentile(values, p):
+    """
+    :param values: sorted list of numbers
+    :param p: the percentile, 0 - 100
+    :return: the nearest rank percentile
+    """
+    rank = max(int(-(-p * len(values) // 100)), 1)  # ceil without floats
+    return values[min(rank, len(values)) - 1]
+
+
+TIMINGS = Timings()  # shared by the whole editor, see line_annot --trace and --hud
+timed = TIMINGS.timed
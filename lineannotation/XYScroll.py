@@ -1,13 +1,72 @@
 from kivy.animation import Animation
 from kivy.clock import Clock
 from kivy.uix.scrollview import ScrollView
+from kivy.vector import Vector
+
+
+WHEEL_STEP = 1.1  # zoom factor of one step of the scroll wheel
 
 
 class XYScroll(ScrollView):
+    """
+    XYScroll is the ScrollView holding the Picture. Besides scrolling it turns the scroll wheel and two
+    finger pinches into zooming about the cursor, reported to zoom_callback(factor, anchor) with the anchor
+    in the content's coordinates.
+    """
+
     def __init__(self, **kwargs):
         super(XYScroll, self).__init__(**kwargs)
         self.scroll_type = ['bars', 'content']
         self.do_scroll_y = False
+        self.zoom_callback = None
+        self.pinch = []  # the touches down on the view, a pinch is two of them
+
+    def on_touch_down(self, touch):
+        if self.zoom_callback is None or not self.collide_point(*touch.pos):
+            return super(XYScroll, self).on_touch_down(touch)
+        if 'button' in touch.profile and touch.button in ('scrolldown', 'scrollup'):
+            factor = WHEEL_STEP if touch.button == 'scrolldown' else 1.0 / WHEEL_STEP
+            self.zoom_callback(factor, self.to_local(*touch.pos))
+            return True
+        self.pinch = [t for t in self.pinch if t.time_end == -1]  # drop touches whose up we didn't see
+        self.pinch.append(touch)
+        if len(self.pinch) == 2:
+            touch.grab(self)
+            return True  # the second finger only zooms
+        return super(XYScroll, self).on_touch_down(touch)
+
+    def on_touch_move(self, touch):
+        if len(self.pinch) == 2 and touch in self.pinch:
+            a, b = self.pinch
+            other = b if touch is a else a
+            before = Vector(touch.px, touch.py).distance(other.pos)
+            after = Vector(touch.pos).distance(other.pos)
+            if before > 0 and after > 0:
+                mid = ((touch.x + other.x) / 2.0, (touch.y + other.y) / 2.0)
+                self.zoom_callback(after / before, self.to_local(*mid))
+            return True
+        return super(XYScroll, self).on_touch_move(touch)
+
+    def on_touch_up(self, touch):
+        pinching = len(self.pinch) == 2 and touch in self.pinch
+        if touch in self.pinch:
+            self.pinch.remove(touch)
+        if touch.grab_current is self and pinching:
+            touch.ungrab(self)
+            return True
+        return super(XYScroll, self).on_touch_up(touch)
+
+    def visible_rect(self):
+        """
+        the part of the content that is on screen
+        :return: (x0, y0, x1, y1) in the content's coordinates, None if there is no content
+        """
+        vp = self._viewport
+        if vp is None:
+            return None
+        x0 = max(vp.width - self.width, 0) * self.scroll_x
+        y0 = max(vp.height - self.height, 0) * self.scroll_y
+        return x0, y0, x0 + min(self.width, vp.width), y0 + min(self.height, vp.height)
 
     # def update_from_scroll(self, *largs):
     #     '''Force the reposition of the content, according to current value of
@@ -0,0 +1,40 @@
+'''
+The editor application, kept apart from line_annot so Kivy is only imported once the editor is started.
+The view is in editor.kv next to this file.
+'''
+import kivy
+from kivy.app import App
+from kivy.factory import Factory
+from lineannotation.LoadDialog import LoadDialog
+from lineannotation.Root import Root
+from lineannotation.Timings import TIMINGS
+
+
+class Editor(App):
+    def __init__(self, trace=None, hud=False, **kwargs):
+        """
+        :param trace: file the timings of the session are written to when the editor stops
+        :param hud: show the latency overlay from the start
+        """
+        super(Editor, self).__init__(**kwargs)
+        self.trace = trace
+        self.hud = hud
+
+    def on_start(self):
+        if self.trace:
+            self.root.start_timing()
+        if self.hud:
+            self.root.toggle_hud()
+
+    def on_stop(self):
+        self.root.close()
+        if self.trace:
+            TIMINGS.export(self.trace)
+
+
+def run(trace=None, hud=False):
+    kivy.require('1.0.6')
+
+    Factory.register('Root', cls=Root)
+    Factory.register('LoadDialog', cls=LoadDialog)
+    Editor(trace=trace, hud=hud).run()
@@ -7,37 +7,33 @@ You can click adding new points that join to form lines (annotations).
 Scrolling moves the image around the visible window. Annotations are in
 the context of the native image coordinates (0,0) is lower left corner.
 
+Kivy is only imported once the arguments are parsed and the editor starts (see editor.py).
+
 '''
 import os
 os.environ["KIVY_NO_ARGS"] = "1"  # has to be here or kivy will parse the args rather than argparse
 from argparse import ArgumentParser
-import kivy
-from kivy.app import App
-from kivy.factory import Factory
-from lineannotation.LoadDialog import LoadDialog
-from lineannotation.Root import Root
-
-
-class Editor(App):
-    pass
 
 
 def main():
     parser = ArgumentParser()
     parser.add_argument("-ip", "--image_path", help="path to image to open")
     parser.add_argument("-df", "--default_folder", help="folder to use for folder loading", default="~/")
+    parser.add_argument("--trace", help="time the editor and write the timings to this file on exit, "
+                                        "a .csv gets one row per event, any other name gets json")
+    parser.add_argument("--hud", action="store_true", help="show frame time and latencies on screen (key h)")
+    parser.add_argument("--store", help="also write the annotations to this sqlite store (see line_store)")
 
     js_args = parser.parse_args()
     if js_args.image_path:
         os.environ["JS_FILEPATH"] = js_args.image_path
 
     os.environ["JS_DEFAULT_FOLDER"] = js_args.default_folder
+    if js_args.store:
+        os.environ["JS_STORE"] = js_args.store
 
-    kivy.require('1.0.6')
-
-    Factory.register('Root', cls=Root)
-    Factory.register('LoadDialog', cls=LoadDialog)
-    Editor().run()
+    from lineannotation.bin.editor import run
+    run(trace=js_args.trace and os.path.expanduser(js_args.trace), hud=js_args.hud)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+'''
+Batch Sarcomere Analysis
+========================
+
+Runs the sarcomere spacing analysis over every annotated image found in a set of folders. An image is
+analyzed when an annotation file (the image name with .annot_txt appended) sits next to it.
+
+The images are spread over a pool of processes and the per line results are appended to a single csv table
+as each image finishes, so an interrupted run keeps what it has done. Running again with the same output
+skips the annotation files that haven't changed since their rows were written, rows of files that changed
+are dropped and redone. A file is taken as changed when its modification time in nanoseconds differs from
+the one recorded with its rows. A file that fails is reported and the run carries on with the others.
+
+The folders are searched like the annotation store searches them (see AnnotationStore.scan_folder), which
+also gives the modification times, so no annotation file is stat'ed twice.
+'''
+import csv
+import os
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lineannotation.AnnotationFile import ANNOT_EXT
+from lineannotation.AnnotationStore import scan_folder
+
+COLUMNS = ["image", "annotation", "annotation_mtime", "line", "length", "spacing", "n_peaks",
+           "mean_peak_spacing"]
+
+
+def find_pairs(folders):
+    """
+    search the folders for annotation files whose image exists
+    :param folders: list of folders to search
+    :return: (sorted list of (image, annotation) paths, {annotation: mtime_ns} of the annotation files found,
+    list of annotation files without an image)
+    """
+    mtimes = {}
+    for folder in folders:
+        mtimes.update(scan_folder(os.path.expanduser(folder))[0])
+    pairs, orphans = [], []
+    for annotation in sorted(mtimes):
+        image = annotation[:-len(ANNOT_EXT)]
+        if os.path.exists(image):
+            pairs.append((image, annotation))
+        else:
+            orphans.append(annotation)
+    return pairs, mtimes, orphans
+
+
+def load_done(output, mtimes):
+    """
+    read the rows of a previous run, keeping only those of annotation files that haven't changed since
+    :param output: the csv table
+    :param mtimes: {annotation: mtime_ns} of the annotation files there are now
+    :return: (rows to keep, set of annotation files that are up to date)
+    """
+    if not os.path.exists(output):
+        return [], set()
+    with open(output, newline='') as fp:
+        rows = list(csv.DictReader(fp))
+    current = {}
+    for row in rows:
+        annotation = row["annotation"]
+        if annotation not in current:
+            current[annotation] = annotation in mtimes and str(mtimes[annotation]) == row["annotation_mtime"]
+    keep = [row for row in rows if current[row["annotation"]]]
+    return keep, {annotation for annotation, ok in current.items() if ok}
+
+
+def analyze_pair(image, annotation, mtime, options):
+    """
+    analyze one image, runs in a worker process
+    :param mtime: the mtime_ns of the annotation file, recorded with its rows
+    :return: list of result rows
+    """
+    import numpy as np
+    from lineannotation.SarcomereAnalysis import analyze_file
+
+    result = analyze_file(image, annotation, **options)
+    rows = []
+    for i in np.nonzero(result['length'] > 0)[0]:
+        rows.append([image, annotation, mtime, int(i), result['length'][i], result['spacing'][i],
+                     int(result['n_peaks'][i]), result['mean_peak_spacing'][i]])
+    if not rows:  # line -1 records an image with no measurable lines so it isn't redone
+        rows.append([image, annotation, mtime, -1, '', '', '', ''])
+    return rows
+
+
+def main():
+    parser = ArgumentParser(description="measure sarcomere spacing along the annotated lines of many images")
+    parser.add_argument("folders", nargs="+", help="folders searched for annotated images")
+    parser.add_argument("-o", "--output", default="sarcomeres.csv", help="csv table the results are written to")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--step", type=float, default=1.0, help="sample step along the lines in pixels")
+    parser.add_argument("--width", type=float, default=5, help="width of the strip across the lines in pixels")
+    parser.add_argument("--min-period", type=float, default=4.0, help="shortest spacing looked for in pixels")
+    parser.add_argument("--max-period", type=float, default=40.0, help="longest spacing looked for in pixels")
+    parser.add_argument("--pixel-size", type=float, default=1.0, help="pixel size, results are in its units")
+    parser.add_argument("--channel", type=int, default=0, help="channel analyzed in multichannel images")
+    js_args = parser.parse_args()
+
+    options = dict(step=js_args.step, width=js_args.width, min_period=js_args.min_period,
+                   max_period=js_args.max_period, pixel_size=js_args.pixel_size, channel=js_args.channel)
+    pairs, mtimes, orphans = find_pairs(js_args.folders)
+    for annotation in orphans:
+        print("no image for %s" % annotation, file=sys.stderr)
+
+    keep, done = load_done(js_args.output, mtimes)
+    todo = [pair for pair in pairs if pair[1] not in done]
+    print("%d annotated images, %d up to date, %d to analyze" % (len(pairs), len(pairs) - len(todo), len(todo)),
+          file=sys.stderr)
+
+    tmp_name = js_args.output + ".tmp"
+    with open(tmp_name, "w", newline='') as fp:
+        writer = csv.DictWriter(fp, COLUMNS)
+        writer.writeheader()
+        writer.writerows(keep)
+    os.replace(tmp_name, js_args.output)
+
+    failed = 0
+    with open(js_args.output, "a", newline='') as fp, ProcessPoolExecutor(max_workers=js_args.jobs) as pool:
+        writer = csv.writer(fp)
+        futures = {pool.submit(analyze_pair, image, annotation, mtimes[annotation], options): annotation
+                   for image, annotation in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            annotation = futures[future]
+            try:
+                writer.writerows(future.result())
+                fp.flush()
+                print("[%d/%d] %s" % (n, len(todo), annotation), file=sys.stderr)
+            except Exception as e:
+                failed += 1
+                print("[%d/%d] %s failed: %s" % (n, len(todo), annotation, e), file=sys.stderr)
+    if failed:
+        print("%d images failed" % failed, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+'''
+Columnar Export
+===============
+
+Writes the vertices of every annotation file found in a set of folders as one columnar dataset (see
+ColumnarExport), a row per vertex with image_id, z, line_id, vertex, x and y, so a pipeline can load all of
+them with
+
+    from lineannotation.ColumnarExport import read_columns
+    columns = read_columns("vertices")  # {name: numpy array}, pandas.DataFrame(columns) for a table
+'''
+import os
+import sys
+from argparse import ArgumentParser
+
+from lineannotation.AnnotationStore import scan_folder
+from lineannotation.ColumnarExport import FORMATS, export_columns
+
+
+def main():
+    parser = ArgumentParser(description="export the vertices of the annotation files in folders as a columnar dataset")
+    parser.add_argument("folders", nargs="+", help="folders searched for annotation files")
+    parser.add_argument("-o", "--output", default="vertices", help="the folder the dataset is written to")
+    parser.add_argument("--format", choices=FORMATS, default="npz", help="parquet needs pyarrow")
+    parser.add_argument("--chunk", type=int, default=2 ** 20, help="the number of vertices in a chunk")
+    parser.add_argument("--compress", action="store_true", help="compress the chunks")
+    js_args = parser.parse_args()
+
+    annotations = []
+    for folder in js_args.folders:
+        annotations.extend(sorted(scan_folder(os.path.expanduser(folder))[0]))
+    root = os.path.commonpath([os.path.abspath(os.path.expanduser(folder)) for folder in js_args.folders])
+    manifest = export_columns(annotations, os.path.expanduser(js_args.output), js_args.format, js_args.chunk,
+                              js_args.compress, root=root)
+    print("%d images, %d vertices in %d chunks" % (len(manifest["images"]),
+                                                   sum(chunk["rows"] for chunk in manifest["chunks"]),
+                                                   len(manifest["chunks"])), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
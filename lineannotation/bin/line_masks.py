@@ -0,0 +1,129 @@
+'''
+Batch Line Masks
+================
+
+Rasterizes the annotated lines of every annotation file found in a set of folders into masks (see
+LineMasks), e.g. to regenerate the targets of a training set.
+
+For each image.png.annot_txt found, OUTPUT/image.png.masks.npz (at the same place relative to the folder
+searched) is written with np.savez_compressed, holding
+
+    instance    line index + 1 on the pixels of each line, 0 elsewhere, uint16 unless there are more lines
+    binary      the coverage of all the lines, uint8 0 - 255 with anti-aliasing, 0 or 1 without
+
+The masks are the native size of the image and row 0 is its top. The size is read from the image when it
+is there, the lines of a file written for another size are mapped onto it (see native_frame). For a
+z-stack both arrays get a leading axis with a mask for each slice. The images are spread over a pool of
+processes, masks newer than their annotation file are skipped unless --force is given.
+'''
+import os
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lineannotation.AnnotationFile import image_name
+from lineannotation.AnnotationStore import scan_folder
+
+MASK_EXT = ".masks.npz"
+
+
+def find_jobs(folders, output, force=False):
+    """
+    :param folders: the folders searched for annotation files
+    :param output: the folder the masks are written to
+    :param force: redo the masks that are up to date
+    :return: (list of (annotation, mask file) to do, number of masks up to date)
+    """
+    jobs, done = [], 0
+    for folder in folders:
+        folder = os.path.abspath(os.path.expanduser(folder))
+        annotations = scan_folder(folder)[0]
+        for annotation in sorted(annotations):
+            mask = os.path.join(output, os.path.relpath(image_name(annotation), folder) + MASK_EXT)
+            if not force and os.path.exists(mask) and os.stat(mask).st_mtime_ns >= annotations[annotation]:
+                done += 1
+            else:
+                jobs.append((annotation, mask))
+    return jobs, done
+
+
+def write_masks(annotation, mask, width, antialias):
+    """
+    rasterize the lines of one annotation file, runs in a worker process
+    :return: the number of lines
+    """
+    import numpy as np
+    from lineannotation.AnnotationCache import load_annotation
+    from lineannotation.ImageReader import image_size
+    from lineannotation.ImageStack import open_stack
+    from lineannotation.LineArray import LineArray
+    from lineannotation.LineMasks import rasterize
+
+    lines, size, _, slices = load_annotation(annotation, with_slices=True)
+    image = image_name(annotation)
+    n_slices = max(slices) + 1 if slices else None
+    if os.path.exists(image):  # the header of an old file holds the size of the editor's widget instead
+        native = image_size(image)
+        stack = open_stack(image)
+        if stack is not None:
+            n_slices = max(n_slices or 0, stack.n_slices)
+            stack.close()
+    elif size:
+        native = size
+    else:
+        raise ValueError("the file has no image_size and there is no image next to it")
+    n_cols, height = int(native[0]), int(native[1])
+    planes = {0: lines}
+    planes.update((z, LineArray.from_lines(slice_lines)) for z, slice_lines in slices.items())
+    instances, binaries, n_lines = [], [], 0
+    for z in range(n_slices or 1):
+        la = planes[z].to_native(size, native) if z in planes else LineArray()
+        coverage, labels = rasterize(la, (height, n_cols), width, antialias)
+        instances.append(labels)
+        binaries.append(np.rint(coverage * 255).astype(np.uint8) if antialias else (coverage > 0).astype(np.uint8))
+        n_lines += len(la)
+    instance = np.stack(instances) if n_slices else instances[0]
+    binary = np.stack(binaries) if n_slices else binaries[0]
+    if instance.max(initial=0) < 2 ** 16:
+        instance = instance.astype(np.uint16)
+    os.makedirs(os.path.dirname(mask), exist_ok=True)
+    tmp_name = mask + ".tmp.npz"
+    np.savez_compressed(tmp_name, instance=instance, binary=binary)
+    os.replace(tmp_name, mask)
+    return n_lines
+
+
+def main():
+    parser = ArgumentParser(description="rasterize the annotated lines of many images into masks")
+    parser.add_argument("folders", nargs="+", help="folders searched for annotation files")
+    parser.add_argument("-o", "--output", default="masks", help="the folder the masks are written to")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--width", type=float, default=3.0, help="the width of the lines in pixels")
+    parser.add_argument("--no-antialias", action="store_true", help="hard edged lines")
+    parser.add_argument("--force", action="store_true", help="redo the masks that are up to date")
+    js_args = parser.parse_args()
+
+    output = os.path.abspath(os.path.expanduser(js_args.output))
+    todo, done = find_jobs(js_args.folders, output, js_args.force)
+    print("%d annotation files, %d up to date, %d to rasterize" % (len(todo) + done, done, len(todo)),
+          file=sys.stderr)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=js_args.jobs) as pool:
+        futures = {pool.submit(write_masks, annotation, mask, js_args.width, not js_args.no_antialias): annotation
+                   for annotation, mask in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            annotation = futures[future]
+            try:
+                future.result()
+                print("[%d/%d] %s" % (n, len(todo), annotation), file=sys.stderr)
+            except Exception as e:
+                failed += 1
+                print("[%d/%d] %s failed: %s" % (n, len(todo), annotation, e), file=sys.stderr)
+    if failed:
+        print("%d images failed" % failed, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+'''
+Annotation Store
+================
+
+Keeps the annotations of a project folder in an SQLite store (see AnnotationStore) so they can be queried
+across images.
+
+    line_store import FOLDER        store the annotation files found in FOLDER, unchanged files are skipped
+    line_store export FOLDER        write the stored lines back to the annotation files
+    line_store query FOLDER SQL     print the rows of a query, e.g.
+                                    "SELECT path FROM images WHERE n_lines < 5"
+    line_store stats FOLDER         print a table summarizing the annotations of each folder below FOLDER
+
+The store is FOLDER/annotations.sqlite unless --store names another file.
+
+stats imports FOLDER first, so it works as a cache: the folders are listed in parallel and only the
+annotation files whose modification time changed since the last run are read again, by a pool of
+processes. A rerun over a large folder on a network file system then mostly costs listing the folders.
+'''
+import os
+import sys
+from argparse import ArgumentParser
+
+from lineannotation.AnnotationFile import image_name
+from lineannotation.AnnotationStore import STORE_NAME, AnnotationStore, scan_folder
+
+STATS_COLUMNS = ["folder", "images", "annotated", "missing", "lines", "lines/image", "points", "length",
+                 "points/100px"]
+
+
+def folder_stats(store, folder, jobs=1):
+    """
+    bring the store up to date with a folder and summarize the annotations of each folder below it
+    :param store: the AnnotationStore
+    :param folder: the folder
+    :param jobs: the number of processes reading annotation files
+    :return: (rows of STATS_COLUMNS, a row per folder and the total last, the number of files read)
+    """
+    folder = os.path.abspath(folder)
+    scanned = scan_folder(folder)
+    n_read = store.import_folder(folder, jobs=jobs, scanned=scanned)
+    annotated = {os.path.normpath(image_name(annotation)) for annotation in scanned[0]}
+    totals = {}  # folder -> [images, annotated, missing, lines, points, length]
+    for image in annotated.union(scanned[1]):
+        totals.setdefault(os.path.dirname(image), [0, 0, 0, 0, 0, 0.0])[0] += 1
+    for image in scanned[1]:
+        if image not in annotated:
+            totals[os.path.dirname(image)][2] += 1
+    for image, n_lines, n_points, length in store.image_totals():
+        if image in annotated:
+            row = totals[os.path.dirname(image)]
+            row[1] += 1
+            row[3] += n_lines
+            row[4] += n_points
+            row[5] += length
+    grand = [sum(column) for column in zip(*totals.values())] if totals else [0, 0, 0, 0, 0, 0.0]
+    rows = [stats_row(os.path.relpath(path, folder), counts) for path, counts in sorted(totals.items())]
+    rows.append(stats_row("total", grand))
+    return rows, n_read
+
+
+def stats_row(name, counts):
+    images, annotated, missing, lines, points, length = counts
+    return [name, images, annotated, missing, lines, lines / annotated if annotated else 0.0, points, length,
+            100.0 * points / length if length else 0.0]
+
+
+def format_table(header, rows):
+    """
+    :return: the rows as text in aligned columns, numbers to the right
+    """
+    cells = [header] + [["%.1f" % value if isinstance(value, float) else str(value) for value in row]
+                        for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    return "\n".join(" ".join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                              for i, (cell, width) in enumerate(zip(row, widths))) for row in cells)
+
+
+def main():
+    parser = ArgumentParser(description="keep the annotations of a folder in an sqlite store")
+    parser.add_argument("command", choices=["import", "export", "query", "stats"])
+    parser.add_argument("folder", help="the project folder")
+    parser.add_argument("sql", nargs="?", help="the query to run")
+    parser.add_argument("--store", help="the store file, by default %s in the folder" % STORE_NAME)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="processes reading annotation files")
+    js_args = parser.parse_args()
+
+    folder = os.path.expanduser(js_args.folder)
+    store = AnnotationStore(os.path.expanduser(js_args.store) if js_args.store else os.path.join(folder, STORE_NAME))
+    try:
+        if js_args.command == "import":
+            print("%d annotation files stored" % store.import_folder(folder, jobs=js_args.jobs), file=sys.stderr)
+        elif js_args.command == "export":
+            print("%d annotation files written" % store.export(), file=sys.stderr)
+        elif js_args.command == "stats":
+            rows, n_read = folder_stats(store, folder, js_args.jobs)
+            print("%d annotation files read" % n_read, file=sys.stderr)
+            print(format_table(STATS_COLUMNS, rows))
+        else:
+            if not js_args.sql:
+                parser.error("query needs the sql to run")
+            for row in store.query(js_args.sql):
+                print("\t".join("" if value is None else str(value) for value in row))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def run_script(monkeypatch):
+    """
+    :return: function running the main of a command line script module with arguments, returning its exit code
+    """
+    def run(module, *args):
+        monkeypatch.setattr(sys, "argv", [module.__name__.rsplit(".", 1)[-1]] + [str(arg) for arg in args])
+        return module.main()
+    return run
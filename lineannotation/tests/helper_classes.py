@@ -1,6 +1,26 @@
+import json
 
 
 class Pointpos(object):
     def __init__(self, x, y):
         super(Pointpos, self).__init__()
         self.pos = (x, y)
+
+
+def write_annotation(fname, lines, image_size=(100, 100), **extra):
+    """
+    write an annotation file
+    :param extra: other keys of the file, e.g. slices
+    """
+    content = dict(extra, image_size=list(image_size), lines=lines)
+    with open(fname, "w") as fp:
+        json.dump(content, fp)
+
+
+def random_lines(rng, n_lines):
+    """
+    :param rng: a random.Random
+    :return: n_lines lines of 1 to 5 points in a 1024 x 1024 image and the empty line the editor keeps last
+    """
+    return [[(rng.uniform(0, 1024), rng.uniform(0, 1024)) for _ in range(rng.randint(1, 6))]
+            for _ in range(n_lines)] + [[]]
@@ -0,0 +1,64 @@
+import os
+from random import Random
+
+import numpy as np
+
+from .helper_classes import Pointpos, random_lines, write_annotation
+from ..AnnotationCache import cache_name, load_annotation, read_cache
+from ..SarcomereLines import SarcomereLines
+
+
+def test_sidecar_round_trip(tmp_path):
+    fname = str(tmp_path / "a.annot_txt")
+    lines = random_lines(Random(1), 30)
+    write_annotation(fname, lines, (1024, 768))
+    assert read_cache(fname) is None
+    la, image_size, journal_seq = load_annotation(fname, min_cache_bytes=0)
+    assert os.path.exists(cache_name(fname))
+
+    cached, image_size, journal_seq = read_cache(fname)
+    assert isinstance(cached.coords, np.memmap)
+    assert cached.as_list() == la.as_list() == lines
+    assert image_size == [1024, 768] and journal_seq == 0
+
+
+def test_stale_sidecar_is_regenerated(tmp_path):
+    fname = str(tmp_path / "a.annot_txt")
+    write_annotation(fname, random_lines(Random(1), 30), (1024, 768))
+    load_annotation(fname, min_cache_bytes=0)
+    lines = random_lines(Random(2), 40)
+    write_annotation(fname, lines, (1024, 768))
+    os.utime(fname, ns=(1, 1))  # make sure the change shows even on coarse timestamps
+    assert read_cache(fname) is None
+    assert load_annotation(fname, min_cache_bytes=0)[0].as_list() == lines
+    assert read_cache(fname)[0].as_list() == lines
+
+
+def test_truncated_sidecar_is_ignored(tmp_path):
+    fname = str(tmp_path / "a.annot_txt")
+    lines = random_lines(Random(1), 30)
+    write_annotation(fname, lines, (1024, 768))
+    load_annotation(fname, min_cache_bytes=0)
+    with open(cache_name(fname), "r+b") as fp:
+        fp.truncate(100)
+    assert read_cache(fname) is None
+    assert load_annotation(fname)[0].as_list() == lines
+
+
+def test_sarcomere_lines_through_sidecar(tmp_path):
+    fname = str(tmp_path / "a.annot_txt")
+    sl = SarcomereLines(fname)
+    rng = Random(3)
+    for i in range(30000):  # enough points to pass MIN_CACHE_BYTES
+        if i % 100 == 0:
+            sl.end_line()
+            x, y = rng.uniform(0, 1024), rng.uniform(0, 768)
+        x, y = x + rng.uniform(-5, 5), y + rng.uniform(-5, 5)
+        sl.append_point((x, y))
+    sl.write_file(fname, (1024, 768))
+    assert read_cache(fname) is not None
+
+    loaded = SarcomereLines(fname)
+    assert loaded.lines == [[tuple(p) for p in line] for line in sl.lines] + [[]]
+    touch = Pointpos(*sl.lines[5][1])
+    assert loaded.select_nearest_line(touch)[0] == sl.select_nearest_line(touch)[0]
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+from array import array
+
+import pytest
+
+from .helper_classes import Pointpos, write_annotation
+from ..AnnotationFile import parse_stack, read_annotation
+from ..AnnotationStore import AnnotationStore
+from ..SarcomereLines import SarcomereLines
+from ..bin import line_store
+
+
+@pytest.fixture
+def folder(tmp_path):
+    write_annotation(str(tmp_path / "a.png.annot_txt"), [[[0, 0], [30, 40]], [[10, 10], [20, 10]], []])
+    os.mkdir(str(tmp_path / "sub"))
+    write_annotation(str(tmp_path / "sub" / "b.png.annot_txt"), [[[0, 0], [60, 80], [60, 90]]] * 6)
+    return tmp_path
+
+
+def test_import_and_query(folder):
+    store = AnnotationStore(str(folder))
+    assert store.import_folder() == 2
+    assert store.images_with_fewer_lines(5) == [str(folder / "a.png")]
+    assert store.lines_longer_than(50) == [(str(folder / "sub" / "b.png"), i, 110.0) for i in range(6)]
+    assert store.query("SELECT x0, y0, x1, y1 FROM lines WHERE length = 50") == [(0.0, 0.0, 30.0, 40.0)]
+    lines, image_size, journal_seq, slices = store.get(str(folder / "a.png"))
+    assert lines == [[(0.0, 0.0), (30.0, 40.0)], [(10.0, 10.0), (20.0, 10.0)], []]
+    assert image_size == [100, 100] and journal_seq == 0 and slices == {}
+    assert store.import_folder() == 0  # nothing changed
+    store.close()
+
+
+def test_batch_rolls_back(folder):
+    store = AnnotationStore(str(folder))
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.put(str(folder / "c.png"), [[(1, 1)]])
+            raise RuntimeError()
+    assert store.get(str(folder / "c.png")) is None
+    store.close()
+
+
+def test_export_round_trip(folder):
+    store = AnnotationStore(str(folder / "elsewhere.sqlite"))
+    store.import_folder(str(folder))
+    store.put(str(folder / "a.png"), [[(1.5, 2.5), (3.0, 4.0)], []], (100, 100))
+    assert store.export() == 2
+    assert read_annotation(str(folder / "a.png.annot_txt"))[0] == [[[1.5, 2.5], [3.0, 4.0]], []]
+    assert store.import_folder(str(folder)) == 0
+    store.close()
+
+
+def test_editor_writes_through(folder):
+    store = AnnotationStore(str(folder))
+    fname = str(folder / "c.png.annot_txt")
+    sl = SarcomereLines(fname)
+    sl.store = store
+    for xy in ((10, 10), (10, 70)):
+        sl.add_point(Pointpos(*xy))
+    sl.write_file(fname, (100, 100))
+    assert store.lines_longer_than(50) == [(str(folder / "c.png"), 0, 60.0)]
+    assert store.import_folder() == 2  # c.png is already up to date
+    store.close()
+
+
+def test_line_store_query(folder, run_script, capsys):
+    assert run_script(line_store, "import", folder) == 0
+    assert run_script(line_store, "query", folder, "SELECT count(*) FROM lines") == 0
+    assert capsys.readouterr().out == "9\n"
+
+
+def test_stats_rereads_changed_files(folder):
+    for name in ("a.png", "d.png"):
+        open(str(folder / name), "w").close()
+    store = AnnotationStore(str(folder))
+    rows, n_read = line_store.folder_stats(store, str(folder))
+    assert n_read == 2
+    assert rows == [[".", 2, 1, 1, 2, 2.0, 4, 60.0, 100.0 * 4 / 60],
+                    ["sub", 1, 1, 0, 6, 6.0, 18, 660.0, 100.0 * 18 / 660],
+                    ["total", 3, 2, 1, 8, 4.0, 22, 720.0, 100.0 * 22 / 720]]
+    assert line_store.folder_stats(store, str(folder))[1] == 0
+    write_annotation(str(folder / "sub" / "b.png.annot_txt"), [[[0, 0], [0, 10]]])
+    os.utime(str(folder / "sub" / "b.png.annot_txt"), ns=(10 ** 9, 10 ** 9))  # changed, however coarse the clock
+    os.remove(str(folder / "a.png.annot_txt"))
+    rows, n_read = line_store.folder_stats(store, str(folder))
+    assert n_read == 1
+    assert rows[-1] == ["total", 3, 1, 2, 1, 1.0, 2, 10.0, 20.0]
+    store.close()
+
+
+def test_stack_round_trip(folder):
+    fname = str(folder / "s.tif.annot_txt")
+    sl = SarcomereLines(fname, journal=True)
+    store = AnnotationStore(str(folder))
+    sl.store = store
+    for z, xy in ((0, (10, 10)), (3, (20, 20)), (3, (20, 80))):
+        sl.select_slice(z)
+        sl.add_point(Pointpos(*xy))
+    sl.write_file(fname, (100, 100))
+    sl.add_point(Pointpos(30, 30))  # journaled after the file
+    sl.close()
+    with open(fname) as fp:
+        written = parse_stack(fp)
+    lines, image_size, journal_seq, slices = store.get(str(folder / "s.tif"))
+    assert journal_seq == written[2] > 0
+    assert slices == {3: [[(20.0, 20.0), (20.0, 80.0)]]} and lines == [[(10.0, 10.0)]]
+    assert store.lines_longer_than(50) == [(str(folder / "s.tif"), 0, 60.0)]
+    os.remove(fname)
+    store.export([str(folder / "s.tif")])
+    with open(fname) as fp:
+        assert parse_stack(fp) == written
+    store.close()
+    recovered = SarcomereLines(fname, journal=True)  # the journal is replayed from the exported journal_seq
+    recovered.select_slice(3)
+    assert recovered.lines == [[(20.0, 20.0), (20.0, 80.0), (30.0, 30.0)], []]
+    recovered.close()
+
+
+def test_version_1_store_is_migrated(folder):
+    fname = str(folder / "old.sqlite")
+    db = sqlite3.connect(fname)
+    db.executescript("""
+        CREATE TABLE images (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, width INTEGER, height INTEGER,
+                             n_lines INTEGER NOT NULL, n_points INTEGER NOT NULL, mtime_ns INTEGER);
+        CREATE TABLE lines (image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+                            line INTEGER NOT NULL, n_points INTEGER NOT NULL, length REAL NOT NULL,
+                            x0 REAL, y0 REAL, x1 REAL, y1 REAL, points BLOB NOT NULL, PRIMARY KEY (image_id, line));
+        INSERT INTO images VALUES (1, 'a.png', 100, 100, 1, 2, 5);
+    """)
+    db.execute("INSERT INTO lines VALUES (1, 0, 2, 50.0, 0, 0, 30, 40, ?)", (array('d', [0, 0, 30, 40]).tobytes(),))
+    db.commit()
+    db.close()
+    store = AnnotationStore(fname)
+    assert store.get(str(folder / "a.png")) == ([[(0.0, 0.0), (30.0, 40.0)]], [100, 100], None, {})
+    assert store.query("PRAGMA user_version") == [(2,)]
+    store.close()
@@ -0,0 +1,42 @@
+import json
+import os
+import time
+from .helper_classes import Pointpos
+from ..AnnotationWriter import AnnotationWriter
+from ..SarcomereLines import SarcomereLines
+
+
+class CountingLines(SarcomereLines):
+    def __init__(self, fname):
+        super(CountingLines, self).__init__(fname)
+        self.writes = 0
+
+    def write_file(self, fname, img_size):
+        self.writes += 1
+        super(CountingLines, self).write_file(fname, img_size)
+
+
+def test_close_flushes(tmp_path):
+    fname = str(tmp_path / "img.annot_txt")
+    sl = SarcomereLines(fname)
+    writer = AnnotationWriter(sl, fname, interval=60.0)
+    writer.mark_dirty((2048, 2048))  # written straight away, the first write isn't delayed
+    sl.add_point(Pointpos(1, 2))
+    writer.mark_dirty((2048, 2048))
+    writer.close()
+    with open(fname) as fp:
+        assert json.load(fp)["lines"] == [[[1, 2]]]
+    assert not os.path.exists(fname + ".tmp")
+
+
+def test_writes_coalesce(tmp_path):
+    fname = str(tmp_path / "img.annot_txt")
+    sl = CountingLines(fname)
+    writer = AnnotationWriter(sl, fname, interval=60.0)
+    writer.last_write = time.monotonic()  # hold the writer thread back for the interval
+    for i in range(100):
+        sl.add_point(Pointpos(i, i))
+        writer.mark_dirty((2048, 2048))
+    writer.close()
+    assert sl.writes == 1
+    assert len(SarcomereLines(fname).lines[0]) == 100
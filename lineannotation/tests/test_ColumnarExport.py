@@ -0,0 +1,62 @@
+import pytest
+
+from .helper_classes import write_annotation
+from ..ColumnarExport import ColumnarWriter, export_columns, read_columns, read_manifest
+from ..LineArray import LineArray
+from ..bin import line_export
+
+LINES = {"a.png": [[[0, 0], [1, 1], [2, 2]], [], [[5, 5], [6, 7]]],
+         "b.png": [[[10, 10.5]], [[11, 11], [12, 12], [13, 13], [14, 14]], []]}
+
+
+@pytest.fixture
+def annotations(tmp_path):
+    found = []
+    for name, lines in sorted(LINES.items()):
+        found.append(str(tmp_path / (name + ".annot_txt")))
+        write_annotation(found[-1], lines, (100, 50))
+    return found
+
+
+def test_round_trip_in_chunks(annotations, tmp_path):
+    manifest = export_columns(annotations, str(tmp_path / "out"), chunk_size=3, root=str(tmp_path))
+    assert [chunk["rows"] for chunk in manifest["chunks"]] == [3, 3, 3, 1]
+    assert manifest["images"][1] == {"id": 1, "path": "b.png", "width": 100, "height": 50}
+    columns = read_columns(str(tmp_path / "out"))
+    assert columns["image_id"].tolist() == [0] * 5 + [1] * 5
+    assert columns["line_id"].tolist() == [0, 0, 0, 2, 2, 0, 1, 1, 1, 1]
+    assert columns["vertex"].tolist() == [0, 1, 2, 0, 1, 0, 0, 1, 2, 3]
+    assert columns["x"].tolist() == [0, 1, 2, 5, 6, 10, 11, 12, 13, 14]
+    assert columns["y"][5] == 10.5
+    assert columns["z"].tolist() == [0] * 10
+
+
+def test_stack_slices(tmp_path):
+    fname = str(tmp_path / "stack.tif.annot_txt")
+    write_annotation(fname, [[[1, 1], [2, 2]], []], (100, 50), slices={"3": [[[4, 4]], [[5, 5], [6, 6]]]})
+    export_columns([fname], str(tmp_path / "out"))
+    columns = read_columns(str(tmp_path / "out"))
+    assert columns["z"].tolist() == [0, 0, 3, 3, 3]
+    assert columns["line_id"].tolist() == [0, 0, 0, 1, 1]
+    assert columns["x"].tolist() == [1, 2, 4, 5, 6]
+
+
+def test_large_image_is_split(tmp_path):
+    lines = LineArray.from_lines([[(float(i), 0.0) for i in range(25)]])
+    with ColumnarWriter(str(tmp_path), chunk_size=10) as writer:
+        writer.add("big.png", lines)
+        assert writer.n_pending == 5
+    assert [chunk["rows"] for chunk in read_manifest(str(tmp_path))["chunks"]] == [10, 10, 5]
+    columns = read_columns(str(tmp_path), ["vertex"])
+    assert list(columns) == ["vertex"] and columns["vertex"].tolist() == list(range(25))
+
+
+def test_parquet(annotations, tmp_path):
+    pytest.importorskip("pyarrow")
+    export_columns(annotations, str(tmp_path / "out"), fmt="parquet", chunk_size=4)
+    assert read_columns(str(tmp_path / "out"), ["x"])["x"].tolist() == [0, 1, 2, 5, 6, 10, 11, 12, 13, 14]
+
+
+def test_line_export(annotations, tmp_path, run_script):
+    assert run_script(line_export, tmp_path, "-o", tmp_path / "out") == 0
+    assert [image["path"] for image in read_manifest(str(tmp_path / "out"))["images"]] == ["a.png", "b.png"]
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ..ContrastWindow import ContrastWindow, contrast_window, histogram
+from ..ImageReader import image_dtype
+
+
+@pytest.fixture
+def deep():
+    rng = np.random.default_rng(3)
+    return rng.integers(1000, 3000, (300, 400), dtype=np.uint16)  # 12 bit data in 16 bit pixels
+
+
+def test_auto_window(deep):
+    contrast = contrast_window(deep)
+    assert contrast.direct and contrast.range == (1000, 2999)
+    assert 1000 <= contrast.low < 1020 and 2980 < contrast.high <= 2999
+    shown = contrast.apply(deep)
+    assert shown.dtype == np.uint8 and shown.shape == deep.shape
+    assert shown.min() == 0 and shown.max() == 255
+    assert abs(shown.mean() - 127.5) < 2
+
+
+def test_window_level_gamma(deep):
+    contrast = contrast_window(deep)
+    contrast.set_window(2000, 1000)
+    assert (contrast.low, contrast.high) == (1500, 2500)
+    lut = contrast.lut()
+    assert (lut[1500], lut[2000], lut[2500], lut[3000]) == (0, 128, 255, 255)
+    assert contrast.lut() is lut  # cached until the window changes
+    contrast.set_window(2000, 1000, gamma=2.0)
+    assert contrast.lut()[2000] == 64
+    assert np.array_equal(contrast.apply(deep), contrast.lut()[deep])
+
+    contrast.set_relative(0.25, 0.5)
+    level, window = contrast.relative()
+    assert level == pytest.approx(0.25) and window == pytest.approx(0.5)
+    assert contrast.level == pytest.approx(1000 + 0.25 * 1999)
+
+
+def test_float_pixels():
+    data = np.linspace(-1.0, 3.0, 5000, dtype=np.float32).reshape(50, 100)
+    data[0, 0] = np.nan
+    contrast = contrast_window(data)
+    assert not contrast.direct
+    assert contrast.range == pytest.approx((-1.0, 3.0), abs=2e-3)  # to a bin or two
+    contrast.set_window(1.0, 2.0)
+    shown = contrast.apply(data)
+    assert shown[1, 0] == 0 and shown[-1, -1] == 255
+    assert abs(int(shown.ravel()[2500]) - 128) <= 1
+
+
+def test_lut_rows_and_indices(deep):
+    contrast = contrast_window(deep)
+    table = contrast.lut_rows()  # the layout of the lookup table uploaded for the shader
+    assert table.shape == (256, 256) and table.dtype == np.uint8
+    bins = contrast.indices(deep)
+    assert bins.dtype == np.uint16 and np.array_equal(bins, deep)
+    assert np.array_equal(table[bins >> 8, bins & 255], contrast.apply(deep))
+
+    data = np.linspace(-1.0, 3.0, 5000, dtype=np.float32).reshape(50, 100)
+    contrast = contrast_window(data)
+    table, bins = contrast.lut_rows(), contrast.indices(data)
+    assert table.shape == (16, 256) and bins.max() == len(contrast.counts) - 1
+    assert np.array_equal(table[bins >> 8, bins & 255], contrast.apply(data))
+
+
+def test_histogram_subsamples():
+    data = np.ones((4000, 3000), dtype=np.uint8)
+    counts, offset, width, direct = histogram(data, max_samples=10000)
+    assert len(counts) == 256 and counts[1] <= 10000 and counts.sum() == counts[1]
+    assert ContrastWindow(counts).range == (1.0, 1.0)
+
+
+def test_image_dtype(tmp_path, deep):
+    fname = str(tmp_path / "deep.npy")
+    np.save(fname, deep)
+    assert image_dtype(fname) == np.uint16
+    Image.fromarray(deep).save(str(tmp_path / "deep.png"))
+    Image.fromarray((deep >> 4).astype(np.uint8)).save(str(tmp_path / "flat.png"))
+    assert image_dtype(str(tmp_path / "deep.png")) == np.uint16
+    assert image_dtype(str(tmp_path / "flat.png")) == np.uint8
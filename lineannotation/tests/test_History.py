@@ -0,0 +1,25 @@
+from ..History import History, delta_size
+
+
+def test_undo_redo_order():
+    history = History()
+    for delta in (("add", 1, 1), ("add", 2, 2), ("end",)):
+        history.push(delta)
+    assert history.undo() == ("end",)
+    assert history.undo() == ("add", 2, 2)
+    assert history.redo() == ("add", 2, 2)
+    history.push(("add", 3, 3))
+    assert history.redo() is None
+    assert [history.undo() for _ in range(4)] == [("add", 3, 3), ("add", 2, 2), ("add", 1, 1), None]
+
+
+def test_memory_cap():
+    line = [(x, x) for x in range(100)]
+    history = History(max_bytes=3 * delta_size(("remove", 0, 1, line)))
+    for i in range(10):
+        history.push(("remove", i, i, line))
+    assert len(history) == 3
+    assert history.size <= history.max_bytes
+    assert history.undo()[1] == 9
+    history.push(("end",))
+    assert history.size == sum(delta_size(delta) for delta in history.undos)
@@ -0,0 +1,180 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from ..ImagePyramid import ImagePyramid, block_mean
+from ..LRUCache import LRUCache
+
+
+@pytest.fixture
+def pyramid(tmp_path):
+    fname = str(tmp_path / "big.npy")
+    data = (np.arange(1000 * 1500) % 251).astype(np.uint8).reshape(1000, 1500)
+    np.save(fname, data)
+    pyr = ImagePyramid(fname, tile_size=256, cache_bytes=4 * 256 * 256)
+    yield data, pyr
+    pyr.close()
+
+
+def test_levels(pyramid):
+    data, pyr = pyramid
+    assert pyr.size == (1500, 1000)
+    assert pyr.n_levels == 4
+    assert pyr.level_for_scale(2.0) == 0
+    assert pyr.level_for_scale(0.3) == 1
+    assert pyr.level_for_scale(0.001) == 3
+
+
+def test_tiles_in_view_flips_y(pyramid):
+    data, pyr = pyramid
+    # the bottom left corner of the image in y up coordinates is in the last row of tiles
+    assert pyr.tiles_in_view(0, (0, 0, 100, 100)) == [(0, 0, 3)]
+    assert len(pyr.tiles_in_view(0, (0, 0, 1500, 1000))) == 6 * 4
+    assert pyr.tiles_in_view(0, (2000, 0, 2100, 100)) == []
+
+
+def block_means(data, step):
+    """
+    the mean of each step x step block of an image, blocks cut off by the edge are averaged over the pixels
+    they have
+    """
+    rows = np.add.reduceat(np.add.reduceat(data.astype(np.float64), np.arange(0, data.shape[0], step), 0),
+                           np.arange(0, data.shape[1], step), 1)
+    counts = np.outer(np.diff(np.r_[np.arange(0, data.shape[0], step), data.shape[0]]),
+                      np.diff(np.r_[np.arange(0, data.shape[1], step), data.shape[1]]))
+    return rows / counts
+
+
+def test_decode_block_means(pyramid):
+    data, pyr = pyramid
+    tile = pyr.decode((1, 1, 0))
+    assert tile.shape == (256, 256)
+    assert np.abs(tile - block_means(data[0:512, 512:1024], 2)).max() <= 0.5
+    edge = pyr.decode((0, 5, 3))
+    assert edge.shape == (1000 - 768, 1500 - 1280)
+    top = pyr.decode((3, 0, 0))  # built from the levels below, each rounded
+    assert top.shape == (125, 188)
+    assert np.abs(top - block_means(data, 8)).max() <= 1.5
+
+
+def test_level_is_built_from_the_level_below(tmp_path):
+    fname = str(tmp_path / "big.npy")
+    np.save(fname, (np.arange(1000 * 1500) % 251).astype(np.uint8).reshape(1000, 1500))
+    pyr = ImagePyramid(fname, tile_size=256)
+    cut = []
+    cut_box = pyr.cut
+    pyr.cut = lambda box: cut.append(box) or cut_box(box)
+    level1 = [pyr.decode((1, tx, ty)) for ty in range(2) for tx in range(3)]
+    assert len(cut) == 6 * 4
+    del cut[:]
+    assert np.array_equal(pyr.decode((2, 0, 0)), block_mean(np.concatenate(
+        [np.concatenate(level1[0:2], axis=1), np.concatenate(level1[3:5], axis=1)], axis=0)))
+    assert cut == []
+    pyr.close()
+
+
+def test_tile_is_made_once_for_two_threads(pyramid):
+    data, pyr = pyramid
+    made = []
+    make = pyr.make
+    started = threading.Event()
+
+    def slow_make(key):
+        made.append(key)
+        started.set()
+        time.sleep(0.1)
+        return make(key)
+
+    pyr.make = slow_make
+    got = []
+    worker = threading.Thread(target=lambda: got.append(pyr.decode((0, 1, 1))))
+    worker.start()
+    started.wait(5)
+    tile = pyr.decode((0, 1, 1))
+    worker.join()
+    assert made == [(0, 1, 1)]
+    assert got[0] is tile
+
+
+def test_block_mean_odd_edges():
+    tile = np.array([[0, 2, 4], [2, 4, 7]], dtype=np.uint8)
+    assert np.array_equal(block_mean(tile), [[2, 6]])
+    assert block_mean(np.ones((3, 3, 3), dtype=np.float32)).shape == (2, 2, 3)
+
+
+def test_keep_depth(tmp_path):
+    fname = str(tmp_path / "deep.npy")
+    data = (np.arange(300 * 200) * 7 % 4096).astype(np.uint16).reshape(300, 200)
+    np.save(fname, data)
+    pyr = ImagePyramid(fname, tile_size=128, keep_depth=True)
+    tile = pyr.decode((1, 0, 0))
+    assert tile.dtype == np.uint16
+    assert np.abs(tile - block_means(data[0:256, 0:200], 2)).max() <= 0.5
+    assert pyr.sample().shape == (1, 300 * 200)
+    pyr.close()
+
+
+def test_tiled_tiff_is_read_by_tile(tmp_path):
+    fname = str(tmp_path / "tiled.tif")
+    data = (np.arange(700 * 900) * 13 % 60000).astype(np.uint16).reshape(700, 900)
+    tifffile.imwrite(fname, data, tile=(128, 128), compression='zlib')
+    pyr = ImagePyramid(fname, tile_size=256, keep_depth=True)
+    assert pyr.data is not None and pyr.loading is None  # no pixels decoded yet
+    read = []
+    read_tile = pyr.data.read_tile
+    pyr.data.read_tile = lambda i: read.append(i) or read_tile(i)
+    assert np.array_equal(pyr.decode((0, 1, 2)), data[512:700, 256:512])
+    assert len(read) == 4  # the tiles of the file it overlaps, 2 x 2 of them
+    assert np.array_equal(pyr.data[::3, 5:900:7], data[::3, 5:900:7])
+    pyr.close()
+
+
+def test_compressed_image_is_decoded_in_background(tmp_path):
+    fname = str(tmp_path / "big.png")
+    data = (np.arange(600 * 500) % 251).astype(np.uint8).reshape(600, 500)
+    Image.fromarray(data).save(fname)
+    pyr = ImagePyramid(fname, tile_size=256)
+    assert pyr.size == (500, 600) and pyr.samples == 1
+    assert np.array_equal(pyr.loading.result(), data)
+    assert np.array_equal(pyr.decode((0, 1, 1)), data[256:512, 256:500])
+    pyr.close()
+
+
+def test_request_and_cache_cap(pyramid):
+    data, pyr = pyramid
+    done = threading.Event()
+    got = []
+
+    def callback(key, tile):
+        got.append(key)
+        done.set()
+
+    pyr.request((0, 0, 0), callback)
+    assert done.wait(5)
+    assert got == [(0, 0, 0)]
+    for tx in range(6):
+        pyr.decode((0, tx, 1))
+    assert pyr.cache.size <= pyr.cache.max_size
+    assert pyr.tile((0, 0, 0)) is None
+
+
+def test_lru_order():
+    cache = LRUCache(3, sizeof=lambda v: 1)
+    for k in "abc":
+        cache.put(k, k)
+    cache.get("a")
+    cache.put("d", "d")
+    assert "b" not in cache and "a" in cache
+
+
+def test_cache_refuses_values_over_cap():
+    cache = LRUCache(100)
+    assert cache.put("a", np.zeros(50, dtype=np.uint8))
+    assert not cache.put("b", np.zeros(101, dtype=np.uint8))
+    assert "b" not in cache and "a" in cache and cache.size == 50
+    assert not cache.put("a", np.zeros(200, dtype=np.uint8))  # the stale value isn't kept either
+    assert "a" not in cache and cache.size == 0
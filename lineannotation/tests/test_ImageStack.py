@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import tifffile
+
+from ..ImageStack import ImageStack, open_stack
+
+
+@pytest.fixture
+def stack_data():
+    rng = np.random.default_rng(4)
+    return rng.integers(0, 2 ** 16, (6, 2, 40, 30), dtype=np.uint16)  # ZCYX
+
+
+@pytest.mark.parametrize("options", [{"imagej": True}, {"compression": "zlib"}, {"ome": True}])
+def test_planes(tmp_path, stack_data, options):
+    fname = str(tmp_path / "stack.tif")
+    tifffile.imwrite(fname, stack_data, metadata={"axes": "ZCYX"}, **options)
+    stack = open_stack(fname)
+    assert (stack.n_slices, stack.n_channels, stack.size) == (6, 2, (30, 40))
+    assert (stack.data is None) == ("compression" in options)  # compressed pages are decoded one by one
+    for z, c in ((0, 0), (3, 1), (5, 0)):
+        assert np.array_equal(stack.plane(z, c), stack_data[z, c])
+    with pytest.raises(IndexError):
+        stack.plane(6, 0)
+    stack.close()
+
+
+def test_other_axes(tmp_path):
+    data = np.arange(2 * 3 * 8 * 9, dtype=np.uint8).reshape(2, 3, 8, 9)  # time points of a single channel
+    fname = str(tmp_path / "movie.tif")
+    tifffile.imwrite(fname, data, imagej=True, metadata={"axes": "TZYX"})
+    stack = ImageStack(fname)
+    assert (stack.n_slices, stack.n_channels) == (3, 1)
+    assert np.array_equal(stack.plane(2), data[0, 2])  # the first time point
+    stack.close()
+
+
+def test_single_plane_is_not_a_stack(tmp_path):
+    fname = str(tmp_path / "flat.tif")
+    tifffile.imwrite(fname, np.zeros((8, 9), dtype=np.uint8))
+    assert open_stack(fname) is None
+    assert open_stack(str(tmp_path / "flat.png")) is None
@@ -0,0 +1,113 @@
+import json
+import os
+from .helper_classes import Pointpos
+from ..SarcomereLines import SarcomereLines, JOURNAL_EXT
+
+
+def edit(sl):
+    sl.add_point(Pointpos(1, 1))
+    sl.add_point(Pointpos(2, 2))
+    sl.end_line()
+    sl.add_point(Pointpos(3, 3))
+    sl.add_point(Pointpos(4, 4))
+    sl.undo_last()
+    sl.end_line()
+    sl.add_point(Pointpos(5, 5))
+    sl.add_point(Pointpos(6, 6))
+    sl.end_line()
+    sl.remove_nearest(Pointpos(5, 5), None)
+    sl.undo_last()
+    sl.redo()
+    sl.undo_last()
+    sl.move_point(0, 1, (9, 9))
+    sl.move_point(0, 0, (8, 8))
+    sl.undo_last()
+
+
+def test_recover_without_snapshot(tmp_path):
+    fname = str(tmp_path / "img.annot_txt")
+    sl = SarcomereLines(fname, journal=True)
+    edit(sl)
+    expected = [[list(p) for p in line] for line in sl.lines]
+    sl.close()  # crash before the file is ever written
+
+    recovered = SarcomereLines(fname, journal=True)
+    assert [[list(p) for p in line] for line in recovered.lines] == expected
+
+
+def test_recover_after_snapshot(tmp_path):
+    fname = str(tmp_path / "img.annot_txt")
+    sl = SarcomereLines(fname, journal=True)
+    sl.add_point(Pointpos(1, 1))
+    sl.add_point(Pointpos(2, 2))
+    sl.write_file(fname, (2048, 2048))
+    assert not os.path.exists(fname + JOURNAL_EXT)
+    sl.add_point(Pointpos(3, 3))
+    sl.close()
+
+    recovered = SarcomereLines(fname, journal=True)
+    assert [[list(p) for p in line] for line in recovered.lines] == [[[1, 1], [2, 2], [3, 3]], []]
+
+
+def test_truncated_record_dropped(tmp_path):
+    fname = str(tmp_path / "img.annot_txt")
+    sl = SarcomereLines(fname, journal=True)
+    sl.add_point(Pointpos(1, 1))
+    sl.close()
+    with open(fname + JOURNAL_EXT, "a") as fp:
+        fp.write('[2, "add", 2')
+
+    recovered = SarcomereLines(fname, journal=True)
+    recovered.add_point(Pointpos(7, 7))
+    recovered.close()
+    with open(fname + JOURNAL_EXT) as fp:
+        records = [json.loads(line) for line in fp]
+    assert records[-1] == [3, "add", 7, 7]
+    assert len(SarcomereLines(fname, journal=True).lines) == 3
+
+
+def test_recover_slices(tmp_path):
+    fname = str(tmp_path / "stack.tif.annot_txt")
+    sl = SarcomereLines(fname, journal=True)
+    sl.select_slice(2)
+    sl.add_point(Pointpos(1, 1))
+    sl.write_file(fname, (64, 64))
+    sl.add_point(Pointpos(2, 2))  # replayed from slice 0 of the file, so the journal has to switch first
+    sl.select_slice(4)
+    sl.add_point(Pointpos(3, 3))
+    sl.close()
+
+    def points(sl):
+        return {z: [[list(p) for p in line] for line in lines if line] for z, lines in sl.slice_lines().items()}
+
+    recovered = SarcomereLines(fname, journal=True)
+    assert recovered.z == 4
+    assert points(recovered) == {2: [[[1, 1], [2, 2]]], 4: [[[3, 3]]]}
+    recovered.add_point(Pointpos(5, 5))  # loading ended the line on every slice, and journaled it
+    recovered.select_slice(2)
+    recovered.add_point(Pointpos(6, 6))
+    recovered.close()
+    assert points(SarcomereLines(fname, journal=True)) == {2: [[[1, 1], [2, 2]], [[6, 6]]], 4: [[[3, 3]], [[5, 5]]]}
+
+
+def test_deferred_journal(tmp_path):
+    fname = str(tmp_path / "stack.tif.annot_txt")
+    sl = SarcomereLines(fname, journal=True)
+    sl.select_slice(2)
+    sl.add_point(Pointpos(1, 1))
+    sl.write_file(fname, (64, 64))
+    sl.add_point(Pointpos(2, 2))  # continues the line that is in progress in the file
+    sl.close()
+    with open(fname + JOURNAL_EXT) as fp:
+        journaled = fp.read()
+
+    preloaded = SarcomereLines(fname, journal=True, defer_journal=True)
+    assert preloaded.slice_lines()[2] == [[(1, 1)]]  # as in the file, the lines aren't ended yet
+    with open(fname + JOURNAL_EXT) as fp:
+        assert fp.read() == journaled
+    preloaded.open_journal()
+    opened = SarcomereLines(fname, journal=True)
+    assert preloaded.slice_lines() == opened.slice_lines() == {2: [[(1, 1), (2, 2)], []]}
+    assert preloaded.z == opened.z and len(preloaded.history) == 0
+    preloaded.close()
+    opened.close()
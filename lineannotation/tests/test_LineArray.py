@@ -0,0 +1,83 @@
+from random import Random
+
+from .helper_classes import Pointpos, random_lines
+from ..LineArray import LineArray, LineList
+from ..SarcomereLines import SarcomereLines
+
+
+def test_round_trip():
+    lines = random_lines(Random(1), 50)
+    assert LineArray.from_lines(lines).as_list() == lines
+
+
+def test_edits_match_list():
+    la = LineArray(capacity=1)
+    lines = [[]]
+    for i in range(20):
+        la.append_point((i, 2 * i))
+        lines[-1].append((i, 2 * i))
+        if i % 3 == 2:
+            la.end_line()
+            lines.append([])
+    la.pop_point()
+    lines[-1].pop()
+    la.remove_line(2)
+    del lines[2]
+    assert la.as_list() == [[(float(x), float(y)) for x, y in line] for line in lines]
+
+
+def test_remove_only_line():
+    la = LineArray.from_lines([[(1, 1), (2, 2)]])
+    la.remove_line(0)
+    assert la.as_list() == [[]]
+
+
+def test_insert_delete_set():
+    lines = random_lines(Random(2), 10)
+    la = LineArray.from_lines(lines)
+    la.insert_line(3, [(1.0, 2.0), (3.0, 4.0)])
+    lines.insert(3, [(1.0, 2.0), (3.0, 4.0)])
+    la.insert_line(0, [])
+    lines.insert(0, [])
+    la.delete_line(5)
+    del lines[5]
+    la.set_point(4, 1, (7.0, 8.0))
+    lines[4][1] = (7.0, 8.0)
+    la.append_line([(9.0, 9.0)])
+    lines.append([(9.0, 9.0)])
+    assert la.as_list() == lines
+
+
+def test_line_list_reads_like_a_list():
+    lines = random_lines(Random(4), 6)
+    view = LineList(LineArray.from_lines(lines))
+    assert view == lines and len(view) == len(lines)
+    assert view[2][0] == lines[2][0] and view[-2][1:] == lines[-2][1:]
+    view.append([])
+    view[-1].append((5.0, 6.0))
+    view[-1].append((7.0, 8.0))
+    assert view[-1].pop() == (7.0, 8.0)
+    view[0][-1] = (1.0, 1.0)
+    assert view.pop() == [(5.0, 6.0)]
+    del view[1]
+    lines[0][-1] = (1.0, 1.0)
+    del lines[1]
+    assert view == lines and view.array.as_list() == lines
+
+
+def test_lengths():
+    la = LineArray.from_lines([[(0, 0), (3, 4), (3, 10)], [(5, 5)], []])
+    assert la.lengths().tolist() == [11.0, 0.0, 0.0]
+
+
+def test_nearest_matches_sarcomere_lines(tmp_path):
+    rng = Random(3)
+    sl = SarcomereLines(str(tmp_path / "none.annot_txt"))
+    for line in random_lines(rng, 40):
+        for p in line:
+            sl.add_point(Pointpos(*p))
+        sl.end_line()
+    la = sl.to_array()
+    for _ in range(50):
+        p = (rng.uniform(0, 1024), rng.uniform(0, 1024))
+        assert la.nearest_line(p)[0] == sl.select_nearest_line(Pointpos(*p))[0]
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import tifffile
+from PIL import Image
+
+from .helper_classes import write_annotation
+from ..LineArray import LineArray
+from ..LineMasks import binary_mask, instance_mask, rasterize
+from ..bin import line_masks
+
+
+def test_y_up_and_width():
+    mask = binary_mask([[(2.5, 1.5), (7.5, 1.5)]], (10, 12), width=3, antialias=False)
+    assert mask.dtype == bool
+    assert np.nonzero(mask.any(axis=1))[0].tolist() == [7, 8, 9]  # y = 1.5 is row 8 from the top
+    assert np.nonzero(mask.any(axis=0))[0].tolist() == list(range(1, 9))  # the ends are round
+    flipped = binary_mask([[(2.5, 1.5), (7.5, 1.5)]], (10, 12), width=3, antialias=False, y_up=False)
+    assert np.array_equal(flipped, mask[::-1])
+
+
+def test_antialias_ramps_over_the_edge():
+    coverage = binary_mask([[(0.0, 5.25), (20.0, 5.25)]], (10, 20), width=2)
+    column = coverage[:, 10]
+    assert column.max() == 1.0
+    assert 0.0 < column[3] < 1.0 and 0.0 < column[5] < 1.0  # the rows half covered
+    assert column[:3].max() == 0.0 and column[6:].max() == 0.0
+
+
+def test_instances_go_to_the_nearest_line():
+    lines = [[(1.5, 1.5), (9.5, 1.5)], [(1.5, 2.0), (9.5, 2.0)], [], [(5.5, 7.5)]]
+    labels = instance_mask(lines, (10, 12), width=3)
+    assert labels[8, 5] == 1 and labels[7, 5] == 2
+    assert labels[2, 5] == 4  # a single point is a dot
+    assert set(np.unique(labels)) == {0, 1, 2, 4}
+
+
+def test_long_diagonal_matches_brute_force():
+    lines = [[(3.0, 4.0), (180.0, 150.0), (20.0, 190.0)]]
+    coverage, labels = rasterize(LineArray.from_lines(lines), (200, 200), width=4)
+    rows, cols = np.mgrid[0:200, 0:200]
+    x, y = cols + 0.5, 200 - rows - 0.5
+    d = np.full((200, 200), np.inf)
+    for (ax, ay), (bx, by) in zip(lines[0], lines[0][1:]):
+        t = np.clip(((x - ax) * (bx - ax) + (y - ay) * (by - ay)) / ((bx - ax) ** 2 + (by - ay) ** 2), 0, 1)
+        d = np.minimum(d, np.hypot(x - ax - t * (bx - ax), y - ay - t * (by - ay)))
+    assert np.allclose(coverage, np.clip(2.5 - d, 0, 1), atol=1e-5)
+    assert np.array_equal(labels > 0, d <= 2)
+
+
+def test_line_masks(tmp_path, run_script):
+    write_annotation(str(tmp_path / "a.png.annot_txt"), [[[5, 5], [25, 5]], []], (30, 20))
+    out = str(tmp_path / "masks")
+    assert run_script(line_masks, tmp_path, "-o", out, "-j", 1) == 0
+    with np.load(os.path.join(out, "a.png.masks.npz")) as masks:
+        assert masks["instance"].shape == (20, 30) and masks["instance"].dtype == np.uint16
+        assert masks["instance"].max() == 1 and masks["binary"].max() == 255
+    assert line_masks.find_jobs([str(tmp_path)], out) == ([], 1)
+
+
+def test_line_masks_sizes_from_the_image(tmp_path, run_script):
+    Image.fromarray(np.zeros((20, 40), dtype=np.uint8)).save(str(tmp_path / "a.png"))
+    # an old file, the image was fitted into the 2048 square, 51.2 fold with 512 above and below
+    write_annotation(str(tmp_path / "a.png.annot_txt"), [[[256, 793.6], [1280, 793.6]], []], (2048, 2048))
+    tifffile.imwrite(str(tmp_path / "s.tif"), np.zeros((4, 20, 30), dtype=np.uint8),
+                     photometric="minisblack", metadata={"axes": "ZYX"})
+    write_annotation(str(tmp_path / "s.tif.annot_txt"), [[[5, 5], [25, 5]], []], (30, 20),
+                     slices={"2": [[[5, 15], [25, 15]]]})
+    out = str(tmp_path / "masks")
+    assert run_script(line_masks, tmp_path, "-o", out, "-j", 1) == 0
+    with np.load(os.path.join(out, "a.png.masks.npz")) as masks:
+        assert masks["instance"].shape == (20, 40)
+        assert np.nonzero(masks["instance"].any(axis=1))[0].tolist() == [13, 14, 15]  # y = 5.5
+    with np.load(os.path.join(out, "s.tif.masks.npz")) as masks:
+        instance = masks["instance"]
+        assert instance.shape == masks["binary"].shape == (4, 20, 30)
+        assert instance[0, 15, 15] == 1 and instance[1].max() == 0 and instance[2, 5, 15] == 1
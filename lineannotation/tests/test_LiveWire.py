@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+
+from .helper_classes import Pointpos
+from ..LRUCache import LRUCache
+from ..LiveWire import LiveWire, cost_map, shortest_path
+from ..SarcomereLines import SarcomereLines
+
+
+def ridge_image(fname, size=200):
+    """
+    a dark image with a bright arc, y = 100 + 40 sin(x / 40) in native coordinates
+    """
+    rows, cols = np.mgrid[0:size, 0:size]
+    ridge = size - 100 - 40 * np.sin((cols + 0.5) / 40.0) - 0.5
+    image = (255 * np.exp(-((rows - ridge) / 1.5) ** 2)).astype(np.uint8)
+    np.save(fname, image)
+    return fname
+
+
+def live_wire(fname, **kwargs):
+    wire = LiveWire(fname, cache=LRUCache(2 ** 30), **kwargs)
+    wire.future.result()
+    return wire
+
+
+def test_cost_map_is_low_on_ridges():
+    image = np.zeros((20, 20), dtype=np.uint8)
+    image[10] = 200
+    costs = cost_map(image)
+    assert costs.shape == (20, 20)
+    assert costs[10].max() < costs[0].min()
+
+
+def test_shortest_path_stays_in_corridor():
+    costs = np.ones((50, 50), dtype=np.float32)
+    costs[:, 40] = 0.01  # a cheap column far from the segment
+    path = shortest_path(costs, (10, 10), (10, 30), margin=5)
+    assert path[0] == (10, 10) and path[-1] == (10, 30)
+    assert all(abs(r - 10) <= 5 for r, c in path)
+
+
+def test_route_follows_ridge(tmp_path):
+    wire = live_wire(ridge_image(str(tmp_path / "ridge.npy")), margin=45)
+    p0, p1 = (20.5, 100 + 40 * math.sin(20.5 / 40)), (150.5, 100 + 40 * math.sin(150.5 / 40))
+    path = wire.route(p0, p1)
+    assert path[-1] == p1
+    assert 2 < len(path) < 40
+    for x, y in path:
+        assert abs(y - (100 + 40 * math.sin(x / 40.0))) < 2.0
+
+
+def test_far_points_are_not_routed(tmp_path):
+    wire = live_wire(ridge_image(str(tmp_path / "ridge.npy")), max_length=50)
+    assert wire.route((10, 100), (100, 100)) is None
+
+
+def test_cost_map_is_cached(tmp_path):
+    fname = ridge_image(str(tmp_path / "ridge.npy"))
+    cache = LRUCache(2 ** 30)
+    LiveWire(fname, cache=cache).future.result()
+    wire = LiveWire(fname, cache=cache)
+    assert wire.future is None and wire.ready
+
+
+def test_snapped_path_is_one_edit(tmp_path):
+    sl = SarcomereLines(str(tmp_path / "ridge.annot_txt"))
+    sl.snap = live_wire(ridge_image(str(tmp_path / "ridge.npy")), margin=45)
+    sl.add_point(Pointpos(20.5, 100 + 40 * math.sin(20.5 / 40)))
+    sl.add_point(Pointpos(150.5, 100 + 40 * math.sin(150.5 / 40)))
+    snapped = list(sl.lines[-1])
+    assert len(snapped) > 3
+    sl.undo_last()
+    assert sl.lines[-1] == snapped[:1]
+    sl.redo()
+    assert sl.lines[-1] == snapped
+    assert sl.select_nearest_line(Pointpos(*snapped[2]))[1] == snapped
+
+
+def test_submitted_route_matches_route(tmp_path):
+    wire = live_wire(ridge_image(str(tmp_path / "ridge.npy")), margin=45)
+    p0, p1 = (20.5, 100 + 40 * math.sin(20.5 / 40)), (150.5, 100 + 40 * math.sin(150.5 / 40))
+    sl = SarcomereLines(str(tmp_path / "ridge.annot_txt"))
+    sl.add_point(Pointpos(*p0))
+    sl.add_routed(p1, wire.submit(p0, p1).result())
+    assert sl.lines[-1] == [p0] + wire.route(p0, p1)
+    sl.undo_last()
+    assert sl.lines[-1] == [p0]
@@ -0,0 +1,40 @@
+import math
+
+from ..PolylineSimplifier import PolylineSimplifier
+from ..SegmentGrid import point_segment_dist
+
+
+def simplify(points, **kwargs):
+    simplifier = PolylineSimplifier(**kwargs)
+    kept = []
+    for p in points:
+        kept.extend(simplifier.add(p))
+    return kept + simplifier.finish()
+
+
+def test_straight_line_keeps_endpoints():
+    points = [(float(x), 2.0 * x) for x in range(50)]
+    assert simplify(points) == [points[0], points[-1]]
+
+
+def test_deviation_within_tolerance():
+    points = [(x / 2.0, 10 * math.sin(x / 15.0)) for x in range(400)]
+    kept = simplify(points, tolerance=0.5)
+    assert kept[0] == points[0] and kept[-1] == points[-1]
+    assert len(kept) < len(points) // 5
+    for p in points:
+        assert min(point_segment_dist(p, a, b) for a, b in zip(kept, kept[1:])) <= 0.5 + 1e-9
+
+
+def test_window_is_capped():
+    points = [(float(x), 0.0) for x in range(100)]
+    kept = simplify(points, max_window=10)
+    assert kept == [points[i] for i in range(0, 100, 10)] + [points[-1]]
+
+
+def test_repeated_samples_are_dropped():
+    simplifier = PolylineSimplifier()
+    assert simplifier.add((1, 1)) == [(1, 1)]
+    assert simplifier.add((1, 1)) == []
+    assert simplifier.tail is None
+    assert simplifier.finish() == []
@@ -0,0 +1,46 @@
+import threading
+from ..Prefetcher import Prefetcher
+
+
+def test_take_prefetched():
+    discarded = []
+    prefetcher = Prefetcher(lambda key: key * 2, discard=discarded.append)
+    prefetcher.prefetch([1, 2])
+    prefetcher.executor.submit(lambda: None).result()  # the single loading thread is done with 1 and 2
+    assert prefetcher.take(1) == 2
+    assert prefetcher.take(1) is None  # handed over, not kept
+    assert prefetcher.take(3) is None
+    prefetcher.prefetch([3])
+    assert discarded == [4]  # 2 is no longer wanted
+    prefetcher.executor.submit(lambda: None).result()
+    prefetcher.close()
+    assert discarded == [4, 6]
+
+
+def test_take_waits_for_running_load():
+    started, release = threading.Event(), threading.Event()
+
+    def load(key):
+        started.set()
+        release.wait()
+        return key
+
+    discarded = []
+    prefetcher = Prefetcher(load, discard=discarded.append)
+    prefetcher.prefetch(["a"])
+    started.wait()
+    threading.Timer(0.05, release.set).start()
+    assert prefetcher.take("a") == "a"
+    prefetcher.close()
+    assert discarded == []
+
+
+def test_failed_load():
+    def load(key):
+        raise OSError(key)
+
+    prefetcher = Prefetcher(load)
+    prefetcher.prefetch(["a"])
+    prefetcher.executor.submit(lambda: None).result()
+    assert prefetcher.take("a") is None
+    prefetcher.close()
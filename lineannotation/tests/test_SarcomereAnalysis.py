@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from ..LineArray import LineArray
+from ..SarcomereAnalysis import (analyze, autocorrelation_spacing, bilinear, pad_profiles, peak_spacings, resample,
+                                 summarize)
+
+
+def banded_image(period, angle, size=400):
+    # bands of the given period running perpendicular to the direction angle
+    rows, cols = np.mgrid[0:size, 0:size]
+    x, y = cols + 0.5, size - rows - 0.5
+    along = x * np.cos(angle) + y * np.sin(angle)
+    return (100 + 50 * np.cos(2 * np.pi * along / period)).astype(np.uint16)
+
+
+def test_bilinear_matches_pixels():
+    image = np.arange(12, dtype=np.float64).reshape(3, 4)
+    # the center of the pixel in row 0, column 1 is at x 1.5, y 2.5 (y up)
+    assert bilinear(image, np.array([1.5]), np.array([2.5]))[0] == 1.0
+    assert bilinear(image, np.array([2.0]), np.array([2.5]))[0] == 1.5
+
+
+def test_resample_steps():
+    lines = LineArray.from_lines([[(0, 0), (10, 0), (10, 5)], [(3, 3)], [(0, 0), (0, 2)]])
+    positions, tangents, sample_line = resample(lines, step=1.0)
+    assert np.bincount(sample_line).tolist() == [16, 0, 3]
+    assert np.allclose(positions[11], (10, 1))
+    assert np.allclose(tangents[11], (0, 1))
+
+
+@pytest.mark.parametrize("angle", [0.0, 0.6])
+def test_recovers_period(angle):
+    period = 9.5
+    image = banded_image(period, angle)
+    d = np.array([np.cos(angle), np.sin(angle)])
+    lines = [[tuple(c + t * d) for t in (0.0, 150.0)] for c in ((100, 100), (120, 80))] + [[]]
+    result = analyze(image, lines, width=5, min_period=4, max_period=20, pixel_size=0.5)
+    assert np.allclose(result['spacing'][:2], period * 0.5, atol=0.1)
+    assert np.isnan(result['spacing'][2])
+    assert np.allclose(result['length'][:2], 75.0)
+    assert abs(summarize(result)['median'] - period * 0.5) <= 0.5
+
+
+def line_profiles(rng, lengths, period=8.0):
+    profiles = [np.cos(2 * np.pi * (np.arange(n) + rng.uniform(0, period)) / period) + rng.normal(0, 0.3, n)
+                for n in lengths]
+    return np.concatenate(profiles), np.repeat(np.arange(len(lengths)), lengths)
+
+
+def test_lines_are_analyzed_on_their_own():
+    rng = np.random.default_rng(5)
+    lengths = [40, 400, 0, 33, 3000, 17] + rng.integers(3, 30, 100).tolist()
+    profile, sample_line = line_profiles(rng, lengths)
+    spacing, line = peak_spacings(profile, sample_line, min_period=6)
+    periods = autocorrelation_spacing(profile, sample_line, len(lengths), min_period=4, max_period=20)
+    for i, n in enumerate(lengths):
+        alone = profile[sample_line == i]
+        alone_spacing, _ = peak_spacings(alone, np.zeros(n, dtype=np.int64), min_period=6)
+        assert np.array_equal(spacing[line == i], alone_spacing)
+        alone_period = autocorrelation_spacing(alone, np.zeros(n, dtype=np.int64), 1, min_period=4, max_period=20)
+        assert np.allclose(periods[i], alone_period, equal_nan=True)
+
+
+def test_pad_profiles_rows():
+    profile, sample_line = line_profiles(np.random.default_rng(6), [5, 1000, 3])
+    matrix, counts = pad_profiles(profile, sample_line, 3, rows=[2, 0])
+    assert matrix.shape == (2, 5) and counts.tolist() == [3, 5]
+    assert np.array_equal(matrix[0, :3], profile[-3:]) and np.array_equal(matrix[1], profile[:5])
@@ -1,7 +1,7 @@
 import pathlib
 import pytest
-from random import random
-from .helper_classes import Pointpos
+from random import Random, random
+from .helper_classes import Pointpos, random_lines, write_annotation
 from ..SarcomereLines import SarcomereLines
 
 TEST_FILE = "testme.annot_txt"
@@ -96,3 +96,245 @@ def test_remove_line(create_class, segment_maker):
 
 def test_true():
     assert True
+
+
+def test_nearest_segment_not_vertex(create_class, segment_maker):
+    test_file, sl = create_class
+
+    # the click is next to the middle of the long segment but closer to a vertex of the short one
+    segment_maker(sl, 0, 0, 1000, 0)
+    segment_maker(sl, 560, 60, 600, 60)
+
+    n_idx, n_line = sl.select_nearest_line(Pointpos(500, 20))
+    assert n_idx == 0
+
+
+def test_undo_updates_index(create_class, segment_maker):
+    test_file, sl = create_class
+
+    segment_maker(sl, 200, 100, 400, 100)
+    sl.add_point(Pointpos(500, 200))
+    sl.add_point(Pointpos(500, 400))
+    sl.undo_last()
+    sl.undo_last()
+
+    n_idx, n_line = sl.select_nearest_line(Pointpos(510, 300))
+    assert n_idx == 0
+
+
+def test_keys_in_rect(create_class, segment_maker):
+    test_file, sl = create_class
+
+    segment_maker(sl, 200, 100, 400, 100)
+    segment_maker(sl, 1500, 1500, 1600, 1600)
+
+    assert sl.keys_in_rect(250, 50, 300, 150) == {sl.keys[0]}
+    assert sl.keys_in_rect(0, 0, 2048, 2048) == {sl.keys[0], sl.keys[1]}
+
+
+def test_undo_redo_remove(create_class, segment_maker):
+    test_file, sl = create_class
+
+    segment_maker(sl, 200, 100, 400, 100)
+    segment_maker(sl, 500, 200, 500, 400)
+    segment_maker(sl, 400, 500, 200, 500)
+    before = [list(line) for line in sl.lines]
+    key = sl.keys[1]
+
+    sl.remove_nearest(Pointpos(510, 210), None)
+    assert sl.undo_last() == [(key, [(500, 200), (500, 400)])]
+    assert sl.lines == before and sl.keys[1] == key
+    assert sl.select_nearest_line(Pointpos(510, 210))[0] == 1
+
+    assert sl.redo() == [(key, None)]
+    assert len(sl.lines) == 3 and key not in sl.keys
+    assert sl.redo() == []
+
+
+def test_undo_redo_points(create_class):
+    test_file, sl = create_class
+
+    for x in (1, 2, 3):
+        sl.add_point(Pointpos(x, x))
+    sl.end_line()
+    sl.undo_last()
+    sl.undo_last()
+    assert sl.lines == [[(1, 1), (2, 2)]]
+    sl.redo()
+    sl.redo()
+    assert sl.lines == [[(1, 1), (2, 2), (3, 3)], []]
+
+    sl.undo_last()
+    sl.add_point(Pointpos(9, 9))  # a new edit drops what was undone
+    assert sl.redo() == []
+    assert sl.lines == [[(1, 1), (2, 2), (3, 3), (9, 9)]]
+
+
+def test_undo_past_history(tmp_path):
+    fname = str(tmp_path / "a.annot_txt")
+    sl = SarcomereLines(fname, history_bytes=500)
+    for x in range(20):
+        sl.add_point(Pointpos(x, x))
+    assert len(sl.history) < 20  # the oldest edits were forgotten
+    for _ in range(20):
+        sl.undo_last()  # and then undo falls back to removing points
+    assert sl.lines == [[]]
+
+
+def test_drag_point(create_class, segment_maker):
+    test_file, sl = create_class
+
+    segment_maker(sl, 200, 100, 400, 100)
+    segment_maker(sl, 500, 200, 500, 400)
+    assert sl.nearest_vertex(Pointpos(495, 395), 10) == (1, 1)
+    assert sl.nearest_vertex(Pointpos(300, 100), 10) is None  # beside a segment, away from its points
+
+    sl.set_point(1, 1, (700, 400))  # dragging
+    sl.set_point(1, 1, (800, 450))
+    sl.move_point(1, 1, (800, 450), old=(500, 400))
+    assert sl.lines[1] == [(500, 200), (800, 450)]
+    assert sl.nearest_vertex(Pointpos(500, 400), 10) is None
+    assert sl.select_nearest_line(Pointpos(795, 445))[0] == 1
+
+    key = sl.keys[1]
+    assert sl.undo_last() == [(key, [(500, 200), (500, 400)])]
+    assert sl.nearest_vertex(Pointpos(500, 400), 10) == (1, 1)
+    assert sl.redo() == [(key, [(500, 200), (800, 450)])]
+    assert sl.select_nearest_line(Pointpos(795, 445))[0] == 1
+
+
+def test_slices(tmp_path, segment_maker):
+    fname = str(tmp_path / "stack.tif.annot_txt")
+    sl = SarcomereLines(fname)
+    segment_maker(sl, 10, 10, 20, 20)
+    sl.select_slice(3)
+    assert sl.lines == [[]]
+    segment_maker(sl, 30, 30, 40, 40)
+    sl.add_point(Pointpos(50, 50))
+    sl.select_slice(5)
+    sl.select_slice(0)
+    assert sl.lines == [[(10, 10), (20, 20)], []]
+    assert sl.select_nearest_line(Pointpos(35, 35))[1] == [(10, 10), (20, 20)]  # other slices aren't indexed
+    sl.select_slice(3)
+    assert sl.lines == [[(30, 30), (40, 40)], [(50, 50)]]
+    sl.undo_last()  # each slice has its own history
+    assert sl.lines == [[(30, 30), (40, 40)], []]
+    sl.redo()
+    sl.write_file(fname, (100, 100))
+
+    read_in = SarcomereLines(fname)
+    assert read_in.lines == [[(10, 10), (20, 20)], []]
+    assert sorted(read_in.slice_lines()) == [0, 3]
+    read_in.select_slice(3)
+    assert read_in.lines == [[(30, 30), (40, 40)], [(50, 50)], []]
+    assert read_in.select_nearest_line(Pointpos(49, 49))[0] == 1
+
+
+def test_drag_single_point(create_class):
+    test_file, sl = create_class
+
+    sl.add_point(Pointpos(10, 10))
+    sl.end_line()
+    assert sl.nearest_vertex(Pointpos(11, 10), 10) == (0, 0)
+    sl.move_point(0, 0, (30, 30))
+    assert sl.lines[0] == [(30, 30)]
+    assert sl.nearest_vertex(Pointpos(29, 30), 10) == (0, 0)
+    assert sl.nearest_vertex(Pointpos(11, 10), 10) is None
+
+
+def test_undo_redo_remove_line_in_progress(create_class):
+    test_file, sl = create_class
+
+    sl.add_point(Pointpos(10, 10))
+    sl.add_point(Pointpos(20, 10))
+    key = sl.keys[0]
+    sl.remove_nearest(Pointpos(15, 10), None)
+    assert sl.lines == [[]]
+    placeholder = sl.keys[0]
+    assert sl.undo_last() == [(key, [(10, 10), (20, 10)]), (placeholder, None)]
+    assert sl.lines == [[(10, 10), (20, 10)]]
+    sl.undo_last()
+    sl.undo_last()
+    assert sl.lines == [[]]
+    sl.redo()
+    sl.redo()
+    assert sl.lines == [[(10, 10), (20, 10)]]
+    assert sl.redo() == [(key, None), (placeholder, [])]
+    assert sl.lines == [[]] and sl.keys == [placeholder]
+    sl.undo_last()
+    assert sl.lines == [[(10, 10), (20, 10)]] and sl.keys == [key]
+
+
+def test_remove_finished_last_line(create_class, segment_maker):
+    test_file, sl = create_class
+
+    segment_maker(sl, 10, 10, 20, 10)
+    sl.add_point(Pointpos(10, 50))
+    sl.remove_nearest(Pointpos(10, 50), None)  # the line in progress
+    sl.add_point(Pointpos(30, 30))
+    assert sl.lines == [[(10, 10), (20, 10)], [(30, 30)]]  # doesn't extend the finished line
+    sl.undo_last()
+    sl.undo_last()
+    assert sl.lines == [[(10, 10), (20, 10)], [(10, 50)]]
+
+
+def test_positions_follow_keys(tmp_path, segment_maker):
+    fname = str(tmp_path / "stack.tif.annot_txt")
+    sl = SarcomereLines(fname, journal=True)
+
+    def check():
+        assert sl.positions == dict((key, i) for i, key in enumerate(sl.keys))
+
+    for k in range(5):
+        segment_maker(sl, 100 * k, 0, 100 * k, 50)
+    check()
+    sl.remove_line(1)
+    check()
+    sl.undo_last()
+    check()
+    sl.remove_line(len(sl.lines) - 1)  # the line in progress
+    check()
+    sl.undo_last()
+    sl.undo_last()  # the end of the last line
+    check()
+    assert sl.nearest_vertex(Pointpos(302, 48), 5) == (3, 1)
+    sl.select_slice(2)
+    segment_maker(sl, 5, 5, 9, 9)
+    check()
+    sl.select_slice(0)
+    check()
+    sl.close()
+
+    read_in = SarcomereLines(fname, journal=True)  # rebuilt by replaying the journal
+    assert read_in.positions == dict((key, i) for i, key in enumerate(read_in.keys))
+    read_in.close()
+
+
+def test_loaded_index_matches_edits(tmp_path):
+    fname = str(tmp_path / "img.png.annot_txt")
+    sl = SarcomereLines(fname)
+    for line in random_lines(Random(5), 30) + [[(7.0, 7.0)]]:
+        for p in line:
+            sl.add_point(Pointpos(*p))
+        sl.end_line()
+    sl.write_file(fname, (1024, 1024))
+    read_in = SarcomereLines(fname)
+    assert read_in.lines == sl.lines
+    assert read_in.grid.cells == {cell: {(read_in.keys[sl.positions[key]], j) for key, j in bucket}
+                                  for cell, bucket in sl.grid.cells.items()}
+
+
+def test_legacy_frame_is_mapped_to_native(tmp_path):
+    fname = str(tmp_path / "wide.png.annot_txt")
+    # the image was fitted into the 2048 wide square, 2.048 fold and centred with 512 above and below
+    for header in ((2048, 2048), (4096, 4096), (1024.0, 1024.0)):  # the zoomed size of the square was written
+        write_annotation(fname, [[(0, 512), (1024, 1024), (2048, 1536)]], image_size=header,
+                         slices={"2": [[(1024, 1024)]]})
+        sl = SarcomereLines(fname, native_size=(1000, 500))
+        assert sl.lines == [[(0.0, 0.0), (500.0, 250.0), (1000.0, 500.0)], []]
+        sl.select_slice(2)
+        assert sl.lines == [[(500.0, 250.0)], []]
+    write_annotation(fname, [[(10, 20)]], image_size=(1000, 500))
+    assert SarcomereLines(fname, native_size=(1000, 500)).lines == [[(10, 20)], []]
+    write_annotation(fname, [[(10, 20)]], image_size=(2000, 1000))  # another size is just scaled
+    assert SarcomereLines(fname, native_size=(1000, 500)).lines == [[(5, 10)], []]
@@ -0,0 +1,65 @@
+import math
+from random import Random
+
+import numpy as np
+
+from ..SegmentGrid import SegmentGrid, point_segment_dist
+
+
+def brute_nearest(segments, p):
+    return min(segments, key=lambda sid: (point_segment_dist(p, *segments[sid]), sid))
+
+
+def test_point_segment_dist():
+    assert point_segment_dist((5, 3), (0, 0), (10, 0)) == 3.0
+    assert point_segment_dist((13, 4), (0, 0), (10, 0)) == 5.0
+    assert point_segment_dist((3, 4), (0, 0), (0, 0)) == 5.0
+
+
+def test_empty_grid():
+    grid = SegmentGrid()
+    assert grid.nearest((10, 10)) == (None, math.inf)
+
+
+def test_nearest_matches_brute_force():
+    rng = Random(7)
+    grid = SegmentGrid(cell_size=16)
+    segments = {}
+    for i in range(300):
+        a = (rng.uniform(0, 1024), rng.uniform(0, 1024))
+        b = (a[0] + rng.uniform(-200, 200), a[1] + rng.uniform(-200, 200))
+        segments[(i, 0)] = (a, b)
+        grid.insert((i, 0), a, b)
+    for i in range(0, 300, 3):
+        grid.remove((i, 0))
+        del segments[(i, 0)]
+    for _ in range(200):
+        p = (rng.uniform(-100, 1124), rng.uniform(-100, 1124))
+        sid, d = grid.nearest(p)
+        assert sid == brute_nearest(segments, p)
+        assert math.isclose(d, point_segment_dist(p, *segments[sid]))
+
+
+def test_query_rect():
+    grid = SegmentGrid(cell_size=10)
+    grid.insert((1, 0), (0, 0), (100, 0))
+    grid.insert((2, 0), (500, 500), (510, 510))
+    assert grid.query_rect(40, -5, 60, 5) == {(1, 0)}
+    assert grid.query_rect(-1000, -1000, 1000, 1000) == {(1, 0), (2, 0)}
+
+
+def test_insert_many_matches_insert():
+    rng = Random(11)
+    starts = [(rng.uniform(-50, 500), rng.uniform(-50, 500)) for _ in range(400)]
+    ends = [(x + rng.uniform(-90, 90), y + rng.uniform(-90, 90)) for x, y in starts]
+    ends[:20] = starts[:20]  # single points
+    ends[20:40] = [(x, y + rng.uniform(-90, 90)) for x, y in starts[20:40]]  # vertical
+    ends[40:60] = [(x + rng.uniform(-90, 90), y) for x, y in starts[40:60]]  # horizontal
+    sids = [(i // 10, i % 10) for i in range(len(starts))]
+    one_by_one, bulk = SegmentGrid(cell_size=16), SegmentGrid(cell_size=16)
+    for sid, a, b in zip(sids, starts, ends):
+        one_by_one.insert(sid, a, b)
+    bulk.insert_many(sids, np.array(starts), np.array(ends))
+    assert bulk.cells == one_by_one.cells
+    assert bulk.segments == one_by_one.segments
+    assert bulk.bounds == one_by_one.bounds
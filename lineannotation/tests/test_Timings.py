@@ -0,0 +1,48 @@
+import csv
+import json
+from ..Timings import Timings, percentile
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 99) == 7
+
+
+def test_disabled_records_nothing():
+    timings = Timings()
+
+    @timings.timed("op")
+    def op(x):
+        return 2 * x
+
+    assert op(2) == 4
+    assert timings.summary() == {}
+
+
+def test_summary_and_export(tmp_path):
+    timings = Timings(max_samples=10)
+    timings.enabled = True
+
+    @timings.timed("op")
+    def op():
+        pass
+
+    for _ in range(20):
+        op()
+    for ms in range(1, 11):
+        timings.add("frame", ms / 1000.0)
+    summary = timings.summary()
+    assert summary["op"]["count"] == 20
+    assert summary["frame"]["p50"] == 0.005 and summary["frame"]["max"] == 0.01
+
+    timings.export(str(tmp_path / "trace.json"))
+    with open(str(tmp_path / "trace.json")) as fp:
+        trace = json.load(fp)
+    assert len(trace["events"]) == 30 and trace["summary"]["frame"]["count"] == 10
+    timings.export(str(tmp_path / "trace.csv"))
+    with open(str(tmp_path / "trace.csv"), newline='') as fp:
+        rows = list(csv.DictReader(fp))
+    assert len(rows) == 30 and rows[-1]["name"] == "frame"
@@ -0,0 +1,129 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# kivy must be configured before it is first imported, it runs headless on its mock GL backend as in
+# benchmarks/bench.py, so these tests check the drawing instructions that are built, not what the GPU shows
+for key, value in (("KIVY_NO_ARGS", "1"), ("KIVY_NO_CONSOLELOG", "1"), ("KIVY_GL_BACKEND", "mock"),
+                   ("KIVY_WINDOW", "sdl2"), ("SDL_VIDEODRIVER", "offscreen")):
+    os.environ.setdefault(key, value)
+pytest.importorskip("kivy")
+from kivy.clock import Clock  # noqa: E402
+from kivy.core.window import Window  # noqa: E402, a window is needed for the graphics instructions
+
+if Window is None:
+    pytest.skip("no window can be made", allow_module_level=True)
+
+from .helper_classes import write_annotation  # noqa: E402
+from ..AnnotationFile import annotation_name  # noqa: E402
+from ..ContrastLayer import ContrastLayer, bin_texture  # noqa: E402
+from ..ContrastWindow import LUT_WIDTH, contrast_window  # noqa: E402
+from ..ImagePyramid import ImagePyramid  # noqa: E402
+from ..LineGroup import LineGroup, line_width  # noqa: E402
+from ..Picture import Picture  # noqa: E402
+from ..TileLayer import TileLayer  # noqa: E402
+
+LINES = [[(20, 20), (40, 30), (60, 20)], [(150, 150), (180, 160)], []]
+
+
+class Touch(object):
+    def __init__(self, x, y, uid=1):
+        self.pos = (x, y)
+        self.uid = uid
+
+
+@pytest.fixture
+def picture(tmp_path):
+    fname = str(tmp_path / "image.png")
+    Image.fromarray(np.zeros((200, 200), dtype=np.uint8)).save(fname)
+    write_annotation(annotation_name(fname), LINES, image_size=(200, 200))
+    pic = Picture(source=fname, size=(200, 200), size_hint=(None, None), native_size=(200, 200))
+    yield pic
+    pic.close()
+
+
+def shown_points(pic):
+    """
+    :return: the points of the Line of each line on the canvas, by the key of the line
+    """
+    return dict((key, list(pic.groups[key].line.points)) for key in pic.shown)
+
+
+def test_line_group_follows_its_line():
+    group = LineGroup([(10, 10), (20, 30)], 4, 2)
+    group.add_vertex((40, 40))
+    group.move_vertex(0, (0, 6))
+    assert list(group.line.points) == [0, 6, 20, 30, 40, 40]
+    assert [tuple(e.pos) for e in group.ellipses] == [(-2, 4), (18, 28), (38, 38)]
+    group.set_scale_factor(2.0)
+    assert group.line.width == pytest.approx(line_width(2, 2.0))
+    assert [tuple(e.pos) for e in group.ellipses][0] == (-1, 5)
+    assert tuple(group.ellipses[0].size) == (2, 2)
+
+
+def test_lines_out_of_view_are_culled(picture):
+    keys = picture.keep_points.keys
+    assert set(picture.shown) == set(keys)
+    picture.cull((0, 0, 100, 100))
+    assert picture.shown == {keys[0], keys[-1]}
+    picture.cull(None)
+    assert set(picture.shown) == set(keys)
+
+
+def test_zoom_only_changes_the_scale(picture):
+    before = shown_points(picture)
+    picture.set_scale_factor(2.0)
+    assert (picture.zoom.x, picture.zoom.y) == (2.0, 2.0)
+    assert shown_points(picture) == before  # the lines stay in native coordinates
+    key = picture.keep_points.keys[0]
+    assert picture.groups[key].line.width == pytest.approx(line_width(picture.lw, 2.0))
+    assert picture.keep_points.map_point(Touch(80, 60)) == (40, 30)
+
+
+def test_drag_moves_a_vertex(picture):
+    picture.set_scale_factor(2.0)
+    picture.toggle_modify()
+    picture.on_touch_down(Touch(81, 61))  # near (40, 30) on the zoomed picture
+    picture.on_touch_move(Touch(90, 70))
+    picture.on_touch_up(Touch(100, 80))
+    key = picture.keep_points.keys[0]
+    assert picture.keep_points.lines[0] == [(20, 20), (50, 40), (60, 20)]
+    assert list(picture.groups[key].line.points) == [20, 20, 50, 40, 60, 20]
+    picture.undo_last()
+    assert picture.keep_points.lines[0] == LINES[0]
+    assert list(picture.groups[key].line.points) == [20, 20, 40, 30, 60, 20]
+
+
+def test_tiles_out_of_view_are_culled(tmp_path):
+    fname = str(tmp_path / "big.npy")
+    np.save(fname, (np.arange(1000 * 1500) % 251).astype(np.uint8).reshape(1000, 1500))
+    pyramid = ImagePyramid(fname, tile_size=256)
+    layer = TileLayer(pyramid)
+    try:
+        for rect in ((0, 0, 300, 300), (1200, 700, 1500, 1000)):
+            layer.update(rect, 1.0)
+            deadline = time.time() + 10
+            while set(layer.rects) != layer.wanted and time.time() < deadline:
+                time.sleep(0.01)
+                Clock.tick()  # the decoded tiles are shown on the main thread
+            assert set(layer.rects) == set(pyramid.tiles_in_view(0, rect))
+    finally:
+        pyramid.close()
+
+
+def test_contrast_layer_uploads_only_the_table():
+    data = (np.arange(60 * 40) * 20).astype(np.uint16).reshape(40, 60)
+    contrast = contrast_window(data)
+    layer = ContrastLayer(contrast)
+    rows = contrast.lut_rows().shape[0]
+    assert tuple(layer.lut.size) == (LUT_WIDTH, rows)
+    texture = bin_texture(contrast, data)
+    assert tuple(texture.size) == (60, 40)
+    assert bin_texture(contrast, data, texture) is texture
+    lut = layer.lut
+    contrast.set_window(contrast.level, contrast.window / 2)
+    layer.set_contrast(contrast)
+    assert layer.lut is lut
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+CHECK = """
+import sys
+sys.argv = ["line_annot", "--help"]
+import lineannotation.AnnotationCache, lineannotation.AnnotationFile, lineannotation.SarcomereLines
+import lineannotation.SarcomereAnalysis, lineannotation.bin.line_batch, lineannotation.bin.line_annot
+try:
+    lineannotation.bin.line_annot.main()
+except SystemExit:
+    pass
+assert not [name for name in sys.modules if name.split('.')[0] == 'kivy'], 'kivy was imported'
+"""
+
+
+def test_core_does_not_import_kivy():
+    # in a fresh interpreter, test_gui imports kivy into this one
+    result = subprocess.run([sys.executable, "-c", CHECK], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)  # capture_output and text need python 3.7
+    assert result.returncode == 0, result.stderr
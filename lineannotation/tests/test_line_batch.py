@@ -0,0 +1,62 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from .helper_classes import write_annotation
+from ..bin import line_batch
+
+
+def read_rows(output):
+    with open(output, newline='') as fp:
+        return list(csv.DictReader(fp))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    rows, cols = np.mgrid[0:200, 0:200]
+    image = (100 + 50 * np.cos(2 * np.pi * (cols + 0.5) / 8.0)).astype(np.uint8)
+    for name in ("a.npy", "b.npy"):
+        np.save(str(tmp_path / name), image)
+        write_annotation(str(tmp_path / (name + ".annot_txt")), [[[20, 100], [180, 100]], []], (200, 200))
+    with open(str(tmp_path / "broken.npy.annot_txt"), "w") as fp:
+        fp.write("{}")
+    np.save(str(tmp_path / "broken.npy"), image)
+    with open(str(tmp_path / "orphan.png.annot_txt"), "w") as fp:
+        fp.write("{}")
+    return tmp_path
+
+
+def test_batch_and_resume(run_script, folder):
+    output = str(folder / "out.csv")
+    assert run_script(line_batch, folder, "-o", output, "-j", "2") == 1  # broken.npy fails
+    rows = read_rows(output)
+    assert sorted(os.path.basename(r["image"]) for r in rows) == ["a.npy", "b.npy"]
+    assert all(abs(float(r["spacing"]) - 8.0) < 0.2 for r in rows)
+
+    # only the changed annotation is analyzed again
+    annotation = str(folder / "a.npy.annot_txt")
+    write_annotation(annotation, [[[20, 50], [180, 50]], [[20, 150], [180, 150]]], (200, 200))
+    os.utime(annotation, (0, 12345))
+    os.remove(str(folder / "broken.npy.annot_txt"))
+    assert run_script(line_batch, folder, "-o", output, "-j", "1") == 0
+    rows = read_rows(output)
+    assert sorted((os.path.basename(r["image"]), r["line"]) for r in rows) == [
+        ("a.npy", "0"), ("a.npy", "1"), ("b.npy", "0")]
+
+
+def test_change_within_a_microsecond_is_redone(run_script, folder):
+    os.remove(str(folder / "broken.npy.annot_txt"))
+    output = str(folder / "out.csv")
+    annotation = str(folder / "a.npy.annot_txt")
+    t = 1700000000 * 10 ** 9 + 1
+    os.utime(annotation, ns=(t, t))
+    assert run_script(line_batch, folder, "-o", output, "-j", "1") == 0
+    write_annotation(annotation, [[[20, 50], [180, 50]], [[20, 150], [180, 150]]], (200, 200))
+    os.utime(annotation, ns=(t + 2, t + 2))  # the same float seconds
+    if os.stat(annotation).st_mtime_ns != t + 2:
+        pytest.skip("the file system doesn't keep nanosecond times")
+    assert run_script(line_batch, folder, "-o", output, "-j", "1") == 0
+    rows = read_rows(output)
+    assert sorted(r["line"] for r in rows if r["image"].endswith("a.npy")) == ["0", "1"]
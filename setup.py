@@ -11,7 +11,7 @@ with open('README.rst') as readme_file:
 with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
-requirements = ['kivy==1.10.1']
+requirements = ['kivy==1.10.1', 'numpy', 'Pillow', 'tifffile']
 
 setup_requirements = ['pytest-runner', ]
 
@@ -32,7 +32,11 @@ setup(
                 "distribution of Sarcomere Lengths",
     entry_points={
         'console_scripts': [
-            'line_annot=lineannotation.bin.line_annot:main'
+            'line_annot=lineannotation.bin.line_annot:main',
+            'line_batch=lineannotation.bin.line_batch:main',
+            'line_store=lineannotation.bin.line_store:main',
+            'line_export=lineannotation.bin.line_export:main',
+            'line_masks=lineannotation.bin.line_masks:main',
         ],
     },
     install_requires=requirements,